@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kush.settings')
+# No persistent database connections under ASGI (see DATABASES in settings)
+os.environ['KUSH_ASGI'] = '1'
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,20 +42,33 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Times everything below it and adds Server-Timing (store/metrics.py)
+    'store.metrics.MetricsMiddleware',
+    # Sees every response last but one: minifies HTML and gzips
+    # (store/compression.py)
+    'store.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Django's session/auth/message middleware, skipped on public pages
+    # (store/middleware.py)
+    'store.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'store.middleware.AuthenticationMiddleware',
+    'store.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Only these URL prefixes load sessions, users and messages; every other page
+# takes the lean path in store/middleware.py
+STORE_LEAN_PUBLIC_PAGES = True
+STORE_SESSION_PATHS = ['/manager/', '/admin/']
+
 ROOT_URLCONF = 'kush.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that counts render time per request (store/metrics.py)
+        'BACKEND': 'store.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,13 +87,85 @@ WSGI_APPLICATION = 'kush.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Both aliases open the same SQLite file; writes go to 'default', reads to
+# the query-only 'reader' (see store/db.py). Connections are configured once,
+# at connect time.
+#
+# Under WSGI each worker thread keeps its connections open between requests
+# (CONN_MAX_AGE). Under ASGI the ORM runs on sync_to_async threads that are
+# not tied to a request, so a persistent connection is never closed at the
+# end of one and piles up; Django's docs say to disable them there.
+# kush/asgi.py sets KUSH_ASGI before the settings are loaded.
+CONN_MAX_AGE = 0 if os.environ.get('KUSH_ASGI') else 600
+
+SQLITE_PRAGMAS = ';'.join([
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -20000',  # KiB
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 134217728',
+])
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            # Seconds to wait for the write lock before "database is locked"
+            'timeout': 20,
+            # Take the write lock at BEGIN so writers queue instead of deadlocking
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # File-backed test database: the in-memory default uses shared-cache
+        # table locks, which fail concurrent-write tests instead of waiting.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    'reader': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS + ';PRAGMA query_only = ON',
+            'timeout': 20,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['store.db.ReadWriteRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Public pages and fragments are cached with versioned keys (store/cache.py).
+# The cache must be shared by every worker process: a version bump in one
+# worker has to reach the others, or they keep serving the old page and ETag.
+# Files on disk do that for workers on one host; use Redis or memcached when
+# the site runs on several hosts. LocMemCache is only safe with one process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
     }
 }
 
+# Seconds a cached public page or fragment may be served (0 disables page caching)
+STORE_CACHE_TIMEOUT = 600
+
+# max-age sent with anonymous public pages so browsers and a reverse proxy can
+# reuse them; they revalidate with ETag/Last-Modified after that (store/conditional.py)
+STORE_PUBLIC_MAX_AGE = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -116,12 +202,98 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies plus .gz siblings (see store/assets.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'store.assets.CompressedManifestStaticFilesStorage'},
+}
+
+# Let Django serve STATIC_ROOT when DEBUG is off and no web server sits in
+# front of it. Hashed files are cached for a year; plain names for this long.
+STORE_SERVE_STATIC = True
+STORE_STATIC_MAX_AGE = 60 * 60
 
 # Media files (uploads)
 # Serve user-uploaded files from /media/ in development. Ensure MEDIA_ROOT exists.
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media is served by store.media.serve with ETag/Range support. Set the
+# offload mode to 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache) so the
+# web server streams the file and the worker returns immediately.
+STORE_MEDIA_OFFLOAD = None
+STORE_MEDIA_ACCEL_PREFIX = '/protected-media/'
+STORE_MEDIA_MAX_AGE = 24 * 60 * 60
+
+# Limits enforced while manager image uploads stream in (see store/uploads.py)
+STORE_UPLOAD_MAX_FILE_SIZE = 15 * 1024 * 1024
+STORE_UPLOAD_MAX_REQUEST_SIZE = 40 * 1024 * 1024
+
+# Likes are buffered per process and written in batches every N seconds
+# (see store/likes.py). Set to 0 to write each like immediately.
+STORE_LIKE_FLUSH_INTERVAL = 2.0
+
+# Per-IP limits on the anonymous write endpoints, kept in the cache (see
+# store/ratelimit.py). 'rate' is a sliding window; 'dedupe' refuses the same
+# request from the same IP for that many seconds (one rating per IP, one like
+# per item, no identical reviews or messages). Remove a key to disable it.
+STORE_RATE_LIMITS = {
+    'like': {'rate': '30/m', 'dedupe': 60 * 60},
+    'rating': {'rate': '5/h', 'dedupe': 24 * 60 * 60},
+    'review': {'rate': '5/h', 'dedupe': 24 * 60 * 60},
+    'message': {'rate': '5/h', 'dedupe': 60 * 60},
+}
+
+# Proxies whose X-Forwarded-For header is believed when finding the client IP
+STORE_TRUSTED_PROXIES = ['127.0.0.1', '::1']
+
+# Strip template indentation and comments from HTML responses
+STORE_MINIFY_HTML = True
+
+# Per-request DB/template timings and per-view latency histograms, shown at
+# /manager/metrics/ (store/metrics.py). STORE_SERVER_TIMING also sends them to
+# the browser as a Server-Timing header, with DEBUG on or to staff only.
+# STORE_METRICS_TOKEN, if set, lets a Prometheus scraper in with
+# "Authorization: Bearer <token>".
+STORE_METRICS = True
+STORE_SERVER_TIMING = True
+STORE_METRICS_WINDOW = 1000
+STORE_METRICS_TOKEN = ''
+
+# Queries slower than this many milliseconds are logged with their query plan
+# to STORE_SLOW_QUERY_LOG, one JSON object per line (store/slowqueries.py);
+# `manage.py slow_queries` summarises the file. None turns the log off.
+STORE_SLOW_QUERY_MS = 50
+STORE_SLOW_QUERY_LOG = BASE_DIR / 'slow_queries.log'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            # Reopens the file after logrotate moves it; created on first use
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': STORE_SLOW_QUERY_LOG,
+            'formatter': 'message',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'store.slowqueries': {'handlers': ['slow_queries'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Clothes rendered per landing-page category rail; the rest load on scroll
+STORE_RAIL_SIZE = 8
+
+# Inventory rows per page on the manager dashboard
+STORE_DASHBOARD_PAGE_SIZE = 50
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -134,3 +306,12 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = ''
 EMAIL_HOST_PASSWORD = ''
 
+# Outgoing mail is queued and sent by `manage.py send_outbox` (store/outbox.py).
+# Failed messages are retried after STORE_OUTBOX_RETRY_DELAY seconds, doubling
+# up to STORE_OUTBOX_MAX_DELAY, and given up on after STORE_OUTBOX_MAX_ATTEMPTS.
+# Time the mail server is unreachable does not count against the attempts.
+STORE_OUTBOX_BATCH_SIZE = 50
+STORE_OUTBOX_MAX_ATTEMPTS = 8
+STORE_OUTBOX_RETRY_DELAY = 60
+STORE_OUTBOX_MAX_DELAY = 6 * 60 * 60
+
@@ -14,16 +14,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from store import assets, media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('store.urls')),
+    # Uploads, in development and production (see store/media.py)
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve),
 ]
 
-if settings.DEBUG:
-    # Serve media files during development
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if not settings.DEBUG and settings.STORE_SERVE_STATIC:
+    # Collected, hashed and pre-compressed assets (see store/assets.py)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), assets.serve),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Category, Cloth, ManagerProfile, SiteRating, SiteReview
+from .models import Category, Cloth, ManagerProfile, OutgoingEmail, SiteRating, SiteRatingSummary, SiteReview
+from .outbox import requeue_dead
+from .search import fts_available, search_ids
 
 # Register Category
 @admin.register(Category)
@@ -16,6 +18,13 @@ class ClothAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     # only staff users will be selectable as manager
     raw_id_fields = ('manager',)
+    readonly_fields = ('sku',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the FTS index instead of an unindexed LIKE '%term%' scan
+        if not search_term or not fts_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search_ids(search_term, limit=1000)), False
 
 
 # Register ManagerProfile
@@ -34,6 +43,21 @@ class SiteRatingAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
 
 
+# Register SiteRatingSummary (maintained automatically - read only)
+@admin.register(SiteRatingSummary)
+class SiteRatingSummaryAdmin(admin.ModelAdmin):
+    list_display = ('count', 'average', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # Register SiteReview
 @admin.register(SiteReview)
 class SiteReviewAdmin(admin.ModelAdmin):
@@ -42,3 +66,18 @@ class SiteReviewAdmin(admin.ModelAdmin):
     search_fields = ('name', 'contact', 'review_text')
     readonly_fields = ('created_at',)
     list_editable = ('is_approved',)
+
+
+# Register OutgoingEmail (written by the site, sent by manage.py send_outbox)
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'body')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry']
+
+    @admin.action(description="Retry selected failed emails")
+    def retry(self, request, queryset):
+        count = requeue_dead(queryset)
+        self.message_user(request, f"{count} email(s) queued again.")
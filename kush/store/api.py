@@ -0,0 +1,223 @@
+"""
+Read-only JSON catalogue API.
+
+    GET /api/categories/
+    GET /api/clothes/?category=<slug>&status=available&fields=id,name,images&limit=24&cursor=...
+    GET /api/clothes/<id>/?fields=...
+    GET /api/search/?q=red+dre&fields=...&limit=24&offset=0
+
+Cloth lists use keyset pagination on (created_at, id), newest first: the
+``next`` value in a response is an opaque cursor for the following page, so
+every page costs one indexed range scan however deep the client pages. Use
+``fields`` to ask for only the attributes you need; only those columns are
+read from the database. Search results come back best match first and are
+paged by offset, since rank order has no stable key.
+"""
+import base64
+import binascii
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+
+from .cache import cache_public_page
+from .conditional import catalogue_last_modified, cloth_last_modified, conditional_page
+from .images import IMAGE_FIELDS
+from .models import Category, Cloth
+from .search import search_clothes
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# field name -> model columns it needs
+CLOTH_FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'price': ['price'],
+    'status': ['status'],
+    'description': ['description'],
+    'likes': ['likes'],
+    'category': ['category__slug', 'category__name'],
+    'images': [*IMAGE_FIELDS, 'image_derivatives'],
+    'created_at': ['created_at'],
+    'updated_at': ['updated_at'],
+}
+DEFAULT_LIST_FIELDS = ('id', 'name', 'price', 'status', 'category', 'likes', 'images')
+
+
+class ApiError(Exception):
+    pass
+
+
+def _requested_fields(request, default):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = sorted(set(fields) - set(CLOTH_FIELDS))
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _cloth_queryset(fields):
+    columns = {'id', 'created_at'}  # always needed for cursors
+    for field in fields:
+        columns.update(CLOTH_FIELDS[field])
+    queryset = Cloth.objects.only(*columns)
+    if 'category' in fields:
+        queryset = queryset.select_related('category')
+    return queryset
+
+
+def _images(cloth):
+    images = {}
+    for field_name in IMAGE_FIELDS:
+        image = getattr(cloth, field_name)
+        if not image:
+            continue
+        variants = (cloth.image_derivatives or {}).get(field_name, {})
+        images[field_name.removeprefix('image_')] = {
+            'original': image.url,
+            **{key: variants[key] for key in ('width', 'height', 'color') if key in variants},
+            **{
+                ext: {width: default_storage.url(name) for width, name in variants.get(ext, {}).items()}
+                for ext in ('webp', 'jpeg') if variants.get(ext)
+            },
+        }
+    return images
+
+
+def serialize_cloth(cloth, fields):
+    data = {}
+    for field in fields:
+        if field == 'category':
+            data['category'] = {'slug': cloth.category.slug, 'name': cloth.category.name}
+        elif field == 'images':
+            data['images'] = _images(cloth)
+        elif field == 'price':
+            data['price'] = str(cloth.price)
+        elif field in ('created_at', 'updated_at'):
+            data[field] = getattr(cloth, field).isoformat()
+        else:
+            data[field] = getattr(cloth, field)
+    return data
+
+
+def _int_param(request, name, default, minimum, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise ApiError(f"{name} must be an integer")
+    return min(max(value, minimum), maximum)
+
+
+def encode_cursor(cloth):
+    raw = f'{cloth.created_at.isoformat()}|{cloth.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, cloth_id = raw.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError
+        return created_at, int(cloth_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ApiError("Invalid cursor")
+
+
+def api_view(view):
+    """Turn ApiError into a 400 JSON response."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return wrapper
+
+
+@require_GET
+@conditional_page('catalogue', last_modified=catalogue_last_modified)
+@cache_public_page('catalogue')
+def category_list(request):
+    """All categories with their item counts."""
+    categories = Category.objects.annotate(item_count=Count('clothes')).order_by('name')
+    return JsonResponse({'results': [
+        {
+            'id': category.id,
+            'name': category.name,
+            'slug': category.slug,
+            'description': category.description,
+            'item_count': category.item_count,
+        }
+        for category in categories
+    ]})
+
+
+@require_GET
+@conditional_page('catalogue', last_modified=catalogue_last_modified)
+@cache_public_page('catalogue')
+@api_view
+def cloth_list(request):
+    """One page of clothes, newest first, optionally filtered by category/status."""
+    fields = _requested_fields(request, DEFAULT_LIST_FIELDS)
+    limit = _int_param(request, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+
+    clothes = _cloth_queryset(fields).order_by('-created_at', '-id')
+    if request.GET.get('category'):
+        clothes = clothes.filter(category__slug=request.GET['category'])
+    status = request.GET.get('status')
+    if status:
+        if status not in dict(Cloth.STATUS_CHOICES):
+            raise ApiError("status must be 'available' or 'sold'")
+        clothes = clothes.filter(status=status)
+    if request.GET.get('cursor'):
+        created_at, cloth_id = decode_cursor(request.GET['cursor'])
+        clothes = clothes.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=cloth_id))
+
+    page = list(clothes[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    return JsonResponse({
+        'results': [serialize_cloth(cloth, fields) for cloth in page],
+        'next': encode_cursor(page[-1]) if has_more else None,
+    })
+
+
+@require_GET
+@conditional_page('clothes', 'cloth:{cloth_id}', last_modified=cloth_last_modified)
+@cache_public_page('clothes', 'cloth:{cloth_id}')
+@api_view
+def cloth_detail(request, cloth_id):
+    """A single cloth with all (or the requested) fields."""
+    fields = _requested_fields(request, CLOTH_FIELDS)
+    cloth = get_object_or_404(_cloth_queryset(fields), pk=cloth_id)
+    return JsonResponse(serialize_cloth(cloth, fields))
+
+
+@require_GET
+@conditional_page('catalogue', last_modified=catalogue_last_modified)
+@cache_public_page('catalogue')
+@api_view
+def search(request):
+    """Clothes matching ``q``, best match first."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        raise ApiError("q is required")
+    fields = _requested_fields(request, DEFAULT_LIST_FIELDS)
+    limit = _int_param(request, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+    offset = _int_param(request, 'offset', 0, 0, 10_000)
+
+    page = search_clothes(query, limit + 1, offset, queryset=_cloth_queryset(fields))
+    return JsonResponse({
+        'results': [serialize_cloth(cloth, fields) for cloth in page[:limit]],
+        'next_offset': offset + limit if len(page) > limit else None,
+    })
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .metrics import install_query_timer
+        from .slowqueries import install_slow_query_log
+
+        connection_created.connect(install_query_timer, dispatch_uid='store_query_timer')
+        connection_created.connect(install_slow_query_log, dispatch_uid='store_slow_query_log')
@@ -0,0 +1,130 @@
+"""
+Static asset pipeline: content-hashed names, gzip siblings, long-lived caching.
+
+``collectstatic`` copies every asset to ``STATIC_ROOT`` under a name that
+contains a hash of its contents (``store/style.3f2a9c81b0de.css``) and
+records the mapping in ``staticfiles.json``; ``{% static %}`` then emits
+the hashed URL, so a changed file always gets a new URL and nobody has to
+bump ``?v=`` numbers. Text assets also get a pre-compressed ``.gz`` sibling
+at that point, so nothing is compressed per request.
+
+``serve`` is for deployments where Django serves ``/static/`` itself (see
+``STORE_SERVE_STATIC``). It sends the ``.gz`` variant to clients that accept
+gzip and marks hashed files ``immutable`` for a year, so repeat visitors
+never re-download or even revalidate CSS and JS. Files requested by their
+plain name get a short ``max-age`` because their contents can change.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from .compression import accepts_gzip
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml')
+
+# Keep a .gz only if it saves at least this fraction of the original size
+MIN_COMPRESSION_GAIN = 0.05
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+DEFAULT_STATIC_MAX_AGE = 60 * 60
+
+# store/style.3f2a9c81b0de.css -> store/style + .css
+HASHED_NAME_RE = re.compile(r'^(?P<base>.+)\.[0-9a-f]{12}(?P<ext>\.[^./]+)?$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes ``.gz`` siblings during collectstatic.
+
+    Assets that have not been collected (tests, a fresh checkout) and CSS
+    ``url()`` references to files that do not exist keep their plain name
+    instead of raising, so a missing image never breaks a page or a deploy.
+    """
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if dry_run or isinstance(processed, Exception):
+                continue
+            for compressed in {name, hashed_name}:
+                if compressed and self.compress(compressed):
+                    yield compressed, compressed + '.gz', True
+
+    def compress(self, name):
+        """Write ``name.gz`` next to `name`; returns whether it was worth keeping."""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return False
+        with self.open(name) as f:
+            original = f.read()
+        # mtime=0 keeps the output identical between deploys
+        compressed = gzip.compress(original, compresslevel=9, mtime=0)
+        if self.exists(name + '.gz'):
+            self.delete(name + '.gz')
+        if len(compressed) > len(original) * (1 - MIN_COMPRESSION_GAIN):
+            return False
+        with open(self.path(name + '.gz'), 'wb') as f:
+            f.write(compressed)
+        return True
+
+
+def is_hashed(name):
+    """Whether `name` is the content-hashed copy of a collected file."""
+    match = HASHED_NAME_RE.match(name)
+    if not match:
+        return False
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    return hashed_files.get(match['base'] + (match['ext'] or '')) == name
+
+
+@require_safe
+def serve(request, path):
+    """Serve a file from STATIC_ROOT, preferring its .gz sibling."""
+    path = path.lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except Exception:  # SuspiciousFileOperation for ../ and absolute paths
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    gzipped = fullpath + '.gz'
+    has_gzip = path.endswith(COMPRESSIBLE_EXTENSIONS) and os.path.isfile(gzipped)
+    send = gzipped if has_gzip and accepts_gzip(request) else fullpath
+
+    stat = os.stat(send)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(fullpath)
+        response = FileResponse(open(send, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if send == gzipped:
+            response['Content-Encoding'] = 'gzip'
+
+    if has_gzip:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    if is_hashed(path):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        max_age = getattr(settings, 'STORE_STATIC_MAX_AGE', DEFAULT_STATIC_MAX_AGE)
+        response['Cache-Control'] = f'public, max-age={max_age}'
+    return response
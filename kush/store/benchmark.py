@@ -0,0 +1,729 @@
+"""
+Benchmark harness for the store views.
+
+``manage.py seed_catalogue`` fills the database with a synthetic catalogue
+owned by ``bench-manager-*`` users; ``manage.py benchmark`` then requests
+every route in ``store/urls.py`` (reads and writes) and records per route:
+
+    latency      p50 / p95 / p99 / mean / max, in milliseconds
+    queries      database queries per request
+    bytes        response body size
+    peak_memory  peak Python allocation during one request (tracemalloc)
+
+Routes are exercised in process through the Django test client and, with
+``--mode wsgi``, over HTTP against the WSGI application served from a local
+thread. Results are written as JSON so two runs can be compared with
+``--compare``. Run it against a copy of the database: write routes add
+ratings, reviews and likes.
+
+``--burst N`` measures something else: N requests to the anonymous write
+endpoints that all arrive at once. Under ``wsgi`` a fixed pool of worker
+threads (``--threads``) works through them. Under ``asgi`` the async views
+run on one event loop, with up to ``--concurrency`` requests in flight.
+Latency is counted from the start of the burst, so it includes queueing,
+which is what a client in the burst actually sees.
+
+``--transfer`` reports the bytes on the wire for each anonymous page: as
+rendered, after HTML minification, and minified and gzipped.
+
+``--middleware`` times public pages with the full middleware stack and with
+the lean, session-free path (store/middleware.py).
+"""
+import asyncio
+import itertools
+import json
+import math
+import platform
+import random
+import sqlite3
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from . import urls
+from .models import Category, Cloth, SiteRating, SiteRatingSummary, SiteReview
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_MANAGER_PREFIX = 'bench-manager-'
+BENCH_CATEGORY_PREFIX = 'Bench '
+# Seeded reviews and ratings are told apart by their (private) IP address
+BENCH_REVIEW_IP_PREFIX = '10.0.'
+BENCH_RATING_IP_PREFIX = '10.1.'
+BATCH_SIZE = 1000
+# Must be in ALLOWED_HOSTS
+BENCH_HOST = 'localhost'
+
+WORDS = (
+    'red blue black white green silk cotton linen denim wool leather summer '
+    'evening casual classic slim long short floral striped vintage dress skirt '
+    'shirt jacket jeans top corset jumpsuit shorts heels'
+).split()
+
+
+# ----- Seeding -----
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def seeded_reviews():
+    return SiteReview.objects.filter(ip_address__startswith=BENCH_REVIEW_IP_PREFIX)
+
+
+def seeded_ratings():
+    return SiteRating.objects.filter(ip_address__startswith=BENCH_RATING_IP_PREFIX)
+
+
+def clear_seeded():
+    """Delete everything seed_catalogue created (and nothing else)."""
+    Cloth.objects.filter(manager__username__startswith=BENCH_MANAGER_PREFIX).delete()
+    Category.objects.filter(name__startswith=BENCH_CATEGORY_PREFIX, clothes__isnull=True).delete()
+    User.objects.filter(username__startswith=BENCH_MANAGER_PREFIX).delete()
+    # Bulk-created without signals, so removed the same way rather than one
+    # signal per row; the summary and the cache are repaired afterwards
+    seeded_reviews()._raw_delete(SiteReview.objects.db)
+    seeded_ratings()._raw_delete(SiteRating.objects.db)
+    SiteRatingSummary.rebuild()
+    cache.clear()
+
+
+def seed_catalogue(categories, clothes, reviews, ratings, managers=3, seed=0):
+    """
+    Create a deterministic synthetic catalogue; returns counts of what was created.
+
+    Rows are inserted with bulk_create, so signals do not run: the rating
+    summary is rebuilt and the page cache cleared at the end. The search
+    index is kept current by its triggers. Seeding again only tops each kind
+    of row up to the requested number.
+    """
+    rng = random.Random(seed)
+    for i in range(User.objects.filter(username__startswith=BENCH_MANAGER_PREFIX).count(), managers):
+        User.objects.create_user(f'{BENCH_MANAGER_PREFIX}{i}', is_staff=True)
+    users = list(User.objects.filter(username__startswith=BENCH_MANAGER_PREFIX).order_by('id'))
+
+    existing = Category.objects.filter(name__startswith=BENCH_CATEGORY_PREFIX).count()
+    Category.objects.bulk_create(
+        Category(name=f'{BENCH_CATEGORY_PREFIX}{i}', slug=f'bench-{i}', description=_sentence(rng, 12))
+        for i in range(existing, categories)
+    )
+    category_ids = list(
+        Category.objects.filter(name__startswith=BENCH_CATEGORY_PREFIX).values_list('id', flat=True)
+    )
+
+    existing = Cloth.objects.filter(manager__username__startswith=BENCH_MANAGER_PREFIX).count()
+    for start in range(existing, clothes, BATCH_SIZE):
+        Cloth.objects.bulk_create([
+            Cloth(
+                name=f'{_sentence(rng, 3).title()} {i}',
+                description=_sentence(rng, 25),
+                price=rng.randrange(5_000, 100_000, 500),
+                status='sold' if rng.random() < 0.3 else 'available',
+                category_id=rng.choice(category_ids),
+                manager=rng.choice(users),
+                likes=rng.randrange(0, 500),
+            )
+            for i in range(start, min(start + BATCH_SIZE, clothes))
+        ])
+
+    for start in range(seeded_reviews().count(), reviews, BATCH_SIZE):
+        SiteReview.objects.bulk_create([
+            SiteReview(
+                name=f'Customer {i}',
+                review_text=_sentence(rng, 30),
+                is_approved=rng.random() < 0.8,
+                ip_address=f'{BENCH_REVIEW_IP_PREFIX}{i // 256 % 256}.{i % 256}',
+            )
+            for i in range(start, min(start + BATCH_SIZE, reviews))
+        ])
+
+    for start in range(seeded_ratings().count(), ratings, BATCH_SIZE):
+        SiteRating.objects.bulk_create([
+            SiteRating(rating=rng.choice((3, 4, 4, 5, 5, 5)),
+                       ip_address=f'{BENCH_RATING_IP_PREFIX}{i // 256 % 256}.{i % 256}')
+            for i in range(start, min(start + BATCH_SIZE, ratings))
+        ])
+
+    SiteRatingSummary.rebuild()
+    cache.clear()
+    return {
+        'managers': len(users),
+        'categories': len(category_ids),
+        'clothes': clothes,
+        'reviews': reviews,
+        'ratings': ratings,
+    }
+
+
+# ----- Routes -----
+
+class Route:
+    """How to request one URL pattern: method, URL kwargs, body/query and login."""
+
+    def __init__(self, name, method='get', kwargs=None, data=None, login=False):
+        self.name = name
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.data = data or {}
+        self.login = login
+
+    def url(self, sample):
+        return reverse(self.name, kwargs={k: sample[v] for k, v in self.kwargs.items()})
+
+    def body(self, sample):
+        """Query/form data; a callable `data` is given the sample values."""
+        return self.data(sample) if callable(self.data) else self.data
+
+
+ROUTES = [
+    Route('landing_page'),
+    Route('about'),
+    Route('category_detail', kwargs={'slug': 'category_slug'}),
+    Route('category_items', kwargs={'slug': 'category_slug'}, data={'after': 0}),
+    Route('search', data={'q': 'silk dress'}),
+    Route('cloth_list'),
+    Route('cloth_detail', kwargs={'cloth_id': 'cloth_id'}),
+    Route('api_category_list'),
+    Route('api_cloth_list', data={'status': 'available'}),
+    Route('api_cloth_detail', kwargs={'cloth_id': 'cloth_id'}),
+    Route('api_search', data={'q': 'silk dress'}),
+    Route('manager_login'),
+    Route('manager_dashboard', login=True),
+    Route('add_cloth', login=True),
+    Route('edit_cloth', kwargs={'cloth_id': 'cloth_id'}, login=True),
+    Route('manager_logout', login=True),
+    Route('manager_metrics', login=True),
+    Route('bulk_update_clothes', method='post', login=True,
+          data=lambda sample: {'action': 'status', 'status': 'available', 'ids': [sample['cloth_id']]}),
+    Route('like_cloth', method='post', kwargs={'cloth_id': 'cloth_id'}),
+    Route('submit_rating', method='post', data={'rating': 5}),
+    Route('submit_review', method='post', data={'name': 'Bench', 'review_text': 'Benchmark review'}),
+    Route('send_message', method='post', data={'name': 'Bench', 'email': 'bench@example.com', 'message': 'Hi'}),
+]
+
+
+def missing_routes():
+    """URL names in store/urls.py that have no Route above."""
+    return sorted({p.name for p in urls.urlpatterns} - {r.name for r in ROUTES})
+
+
+def sample_values():
+    """Ids to plug into URLs: a busy category and a cloth the first bench manager owns."""
+    manager = User.objects.filter(username__startswith=BENCH_MANAGER_PREFIX).order_by('id').first()
+    if manager is None:
+        raise LookupError("No benchmark data; run 'manage.py seed_catalogue' first.")
+    cloth = Cloth.objects.filter(manager=manager).select_related('category').order_by('id').first()
+    if cloth is None:
+        raise LookupError("The benchmark manager owns no clothes; seed with --clothes > 0.")
+    return {'manager': manager, 'cloth_id': cloth.id, 'category_slug': cloth.category.slug}
+
+
+# ----- Measurement -----
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def summarise(latencies, queries, sizes, peak_memory):
+    ms = [t * 1000 for t in latencies]
+    return {
+        'requests': len(ms),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3),
+        'max_ms': round(max(ms), 3),
+        'queries': max(queries),
+        'bytes': max(sizes),
+        'peak_memory': peak_memory,
+    }
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+_client_numbers = itertools.count(1)
+
+
+def client_headers():
+    """
+    A different client IP for every request (forwarded by the local, trusted
+    proxy), so the per-IP rate limits in store/ratelimit.py run without
+    rejecting the benchmark's repeated writes. They come from 172.16.0.0/12,
+    clear of the seeded rows' 10.0.x.x and 10.1.x.x.
+    """
+    n = next(_client_numbers)
+    return {'X-Forwarded-For': f'172.{16 + (n >> 16 & 15)}.{n >> 8 & 255}.{n & 255}'}
+
+
+@contextmanager
+def counting_queries(counter):
+    """Count queries on every alias: reads and writes may use different ones (store/db.py)."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield
+
+
+class InProcessRunner:
+    """Requests through django.test.Client: the full middleware stack, no sockets."""
+
+    mode = 'inprocess'
+
+    def __init__(self, sample):
+        self.sample = sample
+        self.client = Client(HTTP_HOST=BENCH_HOST)
+
+    def prepare(self, route):
+        if route.login:
+            self.client.force_login(self.sample['manager'])
+        else:
+            self.client.logout()
+
+    def request(self, route):
+        """Perform one request; returns (status, bytes, queries)."""
+        counter = _QueryCounter()
+        with counting_queries(counter):
+            response = getattr(self.client, route.method)(
+                route.url(self.sample), route.body(self.sample), headers=client_headers()
+            )
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, len(body), counter.count
+
+    def close(self):
+        pass
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGIRunner:
+    """Requests over HTTP to the WSGI application, served by wsgiref in a thread."""
+
+    mode = 'wsgi'
+
+    def __init__(self, sample):
+        self.sample = sample
+        self.last_queries = 0
+        self.app = get_wsgi_application()
+        self.server = make_server('127.0.0.1', 0, self._counting_app, handler_class=_QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.session_cookie = None
+        self.csrf_token = get_random_string(32)
+
+    def _counting_app(self, environ, start_response):
+        counter = _QueryCounter()
+        with counting_queries(counter):
+            result = self.app(environ, start_response)
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        self.last_queries = counter.count
+        return [body]
+
+    def prepare(self, route):
+        self.session_cookie = None
+        if route.login:
+            client = Client()
+            client.force_login(self.sample['manager'])
+            self.session_cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def request(self, route):
+        host, port = self.server.server_address
+        url = route.url(self.sample)
+        headers = {'Host': BENCH_HOST, **client_headers()}
+        if self.session_cookie:
+            headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}={self.session_cookie}'
+        data = route.body(self.sample)
+        body = None
+        if route.method == 'post':
+            body = urlencode(data, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            # Any matching cookie/header pair passes CsrfViewMiddleware
+            headers['Cookie'] = '; '.join(filter(None, [headers.get('Cookie'), f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}']))
+            headers['X-CSRFToken'] = self.csrf_token
+        elif data:
+            url = f'{url}?{urlencode(data, doseq=True)}'
+
+        conn = HTTPConnection(host, port, timeout=30)
+        try:
+            conn.request(route.method.upper(), url, body=body, headers=headers)
+            response = conn.getresponse()
+            content = response.read()
+        finally:
+            conn.close()
+        return response.status, len(content), self.last_queries
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+RUNNERS = {runner.mode: runner for runner in (InProcessRunner, WSGIRunner)}
+
+
+def measure_route(runner, route, requests, warmup):
+    """Time `requests` requests to `route` after `warmup` untimed ones."""
+    latencies, queries, sizes = [], [], []
+    for i in range(warmup + requests):
+        runner.prepare(route)
+        start = time.perf_counter()
+        status, size, count = runner.request(route)
+        elapsed = time.perf_counter() - start
+        if status >= 400:
+            raise RuntimeError(f"{route.name} returned HTTP {status}")
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(count)
+            sizes.append(size)
+
+    # Memory is measured on a separate request: tracing slows everything down
+    runner.prepare(route)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        runner.request(route)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarise(latencies, queries, sizes, peak)
+
+
+def run_benchmark(modes=('inprocess',), requests=50, warmup=5, routes=None, use_cache=True, progress=None):
+    """Benchmark the selected routes in each mode; returns the JSON-serialisable report."""
+    missing = missing_routes()
+    if missing:
+        raise LookupError(f"No benchmark route for: {', '.join(missing)}")
+    selected = [r for r in ROUTES if routes is None or r.name in routes]
+    sample = sample_values()
+
+    overrides = {'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend'}
+    if not use_cache:
+        overrides['STORE_CACHE_TIMEOUT'] = 0
+
+    results = {}
+    with override_settings(**overrides):
+        cache.clear()
+        for mode in modes:
+            runner = RUNNERS[mode](sample)
+            try:
+                results[mode] = {}
+                for route in selected:
+                    results[mode][route.name] = measure_route(runner, route, requests, warmup)
+                    if progress:
+                        progress(mode, route.name, results[mode][route.name])
+            finally:
+                runner.close()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'requests': requests,
+            'warmup': warmup,
+            'cache': use_cache,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+            'catalogue': {
+                'categories': Category.objects.count(),
+                'clothes': Cloth.objects.count(),
+                'reviews': SiteReview.objects.count(),
+                'ratings': SiteRating.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+# ----- Bursts -----
+
+BURST_ROUTES = ('like_cloth', 'submit_rating')
+
+
+def summarise_burst(outcomes, elapsed):
+    """`outcomes` is a list of (status, seconds since the burst started)."""
+    ms = [t * 1000 for _, t in outcomes]
+    return {
+        'requests': len(outcomes),
+        'errors': sum(1 for status, _ in outcomes if status >= 400),
+        'seconds': round(elapsed, 3),
+        'per_second': round(len(outcomes) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+    }
+
+
+def wsgi_burst(route, sample, total, threads):
+    """`total` requests through the WSGI handler, `threads` at a time."""
+    outcomes = []
+    remaining = itertools.count()
+    start = time.perf_counter()
+
+    def worker():
+        client = Client(HTTP_HOST=BENCH_HOST)
+        try:
+            while next(remaining) < total:
+                response = getattr(client, route.method)(route.url(sample), route.body(sample), headers=client_headers())
+                outcomes.append((response.status_code, time.perf_counter() - start))
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return summarise_burst(outcomes, time.perf_counter() - start)
+
+
+def asgi_burst(route, sample, total, concurrency):
+    """`total` requests through the ASGI handler on one event loop."""
+    async def burst():
+        client = AsyncClient()
+        in_flight = asyncio.Semaphore(concurrency)
+        start = time.perf_counter()
+
+        async def one():
+            async with in_flight:
+                response = await getattr(client, route.method)(
+                    route.url(sample), route.body(sample), headers=client_headers()
+                )
+            return response.status_code, time.perf_counter() - start
+
+        outcomes = await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+        # The async ORM's connection belongs to asgiref's worker thread
+        await sync_to_async(connections.close_all)()
+        return summarise_burst(outcomes, elapsed)
+
+    return asyncio.run(burst())
+
+
+BURST_MODES = ('wsgi', 'asgi')
+
+
+def run_burst(total=1000, modes=BURST_MODES, routes=BURST_ROUTES, threads=4, concurrency=200, progress=None):
+    """Send `total` simultaneous requests to each route in each mode; returns the report."""
+    selected = [r for r in ROUTES if r.name in routes]
+    unknown = set(routes) - {r.name for r in selected}
+    if unknown:
+        raise LookupError(f"No benchmark route for: {', '.join(sorted(unknown))}")
+    sample = sample_values()
+
+    results = {}
+    with override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        # AsyncClient always sends Host: testserver
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+    ):
+        for mode in modes:
+            results[mode] = {}
+            for route in selected:
+                if mode == 'asgi':
+                    result = asgi_burst(route, sample, total, concurrency)
+                else:
+                    result = wsgi_burst(route, sample, total, threads)
+                results[mode][route.name] = result
+                if progress:
+                    progress(mode, route.name, result)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'burst': total,
+            'threads': threads,
+            'concurrency': concurrency,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        },
+        'results': results,
+    }
+
+
+# ----- Bytes on the wire -----
+
+TRANSFER_VARIANTS = (
+    # name, STORE_MINIFY_HTML, Accept-Encoding
+    ('raw', False, ''),
+    ('minified', True, ''),
+    ('gzip', True, 'gzip, deflate, br'),
+)
+
+
+def _body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def measure_transfer(routes=None, progress=None):
+    """
+    Response size of every anonymous GET route as rendered, minified, and
+    minified and gzipped (store/compression.py); returns the report.
+    """
+    selected = [
+        r for r in ROUTES
+        if r.method == 'get' and not r.login and (routes is None or r.name in routes)
+    ]
+    sample = sample_values()
+    client = Client(HTTP_HOST=BENCH_HOST)
+
+    results = {}
+    for route in selected:
+        sizes = {}
+        for variant, minify, accept in TRANSFER_VARIANTS:
+            with override_settings(STORE_MINIFY_HTML=minify):
+                cache.clear()
+                response = client.get(route.url(sample), route.body(sample), HTTP_ACCEPT_ENCODING=accept)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{route.name} returned HTTP {response.status_code}")
+            sizes[variant] = _body_size(response)
+        sizes['saved_pct'] = round((1 - sizes['gzip'] / sizes['raw']) * 100, 1) if sizes['raw'] else 0.0
+        results[route.name] = sizes
+        if progress:
+            progress(route.name, sizes)
+    cache.clear()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'results': {'transfer': results},
+    }
+
+
+# ----- Middleware overhead -----
+
+MIDDLEWARE_ROUTES = ('landing_page', 'about', 'category_detail', 'search')
+MIDDLEWARE_STACKS = ('full', 'lean')
+MIDDLEWARE_VISITORS = ('anonymous', 'signed-in')
+
+
+def measure_middleware(requests=200, warmup=10, routes=MIDDLEWARE_ROUTES, progress=None):
+    """
+    Time public pages with the full middleware stack and with the lean path of
+    store/middleware.py, for a visitor without cookies and for a signed-in
+    manager. Pages are warm in the page cache, so for anonymous visitors
+    what is left is mostly middleware. Returns the report; results are keyed
+    ``'<route> (<visitor>)'`` per stack.
+    """
+    selected = [r for r in ROUTES if r.name in routes]
+    unknown = set(routes) - {r.name for r in selected}
+    if unknown:
+        raise LookupError(f"No benchmark route for: {', '.join(sorted(unknown))}")
+    sample = sample_values()
+
+    results = {}
+    for stack in MIDDLEWARE_STACKS:
+        results[stack] = {}
+        with override_settings(STORE_LEAN_PUBLIC_PAGES=stack == 'lean'):
+            cache.clear()
+            for visitor in MIDDLEWARE_VISITORS:
+                client = Client(HTTP_HOST=BENCH_HOST)
+                if visitor == 'signed-in':
+                    client.force_login(sample['manager'])
+                for route in selected:
+                    url, data = route.url(sample), route.body(sample)
+                    latencies, queries = [], []
+                    for i in range(warmup + requests):
+                        counter = _QueryCounter()
+                        start = time.perf_counter()
+                        with counting_queries(counter):
+                            response = client.get(url, data)
+                        elapsed = time.perf_counter() - start
+                        if response.status_code >= 400:
+                            raise RuntimeError(f"{route.name} returned HTTP {response.status_code}")
+                        if i >= warmup:
+                            latencies.append(elapsed)
+                            queries.append(counter.count)
+                    ms = [t * 1000 for t in latencies]
+                    name = f'{route.name} ({visitor})'
+                    results[stack][name] = {
+                        'requests': len(ms),
+                        'p50_ms': round(percentile(ms, 50), 3),
+                        'p95_ms': round(percentile(ms, 95), 3),
+                        'mean_ms': round(sum(ms) / len(ms), 3),
+                        'queries': max(queries),
+                    }
+                    if progress:
+                        progress(stack, name, results[stack][name])
+    cache.clear()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': requests,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+
+# ----- Comparison -----
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'bytes', 'peak_memory')
+
+
+def compare(baseline, current):
+    """
+    Rows of (mode, route, metric, before, after, change %) for routes in both reports.
+    """
+    rows = []
+    for mode, routes in current['results'].items():
+        for name, metrics in routes.items():
+            before = baseline.get('results', {}).get(mode, {}).get(name)
+            if before is None:
+                continue
+            for metric in COMPARED_METRICS:
+                old, new = before.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                change = (new - old) / old * 100 if old else (0.0 if new == old else float('inf'))
+                rows.append((mode, name, metric, old, new, round(change, 1)))
+    return rows
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,153 @@
+"""
+Versioned caching for the public catalogue pages.
+
+Cached pages and template fragments are keyed on the current version of
+every namespace they depend on:
+
+    catalogue         any Cloth or Category change (landing page rails)
+    category:<slug>   clothes shown on one category page
+    cloth:<id>        one cloth detail page
+    clothes           every cloth detail page, for changes to many clothes
+                      at once (bulk updates, imports, category edits)
+    reviews           approved SiteReview list
+    ratings           SiteRatingSummary figures
+
+Signals in ``store/signals.py`` bump the affected versions, which makes the
+old entries unreachable; they then age out through the normal timeout. No
+key is ever deleted. The versions only reach every worker process if the
+cache is shared between them (the file-based default in settings); with
+LocMemCache a bump is seen by the process that made it and nobody else.
+The file backend's ``incr`` is a read and a write, so two simultaneous
+bumps may land on the same number, which is still a new version.
+
+Like counts are buffered (see ``store/likes.py``) and do not bump any
+version, so a cached page can show a count up to STORE_CACHE_TIMEOUT old.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .compression import minify_response, precompress
+
+DEFAULT_TIMEOUT = 10 * 60
+
+
+def cache_timeout():
+    return getattr(settings, 'STORE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _version_key(namespace):
+    return f'store:version:{namespace}'
+
+
+def get_versions(*namespaces):
+    """Return {namespace: version}, initialising any version not in the cache."""
+    keys = {_version_key(ns): ns for ns in namespaces}
+    found = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def _initial_version():
+    # Start from the clock rather than 1: if a version key is evicted while
+    # entries built on it survive, the new version must not collide with them.
+    return int(time.time() * 1000)
+
+
+def version_token(*namespaces):
+    """Short string identifying the current versions, for use in cache keys."""
+    versions = get_versions(*namespaces)
+    return '-'.join(f'{ns}.{versions[ns]}' for ns in namespaces)
+
+
+def bump(*namespaces):
+    """Invalidate everything cached against `namespaces`."""
+    now = time.time()
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+        cache.set(f'store:changed:{namespace}', now, None)
+
+
+def last_changed(*namespaces):
+    """
+    Unix time of the most recent bump of any of `namespaces`, or None.
+
+    Unlike row timestamps this also moves when something is deleted.
+    """
+    times = cache.get_many([f'store:changed:{ns}' for ns in namespaces]).values()
+    return max(times, default=None)
+
+
+def cached(name, namespaces, compute):
+    """Return ``compute()``, cached under `name` until a namespace is bumped."""
+    key = f'store:data:{name}:{version_token(*namespaces)}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, cache_timeout())
+    return value
+
+
+def is_anonymous_visitor(request):
+    """
+    True for visitors who cannot be logged in.
+
+    Without a session cookie there is nobody to look up, so this avoids
+    touching ``request.session``, which would add ``Vary: Cookie``.
+    """
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    return not request.user.is_authenticated
+
+
+def cache_public_page(*namespaces):
+    """
+    Cache a view's rendered HTML for anonymous GET requests.
+
+    `namespaces` may use the view's URL kwargs, e.g. ``'category:{slug}'``.
+    Logged-in users (managers see edit controls) always get a fresh render.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = cache_timeout()
+            if not timeout or request.method not in ('GET', 'HEAD') or not is_anonymous_visitor(request):
+                return view(request, *args, **kwargs)
+
+            token = version_token(*(ns.format(**kwargs) for ns in namespaces))
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'store:page:{view.__name__}:{path}:{token}'
+            entry = cache.get(key)
+            if entry is not None:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                # Minified and gzipped when stored (see store/compression.py)
+                response.minified = entry.get('minified', False)
+                response.precompressed = entry.get('gzip')
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                minify_response(response)
+                response.precompressed = precompress(response.content)
+                cache.set(key, {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'minified': getattr(response, 'minified', False),
+                    'gzip': response.precompressed,
+                }, timeout)
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,187 @@
+"""
+Smaller HTML on the wire: whitespace/comment minification plus gzip.
+
+``minify_html`` reduces every whitespace run that spans a line break (the
+template indentation) to a single newline and drops HTML comments. Browsers
+render the result identically. Runs within a line are left alone, so
+attribute values such as ``data-*`` text keep their spacing. The contents of
+``<pre>``, ``<textarea>`` and ``<script>`` are left untouched, and
+``<style>`` blocks only lose their indentation. Conditional comments
+(``<!--[if IE]>``) are kept.
+
+``CompressionMiddleware`` minifies ``text/html`` responses (streaming ones
+chunk by chunk, see ``minify_stream``) and then gzips anything compressible
+for clients that send ``Accept-Encoding: gzip``, exactly like Django's
+``GZipMiddleware``. That includes the random padding against BREACH, the
+``Vary`` header and weak ETags. Images, fonts and other binary types are
+passed through untouched, as are byte-range (206) responses.
+
+Pages in the public page cache (``store/cache.py``) are minified and
+compressed once, when they are stored, and a hit reuses both. They can skip
+the BREACH padding because a cached page never carries a cookie or CSRF
+token.
+
+Set ``STORE_MINIFY_HTML = False`` to send templates as rendered.
+"""
+import codecs
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+PROTECTED_TAGS = ('pre', 'textarea', 'script', 'style')
+
+# Protected blocks and comments; everything in between is plain markup
+BLOCK_RE = re.compile(
+    r'<(?P<tag>%s)\b.*?</(?P=tag)\s*>|<!--.*?-->' % '|'.join(PROTECTED_TAGS),
+    re.IGNORECASE | re.DOTALL,
+)
+# Where an unfinished protected block or comment starts (streaming)
+OPEN_RE = re.compile(r'<(?:%s)\b|<!--' % '|'.join(PROTECTED_TAGS), re.IGNORECASE)
+# Whitespace around a line break, i.e. indentation and blank lines
+LINE_BREAK_RE = re.compile(r'[ \t\r\f\v]*\n\s*')
+
+
+def minify_enabled():
+    return getattr(settings, 'STORE_MINIFY_HTML', True)
+
+
+def minify_html(html):
+    """Minify a complete (or safely cut, see minify_stream) piece of HTML."""
+    out, position = [], 0
+    for match in BLOCK_RE.finditer(html):
+        out.append(LINE_BREAK_RE.sub('\n', html[position:match.start()]))
+        block = match.group()
+        if block.startswith('<!--'):
+            if block.startswith('<!--[if') or block.startswith('<!--<!'):
+                out.append(block)
+        elif match['tag'].lower() == 'style':
+            out.append(LINE_BREAK_RE.sub('\n', block))
+        else:
+            out.append(block)
+        position = match.end()
+    out.append(LINE_BREAK_RE.sub('\n', html[position:]))
+    return ''.join(out)
+
+
+def _safe_cut(text):
+    """Length of the prefix of `text` that can be minified without the rest."""
+    end = text.rfind('>') + 1
+    position = 0
+    while True:
+        opened = OPEN_RE.search(text, position, end)
+        if not opened:
+            return end
+        closed = BLOCK_RE.match(text, opened.start())
+        if not closed:
+            # Wait for the rest of the block
+            return opened.start()
+        position = closed.end()
+
+
+def minify_stream(chunks, charset='utf-8'):
+    """Minify an iterable of HTML byte chunks, yielding bytes as it goes."""
+    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk if isinstance(chunk, bytes) else chunk.encode(charset))
+        cut = _safe_cut(pending)
+        if cut:
+            yield minify_html(pending[:cut]).encode(charset)
+            pending = pending[cut:]
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield minify_html(pending).encode(charset)
+
+
+async def aminify_stream(chunks, charset='utf-8'):
+    """minify_stream() for async streaming responses."""
+    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    pending = ''
+    async for chunk in chunks:
+        pending += decoder.decode(chunk if isinstance(chunk, bytes) else chunk.encode(charset))
+        cut = _safe_cut(pending)
+        if cut:
+            yield minify_html(pending[:cut]).encode(charset)
+            pending = pending[cut:]
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield minify_html(pending).encode(charset)
+
+
+# Content types worth gzipping; images, fonts and archives are compressed already
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+
+def accepts_gzip(request):
+    """Whether Accept-Encoding allows gzip (``gzip;q=0`` does not)."""
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = coding.strip().partition(';')
+        if coding.strip().lower() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def is_compressible(response):
+    # Never re-encode a byte range: Content-Range refers to the identity body
+    if response.status_code == 206 or response.has_header('Content-Range'):
+        return False
+    return response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+
+
+def is_html(response):
+    return response.get('Content-Type', '').startswith('text/html')
+
+
+def minify_response(response):
+    """Minify an HTML response in place (once)."""
+    if getattr(response, 'minified', False) or not minify_enabled() or not is_html(response):
+        return response
+    if response.has_header('Content-Encoding'):
+        return response
+    charset = response.charset
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = aminify_stream(response.streaming_content, charset)
+        else:
+            response.streaming_content = minify_stream(response.streaming_content, charset)
+        if response.has_header('Content-Length'):
+            del response.headers['Content-Length']
+    else:
+        response.content = minify_html(response.content.decode(charset, errors='replace')).encode(charset)
+    response.minified = True
+    return response
+
+
+def precompress(content):
+    """gzip `content` for storing alongside a cached page, or None if it does not shrink."""
+    compressed = compress_string(content)
+    return compressed if len(compressed) < len(content) else None
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Minify HTML, then gzip it (see the module docstring)."""
+
+    def process_response(self, request, response):
+        minify_response(response)
+        if not is_compressible(response) or response.has_header('Content-Encoding'):
+            return response
+        if not accepts_gzip(request):
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        precompressed = getattr(response, 'precompressed', None)
+        if precompressed is None:
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response.content = precompressed
+        response.headers['Content-Length'] = str(len(precompressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
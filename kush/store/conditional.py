@@ -0,0 +1,113 @@
+"""
+Conditional GET support for the public catalogue pages.
+
+Each page gets an ``ETag`` built from the cache versions it depends on (see
+``store/cache.py``) and a ``Last-Modified`` taken from the newest row
+timestamp it shows, so a browser or proxy revalidating an unchanged page
+gets a 304 without the view running. Neither value needs a query on a warm
+cache: the timestamps are computed once per version.
+
+Anonymous responses are marked ``Cache-Control: public`` so a reverse
+proxy may store them; pages for logged-in managers are never validated or
+shared.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import cached, is_anonymous_visitor, last_changed, version_token
+from .models import Category, Cloth, SiteRatingSummary, SiteReview
+
+DEFAULT_PUBLIC_MAX_AGE = 60
+
+
+def conditional_page(*namespaces, last_modified):
+    """
+    Add ETag/Last-Modified validation and public caching headers to a view.
+
+    `namespaces` are the cache namespaces the page depends on and may use the
+    view's URL kwargs (``'category:{slug}'``). `last_modified` is called with
+    the URL kwargs and returns the newest relevant row timestamp.
+    """
+    def resolve(kwargs):
+        return [ns.format(**kwargs) for ns in namespaces]
+
+    def etag_func(request, *args, **kwargs):
+        if not is_anonymous_visitor(request):
+            return None
+        token = version_token(*resolve(kwargs))
+        return hashlib.md5(f'{request.get_full_path()}:{token}'.encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        if not is_anonymous_visitor(request):
+            return None
+        resolved = resolve(kwargs)
+        name = 'last_modified:' + ':'.join(resolved)
+        candidates = [cached(name, resolved, lambda: last_modified(**kwargs))]
+        changed = last_changed(*resolved)
+        if changed is not None:
+            candidates.append(datetime.fromtimestamp(changed, tz=timezone.utc))
+        return max((c for c in candidates if c is not None), default=None)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304) and request.method in ('GET', 'HEAD'):
+                # CSRF_COOKIE_NEEDS_UPDATE: the page rendered a CSRF token and will set a cookie
+                if (is_anonymous_visitor(request) and not response.cookies
+                        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                    patch_cache_control(response, public=True, max_age=getattr(
+                        settings, 'STORE_PUBLIC_MAX_AGE', DEFAULT_PUBLIC_MAX_AGE))
+                else:
+                    patch_cache_control(response, private=True)
+            return response
+        return wrapper
+    return decorator
+
+
+# ----- Newest row timestamps per page -----
+
+def _newest(*timestamps):
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def _reviews_and_ratings():
+    return (
+        SiteReview.objects.filter(is_approved=True).aggregate(t=Max('created_at'))['t'],
+        SiteRatingSummary.objects.aggregate(t=Max('updated_at'))['t'],
+    )
+
+
+def catalogue_last_modified():
+    return _newest(
+        Cloth.objects.aggregate(t=Max('updated_at'))['t'],
+        Category.objects.aggregate(t=Max('created_at'))['t'],
+        *_reviews_and_ratings(),
+    )
+
+
+def category_last_modified(slug):
+    category = Category.objects.filter(slug=slug).annotate(t=Max('clothes__updated_at')).first()
+    if category is None:
+        return None
+    return _newest(category.created_at, category.t, *_reviews_and_ratings())
+
+
+def cloth_last_modified(cloth_id):
+    return Cloth.objects.filter(pk=cloth_id).values_list('updated_at', flat=True).first()
+
+
+def cloth_list_last_modified():
+    return Cloth.objects.filter(status='available').aggregate(t=Max('updated_at'))['t']
+
+
+def about_last_modified():
+    return _newest(*_reviews_and_ratings())
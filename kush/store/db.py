@@ -0,0 +1,95 @@
+"""
+SQLite in production: connection setup, read/write routing and maintenance.
+
+Both aliases in ``settings.DATABASES`` open the same file. Every connection
+sets WAL journal mode, ``synchronous = NORMAL`` and a larger page cache at
+connect time (``OPTIONS['init_command']``). It also waits up to ``timeout``
+seconds for a lock instead of failing with "database is locked", and, under
+WSGI, stays open between requests (``CONN_MAX_AGE``; 0 under ASGI).
+
+``ReadWriteRouter`` sends writes to ``default``. That alias starts its
+transactions with ``BEGIN IMMEDIATE``, so concurrent writers queue for the
+single write lock instead of deadlocking on a lock upgrade. Reads go to the
+query-only ``reader`` alias. In WAL mode readers never wait for the writer
+and always see the last committed state. Inside an ``atomic`` block reads
+stay on ``default``, so a view can read its own uncommitted writes.
+
+``maintain()`` is run by ``manage.py sqlite_maintenance``. Schedule it
+daily, or after large imports.
+"""
+from django.db import connections
+
+WRITE_ALIAS = 'default'
+READ_ALIAS = 'reader'
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if READ_ALIAS not in connections or connections[WRITE_ALIAS].in_atomic_block:
+            return WRITE_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return WRITE_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == WRITE_ALIAS
+
+
+def read_connection():
+    """The connection raw-SQL reads should use (see ReadWriteRouter)."""
+    return connections[ReadWriteRouter().db_for_read(None)]
+
+
+def pragma(name, using=WRITE_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        row = cursor.fetchone()
+    return row[0] if row and len(row) == 1 else row
+
+
+def maintain(analyze=True, optimize=True, checkpoint='TRUNCATE', using=WRITE_ALIAS):
+    """
+    Refresh planner statistics and fold the WAL back into the database file.
+
+    ``ANALYZE`` rebuilds the statistics the query planner uses to choose
+    indexes, and ``PRAGMA optimize`` re-analyzes whatever has drifted since.
+    ``wal_checkpoint`` copies committed pages from the ``-wal`` file into the
+    main file. ``TRUNCATE`` also resets the WAL to zero bytes, so it cannot
+    keep growing under steady traffic. Returns what was done, for the command
+    output.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return {}
+    if checkpoint and checkpoint.upper() not in CHECKPOINT_MODES:
+        raise ValueError(f"checkpoint must be one of {', '.join(CHECKPOINT_MODES)}")
+    report = {}
+    with connection.cursor() as cursor:
+        if analyze:
+            cursor.execute('ANALYZE')
+            report['analyze'] = True
+        if optimize:
+            cursor.execute('PRAGMA optimize')
+            report['optimize'] = True
+        if checkpoint:
+            cursor.execute(f'PRAGMA wal_checkpoint({checkpoint.upper()})')
+            busy, wal_pages, checkpointed = cursor.fetchone()
+            report['checkpoint'] = {
+                'mode': checkpoint.upper(), 'busy': bool(busy),
+                'wal_pages': wal_pages, 'checkpointed': checkpointed,
+            }
+        cursor.execute('PRAGMA journal_mode')
+        report['journal_mode'] = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_count')
+        page_count = cursor.fetchone()[0]
+        cursor.execute('PRAGMA freelist_count')
+        report['free_pages'] = cursor.fetchone()[0]
+        report['pages'] = page_count
+    return report
@@ -1,8 +1,16 @@
 from django import forms
-from .models import Cloth, SiteRating, SiteReview
+from django.utils import timezone
+from . import cache
+from .images import IMAGE_FIELDS, generate_derivatives
+from .models import Category, Cloth, SiteRating, SiteReview
 
 
 class ClothForm(forms.ModelForm):
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        # Size-limit errors raised by StreamingImageUploadHandler while the body was read
+        self.upload_errors = upload_errors or {}
+        super().__init__(*args, **kwargs)
+
     class Meta:
         model = Cloth
         fields = [
@@ -20,6 +28,86 @@ class ClothForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        for field, message in self.upload_errors.items():
+            self.add_error(field if field in self.fields else None, message)
+        return cleaned_data
+
+    def save(self, commit=True):
+        """Save the cloth and (re)build image derivatives for any changed image."""
+        cloth = super().save(commit=commit)
+        if commit:
+            self._save_derivatives()
+        else:
+            save_m2m = self.save_m2m
+
+            def save_m2m_and_derivatives():
+                save_m2m()
+                self._save_derivatives()
+
+            self.save_m2m = save_m2m_and_derivatives
+        return cloth
+
+    def _save_derivatives(self):
+        changed = [name for name in IMAGE_FIELDS if name in self.changed_data]
+        if changed and generate_derivatives(self.instance, changed):
+            for name in changed:
+                # Content hash computed by StreamingImageUploadHandler, if it was used
+                sha256 = getattr(self.files.get(name), 'sha256', None)
+                if sha256 and name in self.instance.image_derivatives:
+                    self.instance.image_derivatives[name]['sha256'] = sha256
+            self.instance.save(update_fields=['image_derivatives'])
+
+
+class IdListField(forms.Field):
+    """Integer primary keys from repeated form values (one checkbox per row)."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        try:
+            return [int(v) for v in value or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Invalid selection.")
+
+
+class BulkUpdateForm(forms.Form):
+    """Dashboard bulk action: set one field on the selected (or all matching) clothes."""
+    ACTION_CHOICES = [
+        ('status', 'Set status'),
+        ('category', 'Move to category'),
+        ('price', 'Set price'),
+    ]
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    ids = IdListField(required=False)
+    all_matching = forms.BooleanField(required=False)
+    status = forms.ChoiceField(choices=Cloth.STATUS_CHOICES, required=False)
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False)
+    price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action and cleaned_data.get(action) in (None, ''):
+            self.add_error(action, f"Choose a {action} to apply.")
+        if not cleaned_data.get('ids') and not cleaned_data.get('all_matching'):
+            raise forms.ValidationError("Select at least one item.")
+        return cleaned_data
+
+    def apply(self, clothes):
+        """Run the update on `clothes` in a single UPDATE; returns the number of rows changed."""
+        field = self.cleaned_data['action']
+        value = self.cleaned_data[field]
+        # QuerySet.update() skips the post_save signal, so invalidate the cache
+        # here: one version for all cloth pages rather than one per row
+        slugs = set(clothes.order_by().values_list('category__slug', flat=True).distinct())
+        updated = clothes.update(**{field: value, 'updated_at': timezone.now()})
+        if field == 'category':
+            slugs.add(value.slug)
+        cache.bump('catalogue', 'clothes', *(f'category:{slug}' for slug in slugs))
+        return updated
+
 
 class SiteRatingForm(forms.ModelForm):
     """Form for submitting site-wide ratings (1-5 stars)"""
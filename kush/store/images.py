@@ -0,0 +1,202 @@
+"""
+Responsive image derivatives for Cloth photos.
+
+Uploads are stored untouched; alongside each one we write resized WebP and
+JPEG copies at a few widths so product cards can download a thumbnail
+instead of the multi-megabyte original. Generated file names are recorded
+in ``Cloth.image_derivatives`` so templates never touch the filesystem.
+
+Each record also describes its source image (see ``describe``): the pixel
+size, a dominant colour and a tiny blurred WebP as a data URI. With those,
+templates can reserve space for an image and paint something in its place
+before a single byte of it has arrived.
+"""
+import base64
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from io import BytesIO
+from PIL import Image, ImageOps
+
+
+IMAGE_FIELDS = ('image_front', 'image_left', 'image_right')
+
+# Card thumbnails render at ~220-280px, the detail page at ~600px.
+DERIVATIVE_WIDTHS = (320, 640, 960)
+
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 75, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True},
+}
+
+DERIVATIVE_ROOT = 'clothes/derivatives'
+
+# Longest side of the inline placeholder; the browser stretches and blurs it
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_OPTIONS = {'format': 'WEBP', 'quality': 40}
+METADATA_KEYS = ('width', 'height', 'color', 'placeholder')
+
+
+def target_widths(source_width):
+    """Widths to generate for an image `source_width` pixels wide (never upscales)."""
+    widths = [w for w in DERIVATIVE_WIDTHS if w < source_width]
+    widths.append(min(source_width, DERIVATIVE_WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def _flatten(image):
+    """Return an RGB copy of `image`, compositing transparency onto white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def dominant_color(image):
+    """The most common colour of an RGB image, as ``#rrggbb``."""
+    sample = image.copy()
+    sample.thumbnail((64, 64))
+    quantized = sample.quantize(colors=8)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def placeholder(image):
+    """A few-hundred-byte WebP preview of an RGB image, as a data URI."""
+    preview = image.copy()
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = BytesIO()
+    preview.save(buffer, **PLACEHOLDER_OPTIONS)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def describe(image):
+    """Size, dominant colour and placeholder of a decoded (flattened) image."""
+    return {
+        'width': image.width,
+        'height': image.height,
+        'color': dominant_color(image),
+        'placeholder': placeholder(image),
+    }
+
+
+def _open(fp):
+    with Image.open(fp) as original:
+        return _flatten(ImageOps.exif_transpose(original))
+
+
+def render_variants(fp):
+    """
+    Decode the image in `fp` and encode every derivative.
+
+    Returns ``({ext: {width: bytes}}, describe(image))``. Pure CPU work with
+    no storage access, so it can run in a worker process (see
+    store/importer.py).
+    """
+    image = _open(fp)
+
+    rendered = {ext: {} for ext in DERIVATIVE_FORMATS}
+    for width in target_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for ext, options in DERIVATIVE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            rendered[ext][width] = buffer.getvalue()
+    return rendered, describe(image)
+
+
+def save_variants(source_name, field_name, rendered, metadata=None):
+    """Write the output of render_variants() and return the derivative record for `source_name`."""
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    record = {'source': source_name, **(metadata or {})}
+    for ext, widths in rendered.items():
+        record[ext] = {}
+        for width, content in widths.items():
+            name = f'{DERIVATIVE_ROOT}/{field_name}/{stem}_{width}w.{ext}'
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            record[ext][str(width)] = default_storage.save(name, ContentFile(content))
+    return record
+
+
+def build_variants(fieldfile, field_name):
+    """
+    Write WebP/JPEG derivatives for one image field and return the record
+    stored in ``Cloth.image_derivatives[field_name]``.
+    """
+    fieldfile.open('rb')
+    try:
+        rendered, metadata = render_variants(fieldfile)
+    finally:
+        fieldfile.close()
+    return save_variants(fieldfile.name, field_name, rendered, metadata)
+
+
+def describe_file(fieldfile):
+    """describe() a stored image without rendering any derivatives."""
+    fieldfile.open('rb')
+    try:
+        return describe(_open(fieldfile))
+    finally:
+        fieldfile.close()
+
+
+def delete_variants(record):
+    """Remove the files referenced by a derivative record."""
+    for ext in DERIVATIVE_FORMATS:
+        for name in (record or {}).get(ext, {}).values():
+            default_storage.delete(name)
+
+
+def generate_derivatives(cloth, field_names=IMAGE_FIELDS, force=False):
+    """
+    Bring ``cloth.image_derivatives`` in line with its current images.
+
+    Only fields whose source file changed (or all of `field_names` when
+    `force` is set) are re-rendered. Up-to-date records written before
+    records carried image metadata only get the metadata added. Returns True
+    when the record changed; the caller is responsible for saving the
+    instance.
+    """
+    derivatives = dict(cloth.image_derivatives or {})
+    changed = False
+    for field_name in field_names:
+        fieldfile = getattr(cloth, field_name)
+        current = derivatives.get(field_name)
+        if not fieldfile:
+            if current:
+                delete_variants(current)
+                del derivatives[field_name]
+                changed = True
+            continue
+        if current and current.get('source') == fieldfile.name and not force:
+            if not all(key in current for key in METADATA_KEYS):
+                derivatives[field_name] = {**current, **describe_file(fieldfile)}
+                changed = True
+            continue
+        if current:
+            delete_variants(current)
+        derivatives[field_name] = build_variants(fieldfile, field_name)
+        changed = True
+    cloth.image_derivatives = derivatives
+    return changed
+
+
+def metadata(cloth, field_name):
+    """The describe() values stored for one image field, or {} if there are none."""
+    record = (cloth.image_derivatives or {}).get(field_name) or {}
+    return {key: record[key] for key in METADATA_KEYS if key in record}
+
+
+def srcset(cloth, field_name, ext):
+    """Return a ``srcset`` string for one field/format, or '' if none exist."""
+    variants = (cloth.image_derivatives or {}).get(field_name, {}).get(ext, {})
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted(variants.items(), key=lambda item: int(item[0]))
+    )
@@ -0,0 +1,37 @@
+"""
+Process-pool entry point for the catalogue importer (store/importer.py).
+
+Worker processes started with ``spawn`` (the default on Windows and macOS)
+import this module before Django is set up, so it must not import models or
+anything else that needs the app registry. It only reads files and calls
+``images.render_variants``, which is plain Pillow work.
+"""
+import os
+import zipfile
+from io import BytesIO
+
+from .images import render_variants
+
+_open_archives = {}
+
+
+def read_image(kind, path, name):
+    if kind == 'dir':
+        with open(os.path.join(path, name), 'rb') as f:
+            return f.read()
+    # One open archive per worker process
+    archive = _open_archives.get(path)
+    if archive is None:
+        archive = _open_archives[path] = zipfile.ZipFile(path)
+    return archive.read(name)
+
+
+def process_image(job):
+    """
+    Read one source image and render its derivatives.
+
+    `job` comes from ``ImageSource.job()``. Returns ``(original bytes,
+    {ext: {width: bytes}}, metadata)``.
+    """
+    content = read_image(*job)
+    return (content, *render_variants(BytesIO(content)))
@@ -0,0 +1,303 @@
+"""
+Bulk catalogue import from a stock-intake manifest.
+
+The manifest is a CSV file or a JSON list with one object per item:
+
+    sku, name, price, category, description, status, manager,
+    image_front, image_left, image_right
+
+Only ``name``, ``price`` and ``category`` are required. Image columns are
+paths inside the image source, which is a directory or a ZIP archive. Rows
+without a ``sku`` get one derived from their name, category and front image,
+so re-running the same manifest is safe either way.
+
+Items are created with ``bulk_create`` in batches. Images are decoded and
+resized in a process pool (store/imageworker.py) while this process writes
+the files through the default storage, then each batch is saved with one
+``bulk_update``. At most two images per worker are in flight at a time, so
+memory stays flat however many images a batch has. A re-run skips items that already exist and only
+finishes the images that are still missing, so an interrupted import can
+simply be started again.
+"""
+import csv
+import hashlib
+import json
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import get_valid_filename
+
+from . import cache
+from .images import IMAGE_FIELDS, save_variants
+from .imageworker import process_image
+from .models import Category, Cloth
+
+DEFAULT_BATCH_SIZE = 200
+
+# Images submitted to the pool per worker before waiting for results
+IN_FLIGHT_PER_WORKER = 2
+
+STATUSES = {value for value, _ in Cloth.STATUS_CHOICES}
+
+
+class ManifestError(Exception):
+    """The manifest or image source cannot be used at all."""
+
+
+# ----- Manifest -----
+
+def read_manifest(path):
+    """Return the manifest rows as dicts of stripped strings."""
+    try:
+        if path.lower().endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            rows = data.get('items', []) if isinstance(data, dict) else data
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ManifestError("A JSON manifest must be a list of objects (or {\"items\": [...]})")
+        else:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Cannot read {path}: {e}")
+    return [
+        {str(key).strip().lower(): str(value).strip() for key, value in row.items() if key and value is not None}
+        for row in rows
+    ]
+
+
+def derive_sku(row):
+    """Stable identifier for rows that have no sku column."""
+    key = '|'.join(row.get(field, '').lower() for field in ('name', 'category', 'image_front'))
+    return 'auto-' + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def clean_row(row, images):
+    """Validate one manifest row; returns the cleaned item or raises ValueError."""
+    name = row.get('name', '')
+    category = row.get('category', '')
+    if not name or not category:
+        raise ValueError("name and category are required")
+    try:
+        price = Decimal(row.get('price', '').replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    if price < 0:
+        raise ValueError("price must not be negative")
+    status = row.get('status', '').lower() or 'available'
+    if status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(sorted(STATUSES))}")
+
+    item_images = {}
+    for field in IMAGE_FIELDS:
+        path = row.get(field)
+        if path:
+            if not images.exists(path):
+                raise ValueError(f"{field} {path!r} not found in the image source")
+            item_images[field] = path
+
+    return {
+        'sku': (row.get('sku') or derive_sku(row))[:64],
+        'name': name[:200],
+        'category': category[:100],
+        'price': price,
+        'description': row.get('description', ''),
+        'status': status,
+        'manager': row.get('manager', ''),
+        'images': item_images,
+    }
+
+
+# ----- Image source -----
+
+class ImageSource:
+    """A directory or ZIP archive the manifest's image paths are relative to."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        if zipfile.is_zipfile(self.path):
+            with zipfile.ZipFile(self.path) as archive:
+                self.members = {name.replace('\\', '/') for name in archive.namelist()}
+            self.kind = 'zip'
+        elif os.path.isdir(self.path):
+            self.members = None
+            self.kind = 'dir'
+        else:
+            raise ManifestError(f"{path} is neither a directory nor a ZIP archive")
+
+    def _normalise(self, name):
+        return name.replace('\\', '/').lstrip('/')
+
+    def exists(self, name):
+        name = self._normalise(name)
+        if self.kind == 'zip':
+            return name in self.members
+        full = os.path.realpath(os.path.join(self.path, name))
+        # Refuse paths that escape the directory (../)
+        return full.startswith(self.path + os.sep) and os.path.isfile(full)
+
+    def job(self, name):
+        """Picklable description of one image for imageworker.process_image()."""
+        return (self.kind, self.path, self._normalise(name))
+
+
+# ----- Import -----
+
+class CatalogueImporter:
+    """
+    Import a manifest in batches. `progress` is called after every batch
+    with the running totals (see `stats`). `mp_context` picks the worker
+    start method (the platform default if None).
+    """
+
+    def __init__(self, manifest, images, default_manager=None, batch_size=DEFAULT_BATCH_SIZE,
+                 workers=None, progress=None, mp_context=None):
+        self.rows = read_manifest(manifest)
+        self.images = ImageSource(images)
+        self.default_manager = default_manager
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = progress
+        self.mp_context = mp_context
+        self.stats = {
+            'rows': len(self.rows), 'created': 0, 'skipped': 0, 'images': 0, 'errors': [],
+        }
+        self._managers = {}
+        self._categories = {}
+
+    # -- lookups --
+
+    def manager_for(self, username):
+        username = username or self.default_manager
+        if not username:
+            raise ValueError("no manager column and no --manager given")
+        if username not in self._managers:
+            self._managers[username] = User.objects.filter(username=username, is_staff=True).first()
+        if self._managers[username] is None:
+            raise ValueError(f"no staff user {username!r}")
+        return self._managers[username]
+
+    def ensure_categories(self, names):
+        """Create any categories in `names` that do not exist yet (one bulk_create)."""
+        missing = set(names) - set(self._categories)
+        if not missing:
+            return
+        for category in Category.objects.filter(name__in=missing):
+            self._categories.setdefault(category.name, category)
+        to_create, taken = [], set()
+        for name in sorted(missing - set(self._categories)):
+            slug = Category.unique_slug(name)
+            base, n = slug, 2
+            while slug in taken:
+                slug, n = f'{base}-{n}', n + 1
+            taken.add(slug)
+            to_create.append(Category(name=name, slug=slug))
+        for category in Category.objects.bulk_create(to_create):
+            self._categories[category.name] = category
+
+    # -- main loop --
+
+    def run(self):
+        items = []
+        for number, row in enumerate(self.rows, start=1):
+            try:
+                item = clean_row(row, self.images)
+                item['manager'] = self.manager_for(item['manager'])
+                items.append(item)
+            except ValueError as e:
+                self.stats['errors'].append(f"item {number}: {e}")
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=self.mp_context) as pool:
+            for start in range(0, len(items), self.batch_size):
+                self.import_batch(items[start:start + self.batch_size], pool)
+                if self.progress:
+                    self.progress(self.stats, done=min(start + self.batch_size, len(items)), total=len(items))
+        return self.stats
+
+    def import_batch(self, items, pool):
+        # Duplicate skus within the manifest: the first one wins
+        by_sku = {}
+        for item in items:
+            if item['sku'] in by_sku:
+                self.stats['skipped'] += 1
+            else:
+                by_sku[item['sku']] = item
+
+        self.ensure_categories({item['category'] for item in by_sku.values()})
+        existing = {cloth.sku: cloth for cloth in Cloth.objects.filter(sku__in=by_sku).select_related('category')}
+
+        new = [
+            Cloth(
+                sku=sku,
+                name=item['name'],
+                price=item['price'],
+                description=item['description'],
+                status=item['status'],
+                category=self._categories[item['category']],
+                manager=item['manager'],
+            )
+            for sku, item in by_sku.items() if sku not in existing
+        ]
+        with transaction.atomic():
+            created = Cloth.objects.bulk_create(new)
+        self.stats['created'] += len(created)
+        self.stats['skipped'] += len(existing)
+
+        # Images still missing on new or previously interrupted items
+        clothes = {**existing, **{cloth.sku: cloth for cloth in created}}
+        jobs = [
+            (cloth, field, path)
+            for sku, cloth in clothes.items()
+            for field, path in by_sku[sku]['images'].items() if not getattr(cloth, field)
+        ]
+
+        # Each result holds the original and all its derivatives: save and
+        # drop it as soon as it arrives, and only keep a few in flight
+        changed = {}
+        in_flight = {}
+        limit = self.workers * IN_FLIGHT_PER_WORKER
+        jobs.reverse()
+        while jobs or in_flight:
+            while jobs and len(in_flight) < limit:
+                job = jobs.pop()
+                in_flight[pool.submit(process_image, self.images.job(job[2]))] = job
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                cloth, field, path = in_flight.pop(future)
+                try:
+                    original, rendered, metadata = future.result()
+                except Exception as e:  # a broken image should not stop the import
+                    self.stats['errors'].append(f"{cloth.sku} {field} {path}: {e}")
+                    continue
+                self.save_image(cloth, field, path, original, rendered, metadata)
+                changed[cloth.pk] = cloth
+                self.stats['images'] += 1
+
+        if changed:
+            Cloth.objects.bulk_update(list(changed.values()), [*IMAGE_FIELDS, 'image_derivatives'])
+
+        # bulk_create/bulk_update skip the save signals that invalidate the page
+        # cache. Existing rows were loaded with their category, new ones were
+        # built with it, so this runs no queries.
+        if created or changed:
+            slugs = {cloth.category.slug for cloth in clothes.values()}
+            cache.bump('catalogue', *(['clothes'] if changed else []), *(f'category:{slug}' for slug in slugs))
+
+    def save_image(self, cloth, field, path, original, rendered, metadata):
+        """Store the original under a name derived from the sku, plus its derivatives."""
+        upload_to = Cloth._meta.get_field(field).upload_to
+        name = f"{upload_to}{get_valid_filename(cloth.sku)}_{get_valid_filename(os.path.basename(path))}"
+        # Overwrite leftovers from an interrupted run instead of piling up renamed copies
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(original))
+        setattr(cloth, field, name)
+        derivatives = dict(cloth.image_derivatives or {})
+        derivatives[field] = save_variants(name, field, rendered, metadata)
+        cloth.image_derivatives = derivatives
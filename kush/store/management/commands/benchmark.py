@@ -0,0 +1,157 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmark import (
+    BURST_ROUTES, MIDDLEWARE_ROUTES, RUNNERS, compare, load_report, measure_middleware, measure_transfer,
+    run_benchmark, run_burst,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark every store route against the current database (seed it with seed_catalogue first)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=[*RUNNERS, 'all'], default='inprocess',
+                            help="inprocess (test client), wsgi (HTTP to the WSGI app) or all.")
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per route (default 50).")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per route first (default 5).")
+        parser.add_argument('--route', action='append', dest='routes',
+                            help="Only benchmark this URL name (repeatable).")
+        parser.add_argument('--no-cache', action='store_true',
+                            help="Disable the page/fragment cache to measure cold renders.")
+        parser.add_argument('--output', help="Write the JSON report to this file.")
+        parser.add_argument('--compare', help="Print changes against an earlier JSON report.")
+        parser.add_argument('--max-regression', type=float,
+                            help="With --compare, fail if any p95 latency grew by more than this percentage.")
+        parser.add_argument('--burst', type=int, metavar='N',
+                            help="Instead, send N simultaneous requests to each anonymous write endpoint "
+                                 f"({', '.join(BURST_ROUTES)} unless --route is given) under WSGI and ASGI.")
+        parser.add_argument('--threads', type=int, default=4,
+                            help="With --burst, WSGI worker threads (default 4).")
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help="With --burst, ASGI requests in flight at once (default 200).")
+        parser.add_argument('--transfer', action='store_true',
+                            help="Instead, report response sizes of the public pages as rendered, "
+                                 "minified and gzipped.")
+        parser.add_argument('--middleware', action='store_true',
+                            help="Instead, time public pages with the full middleware stack and with the "
+                                 "lean session-free path.")
+
+    def handle(self, *args, **options):
+        if options['burst'] is not None:
+            return self.handle_burst(options)
+        if options['transfer']:
+            return self.handle_transfer(options)
+        if options['middleware']:
+            return self.handle_middleware(options)
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1.")
+        modes = list(RUNNERS) if options['mode'] == 'all' else [options['mode']]
+
+        self.stdout.write(f"{'mode':<10} {'route':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                          f"{'queries':>8} {'bytes':>9} {'peak KB':>9}")
+
+        def progress(mode, route, r):
+            self.stdout.write(f"{mode:<10} {route:<20} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                              f"{r['queries']:>8} {r['bytes']:>9} {r['peak_memory'] // 1024:>9}")
+
+        try:
+            report = run_benchmark(
+                modes=modes,
+                requests=options['requests'],
+                warmup=options['warmup'],
+                routes=options['routes'],
+                use_cache=not options['no_cache'],
+                progress=progress,
+            )
+        except (LookupError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.write_report(report, options['output'])
+
+        if options['compare']:
+            self.report_changes(load_report(options['compare']), report, options['max_regression'])
+
+    def handle_burst(self, options):
+        if options['burst'] < 1 or options['threads'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--burst, --threads and --concurrency must be at least 1.")
+
+        self.stdout.write(f"{'mode':<6} {'route':<20} {'req/s':>9} {'seconds':>9} {'p50 ms':>9} "
+                          f"{'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+        def progress(mode, route, r):
+            self.stdout.write(f"{mode:<6} {route:<20} {r['per_second']:>9.1f} {r['seconds']:>9.2f} "
+                              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['errors']:>7}")
+
+        try:
+            report = run_burst(
+                total=options['burst'],
+                routes=options['routes'] or BURST_ROUTES,
+                threads=options['threads'],
+                concurrency=options['concurrency'],
+                progress=progress,
+            )
+        except LookupError as e:
+            raise CommandError(str(e))
+        self.write_report(report, options['output'])
+
+    def handle_transfer(self, options):
+        self.stdout.write(f"{'route':<20} {'raw':>9} {'minified':>9} {'gzip':>9} {'saved':>7}")
+
+        def progress(route, r):
+            self.stdout.write(f"{route:<20} {r['raw']:>9} {r['minified']:>9} {r['gzip']:>9} "
+                              f"{r['saved_pct']:>6.1f}%")
+
+        try:
+            report = measure_transfer(routes=options['routes'], progress=progress)
+        except (LookupError, RuntimeError) as e:
+            raise CommandError(str(e))
+        self.write_report(report, options['output'])
+
+    def handle_middleware(self, options):
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1.")
+        self.stdout.write(f"{'stack':<6} {'route':<32} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'queries':>8}")
+
+        def progress(stack, route, r):
+            self.stdout.write(f"{stack:<6} {route:<32} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} "
+                              f"{r['mean_ms']:>9.3f} {r['queries']:>8}")
+
+        try:
+            report = measure_middleware(
+                requests=options['requests'],
+                warmup=options['warmup'],
+                routes=options['routes'] or MIDDLEWARE_ROUTES,
+                progress=progress,
+            )
+        except (LookupError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        full, lean = report['results']['full'], report['results']['lean']
+        self.stdout.write("\nSaved per request by the lean path:")
+        for name in full:
+            saved = full[name]['mean_ms'] - lean[name]['mean_ms']
+            self.stdout.write(f"{name:<32} {saved:>9.3f} ms {full[name]['queries'] - lean[name]['queries']:>4} "
+                              f"queries")
+        self.write_report(report, options['output'])
+
+    def write_report(self, report, path):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {path}"))
+
+    def report_changes(self, baseline, report, max_regression):
+        self.stdout.write(f"\nChanges against {baseline['meta']['timestamp']}:")
+        regressions = []
+        for mode, route, metric, before, after, change in compare(baseline, report):
+            if before == after:
+                continue
+            line = f"{mode:<10} {route:<20} {metric:<12} {before:>12} -> {after:<12} {change:+.1f}%"
+            if metric == 'p95_ms' and max_regression is not None and change > max_regression:
+                regressions.append(line)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} route(s) regressed by more than {max_regression}% at p95.")
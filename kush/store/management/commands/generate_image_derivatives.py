@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from store import cache
+from store.images import generate_derivatives
+from store.models import Cloth
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate resized WebP/JPEG derivatives for Cloth images that are missing or out of date, "
+        "and backfill image size, dominant colour and placeholder for older records."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild derivatives even if they are up to date.")
+
+    def handle(self, *args, **options):
+        updated = []
+        queryset = Cloth.objects.select_related('category').order_by('id')
+        for cloth in queryset.iterator():
+            try:
+                changed = generate_derivatives(cloth, force=options['force'])
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Cloth {cloth.id} ({cloth.name}): {e}")
+                continue
+            if changed:
+                Cloth.objects.filter(pk=cloth.pk).update(image_derivatives=cloth.image_derivatives)
+                updated.append(cloth)
+                self.stdout.write(f"Cloth {cloth.id}: {cloth.name}")
+
+        # update() skips the save signals that invalidate the page cache
+        if updated:
+            slugs = {cloth.category.slug for cloth in updated}
+            cache.bump('catalogue', *(f'category:{slug}' for slug in slugs), *(f'cloth:{c.pk}' for c in updated))
+        self.stdout.write(self.style.SUCCESS(f"Updated derivatives for {len(updated)} item(s)."))
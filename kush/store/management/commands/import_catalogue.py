@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import DEFAULT_BATCH_SIZE, CatalogueImporter, ManifestError
+
+
+class Command(BaseCommand):
+    help = (
+        "Import clothes from a CSV/JSON manifest and a directory or ZIP of images "
+        "(see store/importer.py). Safe to re-run: existing items are skipped and "
+        "missing images completed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help="CSV or JSON manifest.")
+        parser.add_argument('images', help="Directory or ZIP archive the image paths are relative to.")
+        parser.add_argument('--manager', help="Username of the staff user owning rows without a manager column.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f"Items per bulk_create batch (default {DEFAULT_BATCH_SIZE}).")
+        parser.add_argument('--workers', type=int, help="Image worker processes (default: CPU count).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(stats, done, total):
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{done}/{total} items: {stats['created']} created, {stats['skipped']} skipped, "
+                f"{stats['images']} images ({done / elapsed:.1f} items/s, {stats['images'] / elapsed:.1f} images/s)"
+            )
+
+        try:
+            importer = CatalogueImporter(
+                options['manifest'],
+                options['images'],
+                default_manager=options['manager'],
+                batch_size=max(options['batch_size'], 1),
+                workers=options['workers'],
+                progress=progress,
+            )
+            stats = importer.run()
+        except ManifestError as e:
+            raise CommandError(str(e))
+
+        for error in stats['errors']:
+            self.stderr.write(error)
+        elapsed = time.perf_counter() - start
+        message = (
+            f"Imported {stats['created']} new item(s) and {stats['images']} image(s) from {stats['rows']} row(s) "
+            f"in {elapsed:.1f}s; {stats['skipped']} already present, {len(stats['errors'])} error(s)."
+        )
+        self.stdout.write(self.style.WARNING(message) if stats['errors'] else self.style.SUCCESS(message))
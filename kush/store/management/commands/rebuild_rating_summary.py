@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.models import SiteRatingSummary
+
+
+class Command(BaseCommand):
+    help = "Recompute the site rating summary (histogram, count and sum) from the SiteRating table."
+
+    def handle(self, *args, **options):
+        summary = SiteRatingSummary.rebuild()
+        histogram = ', '.join(f"{i}★: {getattr(summary, f'stars_{i}')}" for i in range(1, 6))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt summary: {summary.count} ratings, average {summary.average} ({histogram})"
+        ))
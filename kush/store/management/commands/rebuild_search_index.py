@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 product search index from the Cloth and Category tables."
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("The search index table is missing; run 'manage.py migrate' on SQLite first.")
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} item(s)."))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.benchmark import clear_seeded, seed_catalogue
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic catalogue for benchmarking (see store/benchmark.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help="Number of categories (default 20).")
+        parser.add_argument('--clothes', type=int, default=10_000, help="Number of clothes (default 10000).")
+        parser.add_argument('--reviews', type=int, default=2_000, help="Number of reviews (default 2000).")
+        parser.add_argument('--ratings', type=int, default=5_000, help="Number of ratings (default 5000).")
+        parser.add_argument('--managers', type=int, default=3, help="Number of staff users owning the clothes.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible data.")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete previously seeded benchmark data first (other data is left alone).")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_seeded()
+            self.stdout.write("Removed previous benchmark data.")
+
+        start = time.perf_counter()
+        counts = seed_catalogue(
+            categories=options['categories'],
+            clothes=options['clothes'],
+            reviews=options['reviews'],
+            ratings=options['ratings'],
+            managers=options['managers'],
+            seed=options['seed'],
+        )
+        elapsed = time.perf_counter() - start
+        summary = ', '.join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s."))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.outbox import drain, requeue_dead
+
+
+class Command(BaseCommand):
+    help = "Send queued emails in batches over one SMTP connection, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help="Messages per SMTP connection (default STORE_OUTBOX_BATCH_SIZE).")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, checking for new mail every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=5, help="With --loop, seconds between checks.")
+        parser.add_argument('--retry-dead', action='store_true',
+                            help="First queue messages that ran out of attempts again.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if options['retry_dead']:
+            self.stdout.write(f"Queued {requeue_dead()} failed email(s) again.")
+
+        while True:
+            counts = drain(batch_size=options['batch_size'])
+            if any(counts.values()) or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {counts['sent']} email(s); {counts['retry']} to retry, {counts['dead']} failed permanently."
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
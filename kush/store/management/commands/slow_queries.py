@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.slowqueries import SORT_KEYS, aggregate, read_log, top
+
+# Characters of SQL shown per query below verbosity 2
+SQL_PREVIEW = 300
+
+
+class Command(BaseCommand):
+    help = "List the slowest queries in the slow-query log, grouped by fingerprint, with their query plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help="Log to read (default STORE_SLOW_QUERY_LOG).")
+        parser.add_argument('--top', type=int, default=10, help="Queries to list (default %(default)s).")
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total',
+                            help="Rank by total, count, max or mean time (default %(default)s).")
+        parser.add_argument('--view', help="Only queries run by this view (URL name).")
+        parser.add_argument('--full-scans', action='store_true',
+                            help="Only queries whose plan reads a whole table.")
+
+    def handle(self, *args, **options):
+        if options['top'] < 1:
+            raise CommandError("--top must be at least 1.")
+        path = options['file'] or getattr(settings, 'STORE_SLOW_QUERY_LOG', None)
+        if not path:
+            raise CommandError("No log file: pass --file or set STORE_SLOW_QUERY_LOG.")
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = read_log(f)
+        except FileNotFoundError:
+            self.stdout.write(f"No slow queries logged yet ({path} does not exist).")
+            return
+        if options['view']:
+            entries = [entry for entry in entries if entry.get('view') == options['view']]
+
+        groups = aggregate(entries)
+        if options['full_scans']:
+            groups = [group for group in groups if group['full_scans']]
+        if not groups:
+            self.stdout.write("No matching slow queries.")
+            return
+
+        self.stdout.write(f"{len(entries)} slow quer{'y' if len(entries) == 1 else 'ies'} logged, "
+                          f"{len(groups)} distinct; top {min(options['top'], len(groups))} by {options['sort']}:")
+        for rank, group in enumerate(top(groups, options['top'], options['sort']), 1):
+            self.write_group(rank, group, options['verbosity'])
+
+    def write_group(self, rank, group, verbosity):
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{rank}. {group['fingerprint']}  {group['count']}x  total {group['total_ms']:.1f} ms  "
+            f"mean {group['mean_ms']:.1f} ms  max {group['max_ms']:.1f} ms"
+        ))
+        if group['full_scans']:
+            self.stdout.write(self.style.WARNING(f"   Full scan of {', '.join(group['full_scans'])}"))
+        sql = group['sql']
+        if verbosity < 2 and len(sql) > SQL_PREVIEW:
+            sql = sql[:SQL_PREVIEW] + '...'
+        self.stdout.write(f"   {sql}")
+        self.stdout.write("   views: " + ', '.join(f'{view} ({n})' for view, n in group['views'].most_common()))
+        for location, n in group['locations'].most_common(1 if verbosity < 2 else None):
+            self.stdout.write(f"   from:  {location} ({n})")
+        for detail in group['plan']:
+            self.stdout.write(f"   plan:  {detail}")
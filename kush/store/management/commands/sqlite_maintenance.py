@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from store.db import CHECKPOINT_MODES, WRITE_ALIAS, maintain
+
+
+class Command(BaseCommand):
+    help = "Run ANALYZE, PRAGMA optimize and a WAL checkpoint on the SQLite database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-analyze', action='store_true', help="Skip the full ANALYZE.")
+        parser.add_argument('--no-optimize', action='store_true', help="Skip PRAGMA optimize.")
+        parser.add_argument(
+            '--checkpoint', default='TRUNCATE', choices=[*CHECKPOINT_MODES, 'NONE'], type=str.upper,
+            help="WAL checkpoint mode (default TRUNCATE; NONE to skip).",
+        )
+        parser.add_argument('--database', default=WRITE_ALIAS, help="Database alias (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections:
+            raise CommandError(f"Unknown database alias {alias!r}.")
+        if connections[alias].vendor != 'sqlite':
+            raise CommandError(f"{alias!r} is not a SQLite database.")
+
+        checkpoint = None if options['checkpoint'] == 'NONE' else options['checkpoint']
+        report = maintain(
+            analyze=not options['no_analyze'],
+            optimize=not options['no_optimize'],
+            checkpoint=checkpoint,
+            using=alias,
+        )
+
+        done = [step.upper() for step in ('analyze', 'optimize') if report.get(step)]
+        if 'checkpoint' in report:
+            result = report['checkpoint']
+            done.append(f"checkpoint {result['mode']} ({result['checkpointed']}/{result['wal_pages']} WAL pages"
+                        f"{', busy' if result['busy'] else ''})")
+        self.stdout.write(f"journal_mode={report['journal_mode']}, {report['pages']} pages, "
+                          f"{report['free_pages']} free")
+        self.stdout.write(self.style.SUCCESS("Done: " + (', '.join(done) or 'nothing to do') + "."))
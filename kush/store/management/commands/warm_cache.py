@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmark import percentile
+from store.warmup import (
+    DEFAULT_PARALLEL, DEFAULT_TIMEOUT, DEFAULT_TOP_CLOTHES, cache_is_shared, compile_templates, fetch_in_process,
+    http_fetcher, open_databases, warm, warm_paths,
+)
+
+
+class Command(BaseCommand):
+    help = "Render the landing, about, category and most-liked cloth pages once so the first visitors find them warm."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Warm the running site at this base URL (e.g. http://127.0.0.1:8000) "
+                                          "instead of this process.")
+        parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLEL,
+                            help="Requests in flight at once (default %(default)s).")
+        parser.add_argument('--top', type=int, default=DEFAULT_TOP_CLOTHES,
+                            help="Number of most-liked cloth pages to warm (default %(default)s).")
+        parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                            help="Seconds to wait for each page with --url (default %(default)s).")
+        parser.add_argument('--verify', action='store_true',
+                            help="Fetch every page a second time and report how fast the warm pages are.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['parallel'] < 1 or options['top'] < 0:
+            raise CommandError("--parallel must be at least 1 and --top at least 0.")
+
+        if options['url']:
+            fetch = http_fetcher(options['url'])
+        else:
+            fetch = fetch_in_process
+            if not cache_is_shared():
+                self.stderr.write(self.style.WARNING(
+                    "The cache backend is private to this process, so only this run benefits; "
+                    "use --url to warm the running site."
+                ))
+            for alias, seconds in open_databases().items():
+                self.stdout.write(f"Opened database {alias!r} in {seconds * 1000:.1f} ms")
+            count, seconds = compile_templates()
+            self.stdout.write(f"Compiled {count} template(s) in {seconds * 1000:.1f} ms")
+
+        paths = warm_paths(options['top'])
+
+        def progress(result):
+            if self.verbosity >= 2 or result['error'] or (result['status'] or 500) >= 400:
+                line = f"{result['status'] or '---'} {result['ms']:>9.1f} ms {result['bytes']:>9} B  {result['path']}"
+                if result['error']:
+                    line += f"  {result['error']}"
+                self.stdout.write(line)
+
+        cold = self.run_pass(paths, fetch, options, progress, "Warmed")
+        if options['verify']:
+            warm_results = self.run_pass(paths, fetch, options, None, "Verified")
+            self.stdout.write(f"p50 {self.p50(cold):.1f} ms cold -> {self.p50(warm_results):.1f} ms warm")
+
+    def run_pass(self, paths, fetch, options, progress, label):
+        results = warm(paths, fetch=fetch, parallel=options['parallel'], timeout=options['timeout'],
+                       progress=progress)
+        failed = [r for r in results if r['error'] or (r['status'] or 500) >= 400]
+        total = sum(r['ms'] for r in results)
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{label} {len(results) - len(failed)}/{len(results)} page(s): p50 {self.p50(results):.1f} ms, "
+            f"slowest {max((r['ms'] for r in results), default=0):.1f} ms, {total:.0f} ms in total."
+        ))
+        return results
+
+    @staticmethod
+    def p50(results):
+        return percentile([r['ms'] for r in results], 50) if results else 0
@@ -0,0 +1,173 @@
+"""
+Serving uploaded media (``MEDIA_URL``) in every environment.
+
+``serve`` validates the request in Python and then hands the bytes to
+whichever is cheapest:
+
+* ``STORE_MEDIA_OFFLOAD = 'x-accel-redirect'``: reply with an empty body
+  and an ``X-Accel-Redirect`` header pointing at an ``internal`` nginx
+  location, so nginx streams the file (with its own Range and conditional
+  handling) and the worker is free immediately::
+
+      location /protected-media/ {
+          internal;
+          alias /srv/kush/media/;
+      }
+
+* ``STORE_MEDIA_OFFLOAD = 'x-sendfile'``: the same with an ``X-Sendfile``
+  header carrying the absolute path, for Apache mod_xsendfile / lighttpd.
+
+* No offload: a ``FileResponse``. Whole files go through the WSGI server's
+  ``wsgi.file_wrapper``, which uses ``sendfile()`` where the server supports
+  it; single byte ranges are streamed from an offset.
+
+Either way the response carries an ``ETag`` (size and mtime), a
+``Last-Modified`` and ``Cache-Control: public, max-age=STORE_MEDIA_MAX_AGE``,
+and ``If-None-Match``/``If-Modified-Since`` revalidations get a 304 without
+touching the file. Media names are not content-hashed (the importer
+overwrites files in place), so they are revalidated rather than immutable.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+DEFAULT_MEDIA_MAX_AGE = 24 * 60 * 60
+DEFAULT_ACCEL_PREFIX = '/protected-media/'
+
+OFFLOAD_MODES = ('x-accel-redirect', 'x-sendfile')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    The (start, end) byte offsets (inclusive) asked for by a single-range
+    ``Range`` header, None when the header is absent or not one we serve
+    (multiple ranges, other units) and ``ValueError`` when unsatisfiable.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError
+    return start, end
+
+
+def range_is_current(request, etag, mtime):
+    """If-Range: only honour Range when the client's copy is still current."""
+    validator = request.headers.get('If-Range')
+    if not validator:
+        return True
+    if validator.startswith(('"', 'W/')):
+        return validator == etag
+    since = parse_http_date_safe(validator)
+    return since is not None and int(mtime) <= since
+
+
+class FileRange:
+    """Read at most `length` bytes of `file` from `start` (for FileResponse)."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def offload_response(fullpath, path, content_type):
+    mode = getattr(settings, 'STORE_MEDIA_OFFLOAD', None)
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'STORE_MEDIA_ACCEL_PREFIX', DEFAULT_ACCEL_PREFIX)
+        response['X-Accel-Redirect'] = prefix + quote(path)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+def file_response(request, fullpath, stat, etag, content_type):
+    try:
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range and not range_is_current(request, etag, stat.st_mtime):
+        byte_range = None
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """Serve one file from MEDIA_ROOT (see the module docstring)."""
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except Exception:  # SuspiciousFileOperation for ../ and absolute paths
+        raise Http404
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    etag = media_etag(stat)
+    max_age = getattr(settings, 'STORE_MEDIA_MAX_AGE', DEFAULT_MEDIA_MAX_AGE)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': f'public, max-age={max_age}',
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type, _ = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+        if getattr(settings, 'STORE_MEDIA_OFFLOAD', None) in OFFLOAD_MODES:
+            response = offload_response(fullpath, path, content_type)
+        else:
+            response = file_response(request, fullpath, stat, etag, content_type)
+    if response.status_code != 416:
+        for header, value in headers.items():
+            response[header] = value
+    return response
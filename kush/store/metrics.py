@@ -0,0 +1,310 @@
+"""
+Request instrumentation: where the time goes, per request and per view.
+
+``MetricsMiddleware`` times every request and collects, while it runs:
+
+    db     number of queries and time spent in them (every alias)
+    tpl    time spent rendering templates (queries run by lazy querysets
+           inside a template count towards both)
+    img    time spent building image URLs (store/templatetags/store_images.py)
+
+It reports them in a ``Server-Timing`` header (readable in the browser's
+network panel) and adds the total to a per-view ``ViewStats``. That keeps
+the last ``STORE_METRICS_WINDOW`` latencies for p50/p95/p99 and cumulative
+Prometheus-style histogram buckets.
+
+The header tells whoever reads it how many queries a page ran and how long
+they took, so it is only sent with DEBUG on or to staff. Users are only
+loaded on the session-bound /manager/ and /admin/ paths
+(store/middleware.py), so staff see it there and not on public pages. The staff-only view at
+``/manager/metrics/`` shows them as JSON, or as Prometheus text with
+``?format=prometheus``.
+
+Collection costs a few ``perf_counter()`` calls and a context-variable
+lookup per query and per template render, so it is meant to stay on. Stats
+live in process memory: each worker process reports only the requests it
+served. Set ``STORE_METRICS = False`` to switch it all off, or
+``STORE_SERVER_TIMING = False`` to keep the figures but never send the
+header.
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+DEFAULT_WINDOW = 1000
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (50, 95, 99)
+
+# Name used for requests that matched no URL pattern
+UNMATCHED = '<unmatched>'
+
+
+def enabled():
+    return getattr(settings, 'STORE_METRICS', True)
+
+
+# ----- Per request -----
+
+class RequestMetrics:
+    __slots__ = ('request', 'queries', 'db', 'templates', 'images')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.images = 0.0
+
+
+_current = contextvars.ContextVar('store_request_metrics', default=None)
+
+
+def current():
+    """The RequestMetrics of the request being served, or None."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper (see install_query_timer)."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver: time every query on this connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(part):
+    """Add the time spent in the block to the current request's `part` ('templates' or 'images')."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(metrics, part, getattr(metrics, part) + time.perf_counter() - start)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('templates'):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time counted per request."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+# ----- Per view -----
+
+class ViewStats:
+    """Latency figures for one view: a rolling window plus cumulative histogram."""
+
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds, metrics):
+        with self.lock:
+            self.recent.append(seconds)
+            index = bisect.bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS):
+                self.buckets[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.queries += metrics.queries
+            self.db += metrics.db
+            self.templates += metrics.templates
+
+    def snapshot(self):
+        with self.lock:
+            recent = list(self.recent)
+            snapshot = {
+                'count': self.count,
+                'total_seconds': self.total,
+                'queries': self.queries,
+                'db_seconds': self.db,
+                'template_seconds': self.templates,
+                'buckets': list(self.buckets),
+            }
+        recent.sort()
+        for q in QUANTILES:
+            # Nearest rank, as in store/benchmark.py
+            rank = max(math.ceil(q / 100 * len(recent)) - 1, 0)
+            snapshot[f'p{q}_ms'] = round(recent[rank] * 1000, 3) if recent else None
+        snapshot['window'] = len(recent)
+        return snapshot
+
+
+class Registry:
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, seconds, metrics):
+        stats = self.views.get(view)
+        if stats is None:
+            with self.lock:
+                window = getattr(settings, 'STORE_METRICS_WINDOW', DEFAULT_WINDOW)
+                stats = self.views.setdefault(view, ViewStats(window))
+        stats.add(seconds, metrics)
+
+    def snapshot(self):
+        return {view: stats.snapshot() for view, stats in sorted(self.views.items())}
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+registry = Registry()
+
+
+def view_name(request):
+    """The URL name of the view serving `request` (UNMATCHED before URL resolution)."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNMATCHED
+
+
+# ----- Middleware -----
+
+def server_timing(metrics, total):
+    return (
+        f'db;dur={metrics.db * 1000:.1f};desc="{metrics.queries} queries", '
+        f'tpl;dur={metrics.templates * 1000:.1f}, '
+        f'img;dur={metrics.images * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+
+class MetricsMiddleware:
+    """Time each request (sync or async); see the module docstring."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        metrics, token, start = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timing = self.finish(request, response, metrics, start)
+        if timing and (settings.DEBUG or hasattr(request, 'user') and request.user.is_staff):
+            response['Server-Timing'] = timing
+        return response
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        metrics, token, start = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        timing = self.finish(request, response, metrics, start)
+        # auser(): loading the session user is a query, which must not run on the event loop
+        if timing and (settings.DEBUG or hasattr(request, 'auser') and (await request.auser()).is_staff):
+            response['Server-Timing'] = timing
+        return response
+
+    def start(self, request):
+        metrics = RequestMetrics(request)
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def finish(self, request, response, metrics, start):
+        """Record the request; returns its Server-Timing value, or None when the header is off."""
+        # Streaming bodies are produced after this point and are not counted
+        total = time.perf_counter() - start
+        registry.observe(view_name(request), total, metrics)
+        if getattr(settings, 'STORE_SERVER_TIMING', True):
+            return server_timing(metrics, total)
+        return None
+
+
+# ----- Export -----
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"')) for k, v in labels.items())
+
+
+def prometheus_text(snapshot=None):
+    """The registry in the Prometheus text exposition format."""
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    lines = [
+        '# HELP store_request_duration_seconds Time to produce a response, by view.',
+        '# TYPE store_request_duration_seconds histogram',
+    ]
+    for view, stats in snapshot.items():
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(f'store_request_duration_seconds_bucket{{{_labels(view=view, le=bound)}}} {cumulative}')
+        lines.append(f'store_request_duration_seconds_bucket{{{_labels(view=view, le="+Inf")}}} {stats["count"]}')
+        lines.append(f'store_request_duration_seconds_sum{{{_labels(view=view)}}} {stats["total_seconds"]:.6f}')
+        lines.append(f'store_request_duration_seconds_count{{{_labels(view=view)}}} {stats["count"]}')
+
+    lines += [
+        '# HELP store_request_recent_seconds Latency quantiles over the last STORE_METRICS_WINDOW requests.',
+        '# TYPE store_request_recent_seconds gauge',
+    ]
+    for view, stats in snapshot.items():
+        for q in QUANTILES:
+            if stats[f'p{q}_ms'] is not None:
+                labels = _labels(view=view, quantile=q / 100)
+                lines.append(f'store_request_recent_seconds{{{labels}}} {stats[f"p{q}_ms"] / 1000:.6f}')
+
+    for name, key, help_text in (
+        ('store_db_queries_total', 'queries', 'Database queries run, by view.'),
+        ('store_db_seconds_total', 'db_seconds', 'Time spent in database queries, by view.'),
+        ('store_template_seconds_total', 'template_seconds', 'Time spent rendering templates, by view.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for view, stats in snapshot.items():
+            value = stats[key]
+            lines.append(f'{name}{{{_labels(view=view)}}} {value if isinstance(value, int) else f"{value:.6f}"}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+"""
+A lean request path for the public pages.
+
+Sessions, logins and flash messages are only used by the manager pages and
+the admin, yet ``SessionMiddleware``, ``AuthenticationMiddleware`` and
+``MessageMiddleware`` run on every request. For a visitor who still has a
+``sessionid`` cookie (a manager browsing the shop, or a stale cookie), every
+public page then loads the session row and the user before the page cache is
+even consulted.
+
+The subclasses below are drop-in replacements for those three. On paths
+outside ``STORE_SESSION_PATHS`` they step aside. Nothing is read from or
+written to the session, ``request.user`` is an ``AnonymousUser`` without a
+database lookup, and no message storage is created. The ``auth`` and
+``messages`` context processors then have nothing to load either. Public
+pages therefore look the same to every visitor, which is also what the page
+cache assumes.
+
+Set ``STORE_LEAN_PUBLIC_PAGES = False`` to run the full stack everywhere.
+"""
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+
+DEFAULT_SESSION_PATHS = ('/manager/', '/admin/')
+
+
+def needs_session(request):
+    """Whether `request` gets sessions, authentication and messages."""
+    if not getattr(settings, 'STORE_LEAN_PUBLIC_PAGES', True):
+        return True
+    return request.path_info.startswith(tuple(getattr(settings, 'STORE_SESSION_PATHS', DEFAULT_SESSION_PATHS)))
+
+
+class LeanPathMixin:
+    """Skip this middleware (sync or async) on paths that do not need a session."""
+
+    def __call__(self, request):
+        if needs_session(request):
+            return super().__call__(request)
+        self.skip(request)
+        return self.get_response(request)
+
+    def skip(self, request):
+        pass
+
+
+class SessionMiddleware(LeanPathMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+async def _anonymous():
+    return AnonymousUser()
+
+
+class AuthenticationMiddleware(LeanPathMixin, auth_middleware.AuthenticationMiddleware):
+    def skip(self, request):
+        request.user = AnonymousUser()
+        request.auser = _anonymous
+
+
+class MessageMiddleware(LeanPathMixin, messages_middleware.MessageMiddleware):
+    pass
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_siterating_sitereview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloth',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
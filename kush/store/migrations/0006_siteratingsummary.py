@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:36
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_summary(apps, schema_editor):
+    SiteRating = apps.get_model('store', 'SiteRating')
+    SiteRatingSummary = apps.get_model('store', 'SiteRatingSummary')
+    histogram = dict(SiteRating.objects.order_by().values_list('rating').annotate(n=Count('id')))
+    values = {f'stars_{i}': histogram.get(i, 0) for i in range(1, 6)}
+    SiteRatingSummary.objects.create(
+        pk=1,
+        count=sum(histogram.values()),
+        total=sum(stars * n for stars, n in histogram.items()),
+        **values,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_cloth_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteRatingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0, help_text='Sum of all ratings')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Site Rating Summary',
+                'verbose_name_plural': 'Site Rating Summary',
+            },
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
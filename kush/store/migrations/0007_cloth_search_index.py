@@ -0,0 +1,80 @@
+from django.db import migrations
+
+# FTS5 index over Cloth.name, Cloth.description and the category name, keyed
+# by cloth id (rowid). Triggers keep it in sync for every write path,
+# including bulk_create() and QuerySet.update(). See store/search.py.
+TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS store_cloth_fts USING fts5(
+        name, description, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS store_cloth_fts_insert AFTER INSERT ON store_cloth BEGIN
+        INSERT INTO store_cloth_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description,
+                (SELECT name FROM store_category WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS store_cloth_fts_update
+    AFTER UPDATE OF name, description, category_id ON store_cloth BEGIN
+        UPDATE store_cloth_fts
+        SET name = new.name,
+            description = new.description,
+            category = (SELECT name FROM store_category WHERE id = new.category_id)
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS store_cloth_fts_delete AFTER DELETE ON store_cloth BEGIN
+        DELETE FROM store_cloth_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS store_category_fts_update AFTER UPDATE OF name ON store_category BEGIN
+        UPDATE store_cloth_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM store_cloth WHERE category_id = new.id);
+    END
+    """,
+]
+
+POPULATE_SQL = """
+    INSERT INTO store_cloth_fts (rowid, name, description, category)
+    SELECT store_cloth.id, store_cloth.name, store_cloth.description, store_category.name
+    FROM store_cloth JOIN store_category ON store_category.id = store_cloth.category_id
+"""
+
+DROP_TRIGGER_SQL = [
+    "DROP TRIGGER IF EXISTS store_category_fts_update",
+    "DROP TRIGGER IF EXISTS store_cloth_fts_delete",
+    "DROP TRIGGER IF EXISTS store_cloth_fts_update",
+    "DROP TRIGGER IF EXISTS store_cloth_fts_insert",
+]
+
+CREATE_SQL = [TABLE_SQL, *TRIGGER_SQL, POPULATE_SQL]
+DROP_SQL = [*DROP_TRIGGER_SQL, "DROP TABLE IF EXISTS store_cloth_fts"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Other databases fall back to LIKE queries in store/search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_siteratingsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,64 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import slugify
+
+# SQLite adds the unique constraint by rebuilding store_category, which
+# fails while the search triggers from 0007 reference the table, so they
+# are dropped for the rebuild and recreated afterwards.
+search_index = import_module('store.migrations.0007_cloth_search_index')
+
+
+def fill_slugs(apps, schema_editor):
+    """Give every category a slug, de-duplicating with -2, -3, ... suffixes."""
+    Category = apps.get_model('store', 'Category')
+    taken = set()
+    for category in Category.objects.order_by('id'):
+        base = category.slug or slugify(category.name)[:90] or 'category'
+        slug, n = base, 2
+        while slug in taken:
+            slug, n = f'{base}-{n}', n + 1
+        taken.add(slug)
+        if slug != category.slug:
+            Category.objects.filter(pk=category.pk).update(slug=slug)
+
+
+drop_triggers = search_index.run(search_index.DROP_TRIGGER_SQL)
+create_triggers = search_index.run(search_index.TRIGGER_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_cloth_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_slugs, migrations.RunPython.noop),
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=100, unique=True),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.AddIndex(
+            model_name='cloth',
+            index=models.Index(fields=['status', 'created_at'], name='store_cloth_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='cloth',
+            index=models.Index(fields=['manager', 'status'], name='store_cloth_manager_status'),
+        ),
+        migrations.AddIndex(
+            model_name='cloth',
+            index=models.Index(fields=['created_at'], name='store_cloth_created'),
+        ),
+        migrations.AddIndex(
+            model_name='sitereview',
+            index=models.Index(condition=models.Q(is_approved=True), fields=['created_at'],
+                               name='store_review_approved_created'),
+        ),
+    ]
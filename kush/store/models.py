@@ -1,18 +1,30 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
-    slug = models.SlugField(max_length=100, blank=True, null=True)
+    slug = models.SlugField(max_length=100, unique=True, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = self.unique_slug(self.name, exclude_pk=self.pk)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def unique_slug(cls, name, exclude_pk=None):
+        """slugify(name), suffixed with -2, -3, ... if another category already has it."""
+        base = slugify(name)[:90] or 'category'
+        taken = set(cls.objects.exclude(pk=exclude_pk).filter(slug__startswith=base).values_list('slug', flat=True))
+        slug, n = base, 2
+        while slug in taken:
+            slug, n = f'{base}-{n}', n + 1
+        return slug
+
     def __str__(self):
         return self.name
     
@@ -38,16 +50,37 @@ class Cloth(models.Model):
     image_left = models.ImageField(upload_to='clothes/left/', blank=True, null=True)
     image_right = models.ImageField(upload_to='clothes/right/', blank=True, null=True)
 
+    # Resized WebP/JPEG copies of the images above, keyed by field name (see store/images.py)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     # Likes counter (anonymous)
     likes = models.PositiveIntegerField(default=0)
 
+    # Stock code from the intake manifest; makes import_catalogue re-runs idempotent
+    sku = models.CharField(max_length=64, blank=True, null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # cloth_list and the API's status filter, newest first
+            models.Index(fields=['status', 'created_at'], name='store_cloth_status_created'),
+            # manager_dashboard: one manager's clothes and per-status counts
+            models.Index(fields=['manager', 'status'], name='store_cloth_manager_status'),
+            # API keyset pagination on (created_at, id); SQLite appends the rowid
+            models.Index(fields=['created_at'], name='store_cloth_created'),
+        ]
+        constraints = [
+            # Conditional so SQLite adds it as a unique index instead of
+            # rebuilding the table (which would drop the search triggers)
+            models.UniqueConstraint(fields=['sku'], condition=models.Q(sku__isnull=False),
+                                    name='store_cloth_unique_sku'),
+        ]
+
 class ManagerProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -71,6 +104,69 @@ class SiteRating(models.Model):
         verbose_name_plural = "Site Ratings"
 
 
+class SiteRatingSummary(models.Model):
+    """
+    Running histogram of SiteRating, kept in a single row so pages can show
+    the average and total without scanning the ratings table.
+
+    Updated in the same transaction as each rating insert/delete; run
+    ``manage.py rebuild_rating_summary`` to repair it.
+    """
+    SINGLETON_ID = 1
+
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0, help_text="Sum of all ratings")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.count} ratings, average {self.average}"
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 1) if self.count else 0
+
+    @classmethod
+    def stats(cls):
+        """Average and total for templates/JSON, in one primary-key lookup."""
+        summary = cls.objects.filter(pk=cls.SINGLETON_ID).first()
+        if summary is None:
+            summary = cls.rebuild()
+        return {'average_rating': summary.average, 'total_ratings': summary.count}
+
+    @classmethod
+    def apply(cls, rating, delta=1):
+        """Add (or with delta=-1 remove) one rating of `rating` stars."""
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(**{
+            f'stars_{rating}': F(f'stars_{rating}') + delta,
+            'count': F('count') + delta,
+            'total': F('total') + delta * rating,
+        })
+        if not updated:
+            cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the summary from the SiteRating table."""
+        with transaction.atomic():
+            histogram = dict(
+                SiteRating.objects.order_by().values_list('rating').annotate(n=Count('id'))
+            )
+            values = {f'stars_{i}': histogram.get(i, 0) for i in range(1, 6)}
+            values['count'] = sum(histogram.values())
+            values['total'] = sum(stars * n for stars, n in histogram.items())
+            summary, _ = cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=values)
+        return summary
+
+    class Meta:
+        verbose_name = "Site Rating Summary"
+        verbose_name_plural = "Site Rating Summary"
+
+
 class SiteReview(models.Model):
     """Written reviews from customers"""
     name = models.CharField(max_length=100, help_text="Customer's name")
@@ -87,3 +183,54 @@ class SiteReview(models.Model):
         ordering = ['-created_at']
         verbose_name = "Site Review"
         verbose_name_plural = "Site Reviews"
+        indexes = [
+            # The "recent approved reviews" list on every public page. Partial
+            # rather than (is_approved, created_at): Django filters booleans on
+            # SQLite as a bare `WHERE "is_approved"`, which cannot use a
+            # composite index but does match this index's condition.
+            models.Index(fields=['created_at'], condition=models.Q(is_approved=True),
+                         name='store_review_approved_created'),
+        ]
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email waiting in the outbox.
+
+    Requests only insert rows; ``manage.py send_outbox`` delivers them (see
+    store/outbox.py), so a slow or unreachable mail server never holds up a
+    request.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Failed permanently'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list, help_text="Recipient addresses")
+    reply_to = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="Not retried before this time")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.subject} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Outgoing Email"
+        verbose_name_plural = "Outgoing Emails"
+        indexes = [
+            # The worker's "due pending messages" scan
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='pending'),
+                         name='store_outbox_due'),
+        ]
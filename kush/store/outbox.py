@@ -0,0 +1,196 @@
+"""
+Transactional outbox for email.
+
+Views call ``enqueue`` (or ``aenqueue``), which only inserts an
+``OutgoingEmail`` row, so a request never waits for the mail server.
+``manage.py send_outbox`` then delivers what is due, in batches that share
+one SMTP connection (one handshake and TLS negotiation per batch, not per
+message).
+
+A message that fails to send is retried after ``STORE_OUTBOX_RETRY_DELAY``
+seconds, doubling with each further attempt up to ``STORE_OUTBOX_MAX_DELAY``.
+After ``STORE_OUTBOX_MAX_ATTEMPTS`` attempts it is marked dead and left for a
+person to look at. Permanent failures (a 5xx reply, such as an unknown
+recipient, or a message that cannot be built) are marked dead straight
+away; ``send_outbox --retry-dead`` (or the admin action) queues
+it again. When the mail server cannot be reached at all, the batch is put
+back without using up an attempt: an outage, however long, is nobody's
+message's fault, and the messages go out once the server is back.
+
+A worker claims a batch by pushing its ``next_attempt_at`` forward by
+``CLAIM_SECONDS`` before sending. Two workers never pick up the same
+messages, and messages held by a worker that died become due again once the
+claim expires. Delivery is therefore at least once: a crash between the SMTP
+``DATA`` command and the status update sends that message twice.
+"""
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import BadHeaderError, EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_RETRY_DELAY = 60
+DEFAULT_MAX_DELAY = 6 * 60 * 60
+
+# How long a worker may hold a batch before others consider it abandoned
+CLAIM_SECONDS = 10 * 60
+
+# Longest error text kept on a message
+MAX_ERROR_LENGTH = 2000
+
+
+def enqueue(subject, body, to, from_email=None, reply_to=()):
+    """Queue one email for send_outbox; returns the OutgoingEmail."""
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        reply_to=list(reply_to),
+    )
+
+
+async def aenqueue(subject, body, to, from_email=None, reply_to=()):
+    """enqueue() for async views."""
+    return await OutgoingEmail.objects.acreate(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        reply_to=list(reply_to),
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the `attempts`-th failed attempt."""
+    base = getattr(settings, 'STORE_OUTBOX_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    cap = getattr(settings, 'STORE_OUTBOX_MAX_DELAY', DEFAULT_MAX_DELAY)
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+
+def claim(batch_size, now=None):
+    """Reserve up to `batch_size` due messages for this worker and return them, oldest first."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutgoingEmail.objects
+            .filter(status=OutgoingEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return list(OutgoingEmail.objects.filter(id__in=ids).order_by('next_attempt_at', 'id'))
+
+
+def is_permanent(error):
+    """Whether retrying cannot help: the server said 5xx, or the message itself is unusable."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return isinstance(error, (BadHeaderError, ValueError))
+
+
+def _failed(message, error, now, permanent=False):
+    max_attempts = getattr(settings, 'STORE_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    message.attempts += 1
+    message.last_error = f'{type(error).__name__}: {error}'[:MAX_ERROR_LENGTH]
+    if message.attempts >= max_attempts or permanent:
+        message.status = OutgoingEmail.DEAD
+    else:
+        message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+    message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def _deferred(message, error, now):
+    """Put `message` back after a connection failure, keeping its attempts."""
+    message.last_error = f'{type(error).__name__}: {error}'[:MAX_ERROR_LENGTH]
+    message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+    message.save(update_fields=['last_error', 'next_attempt_at'])
+
+
+def send_batch(batch_size=None, connection=None):
+    """
+    Send one batch of due messages over a single connection.
+
+    Returns ``{'sent': n, 'retry': n, 'dead': n}``.
+    """
+    batch_size = batch_size or getattr(settings, 'STORE_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    messages = claim(batch_size)
+    counts = {'sent': 0, 'retry': 0, 'dead': 0}
+    if not messages:
+        return counts
+
+    def failed(message, error, permanent=False):
+        _failed(message, error, timezone.now(), permanent)
+        counts['dead' if message.status == OutgoingEmail.DEAD else 'retry'] += 1
+
+    connection = connection or get_connection()
+    try:
+        for index, message in enumerate(messages):
+            try:
+                # A no-op while the connection is up; reconnects after a failure below
+                connection.open()
+            except Exception as e:
+                # Server unreachable or refusing us (even with a 5xx, e.g. bad
+                # credentials): not the messages' fault, so they are retried
+                # without counting an attempt
+                for unsent in messages[index:]:
+                    _deferred(unsent, e, timezone.now())
+                    counts['retry'] += 1
+                break
+            email = EmailMessage(
+                subject=message.subject,
+                body=message.body,
+                from_email=message.from_email or None,
+                to=message.to,
+                reply_to=message.reply_to or None,
+                connection=connection,
+            )
+            try:
+                if not email.send(fail_silently=False):
+                    raise ValueError("No recipients")
+            except Exception as e:
+                failed(message, e, is_permanent(e))
+                # The server may have dropped us mid-conversation
+                connection.close()
+                continue
+            message.status = OutgoingEmail.SENT
+            message.attempts += 1
+            message.sent_at = timezone.now()
+            message.last_error = ''
+            message.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+            counts['sent'] += 1
+    finally:
+        connection.close()
+    return counts
+
+
+def drain(batch_size=None, max_batches=None):
+    """send_batch() until nothing is due (or `max_batches` ran); returns the summed counts."""
+    totals = {'sent': 0, 'retry': 0, 'dead': 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = send_batch(batch_size)
+        batches += 1
+        for key, value in counts.items():
+            totals[key] += value
+        if not any(counts.values()):
+            break
+    return totals
+
+
+def requeue_dead(queryset=None):
+    """Give dead messages a fresh set of attempts; returns how many were queued."""
+    queryset = OutgoingEmail.objects.all() if queryset is None else queryset
+    return queryset.filter(status=OutgoingEmail.DEAD).update(
+        status=OutgoingEmail.PENDING, attempts=0, next_attempt_at=timezone.now(),
+    )
@@ -0,0 +1,247 @@
+"""
+Per-IP rate limiting and duplicate suppression for the anonymous write
+endpoints (likes, ratings, reviews, contact messages).
+
+Policies live in ``settings.STORE_RATE_LIMITS``::
+
+    STORE_RATE_LIMITS = {
+        'rating': {'rate': '5/h', 'dedupe': 24 * 60 * 60},
+        ...
+    }
+
+``rate`` is a sliding-window limit, ``'<requests>/<period>'``, where the
+period is ``s``, ``m``, ``h`` or ``d`` with an optional multiplier
+(``'10/5m'``). It is approximated with two fixed-window counters in the
+cache: the previous window's count, weighted by how much of it still
+overlaps the sliding window, plus the current count. Every attempt counts,
+rejected ones included, so a client that keeps hammering stays blocked.
+
+``dedupe`` is the number of seconds during which the same request from
+the same IP is refused. The view decides what makes two requests "the
+same", for example one rating per IP, or the same review text. The key is
+claimed with ``cache.add`` before the view runs and released again if the
+view fails, so only requests that succeeded block their duplicates.
+
+Rejected requests get a 429 with ``Retry-After``. Nothing here touches the
+database. A policy that is missing from the setting is not limited.
+
+Counters live in the default cache, so they are per process on the
+local-memory backend. Async views use the cache's async methods (``aadd``,
+``aincr``...), so a file-based or networked cache does not block the event
+loop. Use a shared cache (file-based, Redis, memcached) to
+limit across worker processes.
+"""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+DEFAULT_TRUSTED_PROXIES = ('127.0.0.1', '::1')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+def parse_rate(rate):
+    """'5/h' -> (5, 3600); '10/5m' -> (10, 300)."""
+    match = RATE_RE.match(rate.replace(' ', ''))
+    if not match:
+        raise ValueError(f"Invalid rate {rate!r}; use '<requests>/<period>', e.g. '5/h' or '10/5m'")
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[unit]
+
+
+def get_policy(name):
+    return getattr(settings, 'STORE_RATE_LIMITS', {}).get(name)
+
+
+def client_ip(request):
+    """
+    The caller's IP address.
+
+    ``X-Forwarded-For`` is only believed when the request comes from a
+    trusted proxy (``STORE_TRUSTED_PROXIES``). The client is then the
+    right-most address that is not itself a trusted proxy, so a client
+    cannot dodge its limits by sending a made-up header.
+    """
+    remote = request.META.get('REMOTE_ADDR', '')
+    trusted = getattr(settings, 'STORE_TRUSTED_PROXIES', DEFAULT_TRUSTED_PROXIES)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if not forwarded or remote not in trusted:
+        return remote
+    for address in reversed([a.strip() for a in forwarded.split(',') if a.strip()]):
+        if address not in trusted:
+            return address
+    return remote
+
+
+def _key(*parts):
+    return 'store:ratelimit:' + ':'.join(str(part) for part in parts)
+
+
+def hit(name, ident, limit, period, now=None):
+    """
+    Count one request by `ident` against the policy.
+
+    Returns 0 when it is allowed, otherwise the seconds to wait.
+    """
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    current_key = _key(name, ident, int(window))
+
+    cache.add(current_key, 0, period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(current_key, 1, period * 2)
+        current = 1
+    previous = cache.get(_key(name, ident, int(window) - 1), 0)
+    return _retry_after(limit, period, elapsed, previous, current)
+
+
+async def ahit(name, ident, limit, period, now=None):
+    """hit() for async views, without blocking the event loop on the cache."""
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    current_key = _key(name, ident, int(window))
+
+    await cache.aadd(current_key, 0, period * 2)
+    try:
+        current = await cache.aincr(current_key)
+    except ValueError:
+        await cache.aset(current_key, 1, period * 2)
+        current = 1
+    previous = await cache.aget(_key(name, ident, int(window) - 1), 0)
+    return _retry_after(limit, period, elapsed, previous, current)
+
+
+def _retry_after(limit, period, elapsed, previous, current):
+    remaining_weight = (period - elapsed) / period
+    if previous * remaining_weight + current <= limit:
+        return 0
+    if current > limit or not previous:
+        # Blocked at least until this window ends
+        return max(1, math.ceil(period - elapsed))
+    # Until enough of the previous window has slid out
+    wait = (period - elapsed) - (limit - current) * period / previous
+    return max(1, math.ceil(wait))
+
+
+def _claim_key(name, key):
+    return _key(name, 'dedupe', hashlib.sha1(key.encode()).hexdigest())
+
+
+def claim(name, key, seconds, now=None):
+    """
+    Claim `key` for `seconds`. Returns (claim key, 0), or (None, seconds to
+    wait) if the same key was claimed already.
+    """
+    now = time.time() if now is None else now
+    claim_key = _claim_key(name, key)
+    if cache.add(claim_key, now + seconds, seconds):
+        return claim_key, 0
+    expires = cache.get(claim_key, now + seconds)
+    return None, max(1, math.ceil(expires - now))
+
+
+async def aclaim(name, key, seconds, now=None):
+    """claim() for async views."""
+    now = time.time() if now is None else now
+    claim_key = _claim_key(name, key)
+    if await cache.aadd(claim_key, now + seconds, seconds):
+        return claim_key, 0
+    expires = await cache.aget(claim_key, now + seconds)
+    return None, max(1, math.ceil(expires - now))
+
+
+def too_many_requests(retry_after, message):
+    response = JsonResponse({'success': False, 'error': message}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+RATE_MESSAGE = "Too many requests. Please try again later."
+DUPLICATE_MESSAGE = "You have already done that. Please try again later."
+
+
+def _admit(name, dedupe, request, kwargs):
+    """(rejection response or None, dedupe claim key or None)."""
+    policy = get_policy(name)
+    if not policy:
+        return None, None
+    ip = client_ip(request)
+    if policy.get('rate'):
+        wait = hit(name, ip, *parse_rate(policy['rate']))
+        if wait:
+            return too_many_requests(wait, RATE_MESSAGE), None
+    if dedupe and policy.get('dedupe'):
+        claimed, wait = claim(name, f'{ip}|{dedupe(request, **kwargs)}', policy['dedupe'])
+        if claimed is None:
+            return too_many_requests(wait, DUPLICATE_MESSAGE), None
+        return None, claimed
+    return None, None
+
+
+async def _aadmit(name, dedupe, request, kwargs):
+    """_admit() for async views: the same checks through the cache's async API."""
+    policy = get_policy(name)
+    if not policy:
+        return None, None
+    ip = client_ip(request)
+    if policy.get('rate'):
+        wait = await ahit(name, ip, *parse_rate(policy['rate']))
+        if wait:
+            return too_many_requests(wait, RATE_MESSAGE), None
+    if dedupe and policy.get('dedupe'):
+        claimed, wait = await aclaim(name, f'{ip}|{dedupe(request, **kwargs)}', policy['dedupe'])
+        if claimed is None:
+            return too_many_requests(wait, DUPLICATE_MESSAGE), None
+        return None, claimed
+    return None, None
+
+
+def _settle(claimed, response):
+    # Only successful requests keep their dedupe claim
+    if claimed and response.status_code >= 400:
+        cache.delete(claimed)
+
+
+async def _asettle(claimed, response):
+    if claimed and response.status_code >= 400:
+        await cache.adelete(claimed)
+
+
+def rate_limit(name, dedupe=None):
+    """
+    Apply the ``STORE_RATE_LIMITS[name]`` policy to a view (sync or async).
+
+    `dedupe` is called as ``dedupe(request, **view_kwargs)`` and returns the
+    string that identifies a repeat of this request for the same IP.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                rejected, claimed = await _aadmit(name, dedupe, request, kwargs)
+                if rejected:
+                    return rejected
+                response = await view(request, *args, **kwargs)
+                await _asettle(claimed, response)
+                return response
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                rejected, claimed = _admit(name, dedupe, request, kwargs)
+                if rejected:
+                    return rejected
+                response = view(request, *args, **kwargs)
+                _settle(claimed, response)
+                return response
+        return wrapper
+    return decorator
@@ -0,0 +1,100 @@
+"""
+Product search over the ``store_cloth_fts`` FTS5 index.
+
+The index (created in migration 0007) mirrors ``Cloth.name``,
+``Cloth.description`` and the category name and is kept current by SQLite
+triggers. Queries match every word as a prefix ("red dre" finds "Red
+Dress") and are ranked with bm25, weighting name over category over
+description. On databases without FTS5 we fall back to ``icontains``.
+
+A migration that makes SQLite rebuild ``store_cloth`` or ``store_category``
+must drop the triggers first and recreate them afterwards (see 0008).
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .db import read_connection
+from .models import Cloth
+
+FTS_TABLE = 'store_cloth_fts'
+
+# bm25() column weights: name, description, category
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+
+MAX_TERMS = 8
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """
+    Words from a user query, lower-cased and capped at MAX_TERMS.
+
+    Single letters are dropped: the index keeps 2- and 3-character prefixes,
+    so a one-letter prefix query would scan the whole term list.
+    """
+    return [word.lower() for word in WORD_RE.findall(query or '') if len(word) > 1][:MAX_TERMS]
+
+
+def fts_available(using=None):
+    using = using or read_connection()
+    if using.vendor != 'sqlite':
+        return False
+    with using.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def fts_query(terms):
+    # Quote each word so FTS5 operators (AND, NEAR, ...) are matched literally
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_ids(query, limit=48, offset=0):
+    """Cloth ids matching `query`, best match first."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if not fts_available():
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+        return list(
+            Cloth.objects.filter(condition).order_by('-created_at').values_list('id', flat=True)[offset:offset + limit]
+        )
+
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    with read_connection().cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+            [fts_query(terms), limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_clothes(query, limit=48, offset=0, queryset=None):
+    """Cloth objects matching `query` in rank order."""
+    ids = search_ids(query, limit, offset)
+    if queryset is None:
+        queryset = Cloth.objects.select_related('category')
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def rebuild_index():
+    """Repopulate the FTS index from scratch; returns the number of rows indexed."""
+    if not fts_available(connection):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+            'SELECT store_cloth.id, store_cloth.name, store_cloth.description, store_category.name '
+            'FROM store_cloth JOIN store_category ON store_category.id = store_cloth.category_id'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import Category, Cloth, SiteRating, SiteRatingSummary, SiteReview
+
+
+@receiver(pre_save, sender=SiteRating)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Note the stars an edited rating had (in the admin) so the summary can move it."""
+    instance._previous_rating = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._previous_rating = (
+            SiteRating.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=SiteRating)
+def add_rating_to_summary(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if created:
+        SiteRatingSummary.apply(instance.rating)
+    elif previous is not None and previous != instance.rating:
+        with transaction.atomic():
+            SiteRatingSummary.apply(previous, delta=-1)
+            SiteRatingSummary.apply(instance.rating)
+    cache.bump('ratings')
+
+
+@receiver(post_delete, sender=SiteRating)
+def remove_rating_from_summary(sender, instance, **kwargs):
+    SiteRatingSummary.apply(instance.rating, delta=-1)
+    cache.bump('ratings')
+
+
+# ----- Cache invalidation (see store/cache.py) -----
+
+@receiver(pre_save, sender=Cloth)
+def remember_previous_category(sender, instance, **kwargs):
+    """Note the category a cloth is moving out of so its page is refreshed too."""
+    instance._previous_category_id = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._previous_category_id = (
+            Cloth.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Cloth)
+def invalidate_cloth(sender, instance, **kwargs):
+    category_ids = {instance.category_id, getattr(instance, '_previous_category_id', None)} - {None}
+    slugs = Category.objects.filter(pk__in=category_ids).values_list('slug', flat=True)
+    cache.bump('catalogue', f'cloth:{instance.pk}', *(f'category:{slug}' for slug in slugs))
+
+
+@receiver(pre_save, sender=Category)
+def remember_previous_slug(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._previous_slug = (
+            Category.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    slugs = {instance.slug, getattr(instance, '_previous_slug', None)} - {None}
+    # The JSON API embeds the category name in each cloth
+    cache.bump('catalogue', 'clothes', *(f'category:{slug}' for slug in slugs))
+
+
+@receiver([post_save, post_delete], sender=SiteReview)
+def invalidate_reviews(sender, instance, **kwargs):
+    cache.bump('reviews')
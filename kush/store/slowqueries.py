@@ -0,0 +1,244 @@
+"""
+Slow-query log.
+
+``log_slow_query`` is a database execute wrapper installed on every
+connection, next to the timer in store/metrics.py. A statement that takes
+longer than ``STORE_SLOW_QUERY_MS`` is written to the ``store.slowqueries``
+logger as one JSON object per line (settings.LOGGING sends it to
+``STORE_SLOW_QUERY_LOG``). Each record holds:
+
+    sql          the statement with every literal and parameter replaced by
+                 ``?`` and ``IN (?, ?, ...)`` lists collapsed, so the same
+                 query with other values reads the same
+    fingerprint  a hash of that normalised SQL
+    params       the parameter types only; values never reach the log
+    view         the URL name of the view that ran it (needs STORE_METRICS)
+    location     the innermost project frame that issued it, file:line
+                 (empty for the async ORM)
+    plan         SQLite's ``EXPLAIN QUERY PLAN`` for SELECTs, and the store
+                 tables it reads in full under ``full_scans``
+
+The plan is taken once per fingerprint per process, on a cursor of its own
+that bypasses the execute wrappers. ``manage.py slow_queries`` reads the log,
+groups it by fingerprint and lists the worst offenders.
+
+Fast queries pay for a settings lookup, one ``perf_counter()`` pair and a
+comparison, about a microsecond. Set ``STORE_SLOW_QUERY_MS = None`` to
+disable the log.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .metrics import current, view_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD_MS = 50
+
+# EXPLAIN results kept per process; cleared when full
+PLAN_CACHE_SIZE = 500
+
+SORT_KEYS = ('total', 'count', 'max', 'mean')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?(?![\w"])')
+_PLACEHOLDER_RE = re.compile(r'%s|%\(\w+\)s')
+_LIST_RE = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+_SPACE_RE = re.compile(r'\s+')
+_READ_RE = re.compile(r'\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+
+# SQLite plan details: "SCAN store_cloth", "SCAN TABLE store_cloth" (before
+# 3.36), "SCAN store_cloth AS U0"; index scans name their index
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+# Subqueries and CTEs, whose scans read no table: "CO-ROUTINE qualify"
+SUBQUERY_RE = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+_SKIP_FILES = (os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.py'))
+
+
+def threshold():
+    """Seconds above which a query is logged, or None when the log is off."""
+    ms = getattr(settings, 'STORE_SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)
+    return None if ms is None else ms / 1000
+
+
+def normalize(sql):
+    """`sql` with literals and placeholders as ``?``, value lists collapsed and whitespace squeezed."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _SPACE_RE.sub(' ', sql).strip()
+    return _LIST_RE.sub('(...)', sql)
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def redact(params, many=False):
+    """The types of `params`, which is all the log keeps of them."""
+    if params is None:
+        return []
+    if many:
+        # A generator has been used up by now; only sequences can be counted
+        return [f'{len(params)} rows' if isinstance(params, (list, tuple)) else 'rows']
+    values = params.values() if isinstance(params, dict) else params
+    return [type(value).__name__ for value in values]
+
+
+def caller():
+    """
+    'path/to/file.py:123 in function' for the innermost project frame on the
+    stack, or '' when there is none. Async ORM calls (``aget``, ``aupdate``)
+    run in a sync_to_async thread whose stack does not lead back to the
+    coroutine that awaited them, so the search stops at asgiref.
+    """
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if f'{os.sep}asgiref{os.sep}' in filename:
+            break
+        if (filename.startswith(base) and filename not in _SKIP_FILES
+                and 'site-packages' not in filename):
+            return f'{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+def full_scans(plan):
+    """Tables in `plan` (EXPLAIN QUERY PLAN details) read without an index."""
+    subqueries = {match[1] for match in map(SUBQUERY_RE.match, plan) if match}
+    return sorted({match[1] for match in map(FULL_SCAN_RE.match, plan) if match} - subqueries)
+
+
+def explain(connection, sql, params):
+    """SQLite's query plan for `sql`, as a list of detail lines ([] when there is none)."""
+    if connection.vendor != 'sqlite' or not _READ_RE.match(sql):
+        return []
+    from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+
+    # A cursor of our own: the caller has not fetched its rows yet, and going
+    # through connection.cursor() would run the execute wrappers again
+    cursor = connection.connection.cursor(factory=SQLiteCursorWrapper)
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+    except connection.Database.Error:
+        return []
+    finally:
+        cursor.close()
+
+
+def plan_for(key, connection, sql, params):
+    with _plans_lock:
+        if key in _plans:
+            return _plans[key]
+    plan = explain(connection, sql, params)
+    with _plans_lock:
+        if len(_plans) >= PLAN_CACHE_SIZE:
+            _plans.clear()
+        _plans[key] = plan
+    return plan
+
+
+def log_slow_query(execute, sql, params, many, context):
+    """Database execute wrapper (see install_slow_query_log)."""
+    limit = threshold()
+    if limit is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        if elapsed >= limit:
+            record(sql, params, many, context['connection'], elapsed)
+
+
+def record(sql, params, many, connection, elapsed):
+    """Log one slow statement (see the module docstring for the fields)."""
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    plan = [] if many else plan_for(key, connection, sql, params)
+    metrics = current()
+    entry = {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'fingerprint': key,
+        'ms': round(elapsed * 1000, 3),
+        'sql': normalized,
+        'params': redact(params, many),
+        'alias': connection.alias,
+        'view': view_name(metrics.request) if metrics and metrics.request else '',
+        'location': caller(),
+        'plan': plan,
+        'full_scans': full_scans(plan),
+    }
+    logger.warning(json.dumps(entry))
+    return entry
+
+
+def install_slow_query_log(sender, connection, **kwargs):
+    """connection_created receiver: log slow queries on this connection."""
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_query)
+
+
+# ----- Report -----
+
+def read_log(lines):
+    """Parse log `lines` into entries, skipping anything that is not a slow-query record."""
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and 'fingerprint' in entry:
+            entries.append(entry)
+    return entries
+
+
+def aggregate(entries):
+    """Group `entries` by fingerprint; returns one summary dict per query."""
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['fingerprint'])
+        if group is None:
+            group = groups[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'], 'sql': entry['sql'], 'count': 0,
+                'total_ms': 0.0, 'max_ms': 0.0, 'views': Counter(), 'locations': Counter(),
+                'plan': [], 'full_scans': [], 'last_seen': '',
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['views'][entry.get('view') or '-'] += 1
+        if entry.get('location'):
+            group['locations'][entry['location']] += 1
+        if entry.get('time', '') >= group['last_seen']:
+            group['last_seen'] = entry.get('time', '')
+            group['plan'] = entry.get('plan', [])
+            group['full_scans'] = entry.get('full_scans', [])
+    for group in groups.values():
+        group['mean_ms'] = group['total_ms'] / group['count']
+    return list(groups.values())
+
+
+def top(groups, limit=10, sort='total'):
+    """The `limit` worst groups by total, count, max or mean time."""
+    key = {'total': 'total_ms', 'count': 'count', 'max': 'max_ms', 'mean': 'mean_ms'}[sort]
+    return sorted(groups, key=lambda group: group[key], reverse=True)[:limit]
@@ -39,6 +39,13 @@ document.addEventListener('DOMContentLoaded', function() {
       alert('Please enter a search term');
       return;
     }
+
+    // Full catalogue search on the server when the page provides it
+    const searchUrl = searchInput.closest('.nav-search')?.dataset.searchUrl;
+    if (searchUrl) {
+      window.location.href = `${searchUrl}?q=${encodeURIComponent(query)}`;
+      return;
+    }
     
     // Get all category cards
     const categoryCards = document.querySelectorAll('.card-cat');
@@ -185,8 +192,11 @@ const WA_NUM_2 = '250785440056';
 // --------------------------
 // Swiper initialization for cloth images
 // --------------------------
-function initializeClothSwipers() {
-  document.querySelectorAll('.swiper').forEach((el) => {
+function initializeClothSwipers(root) {
+  // Called with the DOMContentLoaded event or with a freshly inserted element
+  const scope = root instanceof Element ? root : document;
+  scope.querySelectorAll('.swiper').forEach((el) => {
+    if (el.swiper) return; // already initialised
     // Initialize Swiper with enhanced configuration
     new Swiper(el, {
       // Core settings
@@ -251,6 +261,52 @@ function initializeClothSwipers() {
 // Initialize Swipers after DOM is loaded
 document.addEventListener('DOMContentLoaded', initializeClothSwipers);
 
+// --------------------------
+// Lazy-load the rest of each landing-page category rail
+// --------------------------
+function loadRailPage(sentinel, observer) {
+  observer.unobserve(sentinel);
+  fetch(sentinel.dataset.url)
+    .then((response) => {
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+      return response.text();
+    })
+    .then((html) => {
+      const page = document.createElement('div');
+      page.innerHTML = html;
+      const nodes = Array.from(page.children);
+      sentinel.replaceWith(...nodes);
+      nodes.forEach((node) => {
+        if (node.classList.contains('rail-sentinel')) {
+          observer.observe(node);
+        } else {
+          initializeClothSwipers(node);
+        }
+      });
+    })
+    .catch((error) => {
+      console.error('Error loading more items:', error);
+      // Try again next time the sentinel scrolls into view
+      observer.observe(sentinel);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+  const sentinels = document.querySelectorAll('.rail-sentinel');
+  if (!sentinels.length || !('IntersectionObserver' in window)) return;
+
+  sentinels.forEach((sentinel) => {
+    // Start loading a couple of cards before the end of the rail is reached
+    const observer = new IntersectionObserver(
+      (entries) => entries.forEach((entry) => {
+        if (entry.isIntersecting) loadRailPage(entry.target, observer);
+      }),
+      { root: sentinel.closest('.clothes-horizontal-scroll'), rootMargin: '0px 600px 0px 0px' }
+    );
+    observer.observe(sentinel);
+  });
+});
+
 // --------------------------
 // Handle order (WhatsApp) from the floating icon buttons AND order-btn
 // Each order button opens a modal to pick number
@@ -0,0 +1,65 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import metadata, srcset
+from ..metrics import timed
+
+register = template.Library()
+
+
+@register.simple_tag
+def cloth_picture(cloth, field_name, sizes='100vw', alt='', **attrs):
+    """
+    Render a <picture> for one of a Cloth's image fields.
+
+    Emits a WebP <source> and a JPEG <img> with ``srcset``/``sizes`` built from
+    the pre-generated derivatives, falling back to the original upload for
+    items whose derivatives have not been generated yet.
+
+    When the image has been described (see images.describe) the <img> also
+    gets ``width``/``height``, so the browser reserves its box before it
+    loads. Its background is the dominant colour under the blurred
+    placeholder, shown until the real image covers it.
+
+    Usage: {% cloth_picture cloth 'image_front' sizes='280px' alt=cloth.name class='swiper-lazy' loading='lazy' %}
+    """
+    with timed('images'):
+        return _picture(cloth, field_name, sizes, alt, attrs)
+
+
+def _picture(cloth, field_name, sizes, alt, attrs):
+    image = getattr(cloth, field_name, None)
+    if not image:
+        return ''
+
+    meta = metadata(cloth, field_name)
+    if 'width' in meta:
+        attrs = {'width': meta['width'], 'height': meta['height'], **attrs}
+    if 'color' in meta and 'style' not in attrs:
+        attrs['style'] = f"background:{meta['color']} url({meta['placeholder']}) center/cover no-repeat"
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    webp = srcset(cloth, field_name, 'webp')
+    jpeg = srcset(cloth, field_name, 'jpeg')
+    if not webp or not jpeg:
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, extra)
+
+    # Smallest JPEG is the src for browsers that ignore srcset
+    fallback = jpeg.split(',')[0].rsplit(' ', 1)[0]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        '</picture>',
+        webp, sizes, fallback, jpeg, sizes, alt, extra,
+    )
+
+
+@register.simple_tag
+def cloth_thumbnail_url(cloth, field_name, ext='webp'):
+    """URL of the smallest derivative of an image field, or the original upload."""
+    with timed('images'):
+        image = getattr(cloth, field_name, None)
+        if not image:
+            return ''
+        first = srcset(cloth, field_name, ext).split(',')[0]
+        return first.rsplit(' ', 1)[0] if first else image.url
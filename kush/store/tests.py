@@ -1,3 +1,2108 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+from wsgiref.simple_server import make_server
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    benchmark, compression, db, images, importer, metrics, outbox, ratelimit, slowqueries, uploads, urls, warmup,
+)
+from .forms import ClothForm
+from .likes import buffer
+from .models import Category, Cloth, OutgoingEmail, SiteRating, SiteRatingSummary, SiteReview
+from .search import rebuild_index, search_ids
+from .views import RAIL_SIZE
+
+
+@override_settings(STORE_RATE_LIMITS={})
+class LikeCounterTests(TransactionTestCase):
+    """The like endpoint must not lose clicks under concurrency."""
+
+    databases = {'default', 'reader'}
+
+    THREADS = 8
+    LIKES_PER_THREAD = 100
+
+    def setUp(self):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        category = Category.objects.create(name='Dresses')
+        self.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=category, manager=manager)
+        buffer.flush()
+
+    def tearDown(self):
+        buffer.stop()
+
+    def hammer(self):
+        """Send THREADS x LIKES_PER_THREAD likes in parallel; return likes/sec."""
+        url = f'/clothes/{self.cloth.id}/like/'
+        errors = []
+
+        def worker():
+            client = Client()
+            try:
+                for _ in range(self.LIKES_PER_THREAD):
+                    response = client.post(url)
+                    if response.status_code != 200:
+                        errors.append(response.content)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer.flush()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(errors, [])
+        return self.THREADS * self.LIKES_PER_THREAD / elapsed
+
+    def test_like_returns_running_total(self):
+        response = self.client.post(f'/clothes/{self.cloth.id}/like/')
+        self.assertEqual(response.json(), {'likes': 1, 'success': True})
+        response = self.client.post(f'/clothes/{self.cloth.id}/like/')
+        self.assertEqual(response.json()['likes'], 2)
+
+    def test_like_unknown_cloth(self):
+        response = self.client.post('/clothes/999999/like/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_like_does_not_touch_updated_at(self):
+        updated_at = self.cloth.updated_at
+        self.client.post(f'/clothes/{self.cloth.id}/like/')
+        buffer.flush()
+        self.cloth.refresh_from_db()
+        self.assertEqual(self.cloth.likes, 1)
+        self.assertEqual(self.cloth.updated_at, updated_at)
+
+    def test_concurrent_buffered_likes_are_not_lost(self):
+        rate = self.hammer()
+        self.cloth.refresh_from_db()
+        self.assertEqual(self.cloth.likes, self.THREADS * self.LIKES_PER_THREAD)
+        print(f"\nbuffered likes: {rate:,.0f} likes/sec")
+
+    @override_settings(STORE_LIKE_FLUSH_INTERVAL=0)
+    def test_concurrent_write_through_likes_are_not_lost(self):
+        rate = self.hammer()
+        self.cloth.refresh_from_db()
+        self.assertEqual(self.cloth.likes, self.THREADS * self.LIKES_PER_THREAD)
+        print(f"\nwrite-through likes: {rate:,.0f} likes/sec")
+
+
+@override_settings(STORE_RATE_LIMITS={})
+class SiteRatingSummaryTests(TestCase):
+    """The materialised rating summary must match AVG/COUNT over SiteRating."""
+
+    def test_submit_rating_updates_summary(self):
+        for rating in (5, 4, 4):
+            response = self.client.post('/submit-rating/', {'rating': rating})
+        self.assertEqual(response.json()['average_rating'], 4.3)
+        self.assertEqual(response.json()['total_ratings'], 3)
+        summary = SiteRatingSummary.objects.get()
+        self.assertEqual((summary.stars_4, summary.stars_5, summary.total), (2, 1, 13))
+
+    def test_delete_and_rebuild(self):
+        ratings = [SiteRating.objects.create(rating=r) for r in (1, 2, 3)]
+        ratings[0].delete()
+        self.assertEqual(SiteRatingSummary.stats(), {'average_rating': 2.5, 'total_ratings': 2})
+
+        SiteRatingSummary.objects.update(count=0, total=0, stars_2=0, stars_3=0)
+        call_command('rebuild_rating_summary', stdout=StringIO())
+        self.assertEqual(SiteRatingSummary.stats(), {'average_rating': 2.5, 'total_ratings': 2})
+
+    def test_edit_moves_the_rating(self):
+        rating = SiteRating.objects.create(rating=2)
+        SiteRating.objects.create(rating=5)
+        rating.rating = 4
+        rating.save()
+        rating.save()
+        summary = SiteRatingSummary.objects.get()
+        self.assertEqual((summary.stars_2, summary.stars_4, summary.stars_5), (0, 1, 1))
+        self.assertEqual(SiteRatingSummary.stats(), {'average_rating': 4.5, 'total_ratings': 2})
+
+    def test_page_views_do_not_aggregate_ratings(self):
+        SiteRating.objects.create(rating=5)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/about/')
+        self.assertFalse(any('store_siterating"' in q['sql'] for q in queries.captured_queries))
+
+
+@override_settings(STORE_CACHE_TIMEOUT=0)
+class LandingPageTests(TestCase):
+    """The landing page must cost the same number of queries however big the catalogue is."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+
+    def seed(self, categories, per_category):
+        for c in range(categories):
+            category = Category.objects.create(name=f'Category {Category.objects.count()}')
+            Cloth.objects.bulk_create(
+                Cloth(name=f'Item {c}-{i}', price=1000, category=category, manager=self.manager)
+                for i in range(per_category)
+            )
+
+    def landing_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), len(response.content)
+
+    def test_query_count_and_size_stay_flat(self):
+        self.seed(3, RAIL_SIZE + 1)
+        before = self.landing_queries()
+        Cloth.objects.bulk_create(
+            Cloth(name='Extra', price=1000, category=category, manager=self.manager)
+            for category in Category.objects.all() for _ in range(200)
+        )
+        self.assertEqual(self.landing_queries(), before)
+
+    def test_category_items_pages_through_rail(self):
+        self.seed(1, RAIL_SIZE * 2 + 3)
+        category = Category.objects.get()
+        ids = list(category.clothes.order_by('id').values_list('id', flat=True))
+
+        response = self.client.get('/')
+        self.assertContains(response, f'?after={ids[RAIL_SIZE - 1]}')
+
+        response = self.client.get(f'/category/{category.slug}/items/?after={ids[RAIL_SIZE - 1]}')
+        self.assertContains(response, f'id="cloth-{ids[RAIL_SIZE]}"')
+        self.assertContains(response, f'?after={ids[2 * RAIL_SIZE - 1]}')
+
+        response = self.client.get(f'/category/{category.slug}/items/?after={ids[2 * RAIL_SIZE - 1]}')
+        self.assertContains(response, 'cloth-item-wrapper', count=3)
+        self.assertNotContains(response, 'rail-sentinel')
+
+
+class PublicPageCacheTests(TestCase):
+    """Anonymous page views are cached until a signal bumps what they depend on."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.category = Category.objects.create(name='Dresses')
+        cls.other = Category.objects.create(name='Skirts')
+        cls.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=cls.category, manager=cls.manager)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_repeat_views_are_served_from_cache(self):
+        for url in ('/', '/about/', '/category/dresses/', f'/manager/clothes/{self.cloth.id}/'):
+            first, _ = self.get(url)
+            second, queries = self.get(url)
+            self.assertEqual(second['X-Cache'], 'HIT', url)
+            self.assertEqual(queries, 0, url)
+            self.assertEqual(first.content, second.content, url)
+
+    def test_cloth_change_invalidates_its_pages_only(self):
+        for url in ('/', '/category/dresses/', '/category/skirts/', f'/manager/clothes/{self.cloth.id}/'):
+            self.get(url)
+        self.cloth.name = 'Blue Dress'
+        self.cloth.save()
+
+        for url in ('/', '/category/dresses/', f'/manager/clothes/{self.cloth.id}/'):
+            response, _ = self.get(url)
+            self.assertEqual(response['X-Cache'], 'MISS', url)
+            self.assertContains(response, 'Blue Dress')
+        response, _ = self.get('/category/skirts/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_moving_cloth_refreshes_old_category(self):
+        self.get('/category/dresses/')
+        self.cloth.category = self.other
+        self.cloth.save()
+        response, _ = self.get('/category/dresses/')
+        self.assertNotContains(response, 'Red Dress')
+
+    def test_review_approval_and_rating_invalidate(self):
+        review = SiteReview.objects.create(name='Ann', review_text='Lovely shop', is_approved=False)
+        response, _ = self.get('/about/')
+        self.assertNotContains(response, 'Lovely shop')
+        review.is_approved = True
+        review.save()
+        response, _ = self.get('/about/')
+        self.assertContains(response, 'Lovely shop')
+
+        self.client.post('/submit-rating/', {'rating': 5})
+        response, _ = self.get('/about/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, '(1 ratings)')
+
+    def test_logged_in_managers_bypass_cache(self):
+        self.client.login(username='manager', password='secret')
+        self.get(f'/manager/clothes/{self.cloth.id}/')
+        response, _ = self.get(f'/manager/clothes/{self.cloth.id}/')
+        self.assertNotIn('X-Cache', response)
+
+
+class ConditionalGetTests(TestCase):
+    """Public pages validate with ETag/Last-Modified and set no cookies."""
+
+    PAGES = ('/', '/about/', '/category/dresses/', '/manager/clothes/')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.category = Category.objects.create(name='Dresses')
+        cls.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=cls.category, manager=cls.manager)
+
+    def setUp(self):
+        cache.clear()
+
+    def pages(self):
+        return self.PAGES + (f'/manager/clothes/{self.cloth.id}/',)
+
+    def test_public_pages_are_cookie_free_and_public(self):
+        for url in self.pages():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertFalse(response.cookies, url)
+            self.assertNotIn('Cookie', response.get('Vary', ''), url)
+            self.assertIn('public', response['Cache-Control'], url)
+            self.assertTrue(response.has_header('ETag'), url)
+            self.assertTrue(response.has_header('Last-Modified'), url)
+
+    def test_unchanged_page_returns_304_without_queries(self):
+        for url in self.pages():
+            etag = self.client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(len(queries), 0, url)
+
+    def test_change_or_delete_invalidates_validators(self):
+        url = f'/category/{self.category.slug}/'
+        first = self.client.get(url)
+        other = Cloth.objects.create(name='Green Dress', price=9000, category=self.category, manager=self.manager)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        second = self.client.get(url)
+        other.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_managers_get_private_unvalidated_pages(self):
+        self.client.login(username='manager', password='secret')
+        response = self.client.get(f'/manager/clothes/{self.cloth.id}/')
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertContains(response, f'/manager/clothes/{self.cloth.id}/edit/')
+
+
+class CatalogueApiTests(TestCase):
+    """Keyset pagination and sparse fields for the JSON API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.dresses = Category.objects.create(name='Dresses')
+        cls.skirts = Category.objects.create(name='Skirts')
+        Cloth.objects.bulk_create(
+            Cloth(name=f'Item {i}', price=1000 + i, manager=manager,
+                  category=cls.dresses if i % 2 else cls.skirts,
+                  status='sold' if i % 5 == 0 else 'available')
+            for i in range(30)
+        )
+        # bulk_create gives equal timestamps, so (created_at, id) ties exercise the id tiebreak
+        cls.expected = list(Cloth.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, url, **params):
+        ids, cursor, pages = [], None, 0
+        while True:
+            query = {**params, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(url, query).json()
+            ids += [item['id'] for item in data['results']]
+            pages += 1
+            cursor = data['next']
+            if not cursor:
+                return ids, pages
+
+    def test_pages_cover_catalogue_exactly_once(self):
+        ids, pages = self.collect('/api/clothes/', limit=7, fields='id')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 5)
+
+    def test_filters(self):
+        ids, _ = self.collect('/api/clothes/', category='dresses', status='available', fields='id')
+        expected = Cloth.objects.filter(category=self.dresses, status='available').order_by('-created_at', '-id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+    def test_page_cost_is_constant(self):
+        cursor = self.client.get('/api/clothes/', {'limit': 25, 'fields': 'id'}).json()['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/clothes/', {'limit': 5, 'fields': 'id', 'cursor': cursor})
+        select = [q['sql'] for q in queries.captured_queries if 'store_cloth' in q['sql']][-1]
+        self.assertNotIn('OFFSET', select)
+
+    def test_sparse_fields(self):
+        data = self.client.get('/api/clothes/', {'fields': 'id,name', 'limit': 1}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'name'})
+        cloth_id = data['results'][0]['id']
+        data = self.client.get(f'/api/clothes/{cloth_id}/', {'fields': 'category,price'}).json()
+        self.assertEqual(data['category']['slug'], Cloth.objects.get(pk=cloth_id).category.slug)
+        self.assertIn('price', data)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/api/clothes/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/clothes/', {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/clothes/999999/').status_code, 404)
+
+    def test_categories(self):
+        data = self.client.get('/api/categories/').json()
+        self.assertEqual([(c['slug'], c['item_count']) for c in data['results']], [('dresses', 15), ('skirts', 15)])
+
+
+class SearchTests(TestCase):
+    """The FTS index follows the Cloth/Category tables and ranks by relevance."""
+
+    @classmethod
+    def setUpTestData(cls):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.dresses = Category.objects.create(name='Dresses')
+        cls.shoes = Category.objects.create(name='Shoes')
+        cls.red_dress = Cloth.objects.create(name='Red Dress', description='Silk evening dress',
+                                             price=15000, category=cls.dresses, manager=manager)
+        cls.heels = Cloth.objects.create(name='Heels', description='Red leather, goes with any dress',
+                                         price=20000, category=cls.shoes, manager=manager)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_prefix_match_and_ranking(self):
+        self.assertEqual(search_ids('dre'), [self.red_dress.id, self.heels.id])
+        self.assertEqual(search_ids('red dre'), [self.red_dress.id, self.heels.id])
+        self.assertEqual(search_ids('shoe'), [self.heels.id])
+        self.assertEqual(search_ids('silk NEAR "'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.heels.name = 'Stilettos'
+        self.heels.save()
+        self.assertEqual(search_ids('stil'), [self.heels.id])
+        self.assertEqual(search_ids('heels'), [])
+
+        self.shoes.name = 'Footwear'
+        self.shoes.save()
+        self.assertEqual(search_ids('footwear'), [self.heels.id])
+
+        self.heels.delete()
+        self.assertEqual(search_ids('stil'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM store_cloth_fts')
+        self.assertEqual(search_ids('dress'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2', out.getvalue())
+        self.assertEqual(rebuild_index(), 2)
+        self.assertEqual(search_ids('dress'), [self.red_dress.id, self.heels.id])
+
+    def test_search_page_and_api(self):
+        response = self.client.get('/search/', {'q': 'heel'})
+        self.assertContains(response, 'Heels')
+        self.assertNotContains(response, 'Red Dress')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/search/', {'q': 'dress', 'fields': 'id,name', 'limit': 1}).json()
+        self.assertEqual(data, {'results': [{'id': self.red_dress.id, 'name': 'Red Dress'}], 'next_offset': 1})
+        self.assertFalse(any('LIKE' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
+
+
+@override_settings(STORE_CACHE_TIMEOUT=0, STORE_LIKE_FLUSH_INTERVAL=0)
+class QueryBudgetTests(TestCase):
+    """
+    Every URL in store/urls.py against a large catalogue, with caching off:
+    the number of queries may not exceed its budget and no query may scan a
+    whole store table unless the view really lists all of it.
+    """
+
+    CATEGORIES = 25
+    CLOTHES = 3000
+    REVIEWS = 400
+
+    # url name -> (method, kwargs, query budget, tables the view may scan in full)
+    BUDGETS = {
+        'landing_page': ('get', {}, 8, {'store_category'}),
+        'about': ('get', {}, 4, set()),
+        'send_message': ('post', {}, 1, set()),  # the outbox insert
+        'category_detail': ('get', {'slug': 'category-7'}, 9, set()),
+        'category_items': ('get', {'slug': 'category-7'}, 2, set()),
+        'search': ('get', {}, 9, set()),
+        'cloth_list': ('get', {}, 2, set()),
+        'cloth_detail': ('get', {'cloth_id': 'CLOTH'}, 3, set()),
+        'add_cloth': ('get', {}, 3, {'store_category'}),
+        'edit_cloth': ('get', {'cloth_id': 'CLOTH'}, 5, {'store_category'}),
+        'like_cloth': ('post', {'cloth_id': 'CLOTH'}, 2, set()),
+        'submit_rating': ('post', {}, 5, set()),
+        'submit_review': ('post', {}, 1, set()),
+        'manager_login': ('get', {}, 0, set()),
+        # Joins the (small) category table first and probes clothes by category
+        'manager_dashboard': ('get', {}, 6, {'store_category'}),
+        'manager_logout': ('get', {}, 4, set()),
+        'manager_metrics': ('get', {}, 2, set()),  # session and user
+        'bulk_update_clothes': ('post', {}, 4, set()),
+        'api_category_list': ('get', {}, 5, {'store_category'}),
+        'api_cloth_list': ('get', {}, 5, set()),
+        'api_cloth_detail': ('get', {'cloth_id': 'CLOTH'}, 2, set()),
+        'api_search': ('get', {}, 7, set()),
+    }
+
+    PARAMS = {
+        'send_message': {'name': 'Ann', 'email': 'ann@example.com', 'message': 'Hello'},
+        'search': {'q': 'item 12'},
+        'api_search': {'q': 'item 12'},
+        'api_cloth_list': {'status': 'available', 'limit': 24},
+        'submit_rating': {'rating': 4},
+        'submit_review': {'name': 'Ann', 'review_text': 'Lovely clothes'},
+        'bulk_update_clothes': {'action': 'status', 'status': 'sold', 'status_filter': 'available',
+                                'all_matching': '1'},
+    }
+
+    LOGIN_REQUIRED = {'add_cloth', 'edit_cloth', 'manager_dashboard', 'manager_logout', 'manager_metrics',
+                      'bulk_update_clothes'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        other = User.objects.create_user('other', password='secret', is_staff=True)
+        categories = Category.objects.bulk_create(
+            Category(name=f'Category {i}', slug=f'category-{i}') for i in range(cls.CATEGORIES)
+        )
+        Cloth.objects.bulk_create(
+            Cloth(name=f'Item {i}', description=f'Synthetic item number {i}', price=1000 + i,
+                  category=categories[i % cls.CATEGORIES], manager=cls.manager if i % 4 == 0 else other,
+                  status='sold' if i % 3 == 0 else 'available')
+            for i in range(cls.CLOTHES)
+        )
+        SiteReview.objects.bulk_create(
+            SiteReview(name=f'Customer {i}', review_text='Great', is_approved=i % 2 == 0)
+            for i in range(cls.REVIEWS)
+        )
+        SiteRating.objects.bulk_create(SiteRating(rating=1 + i % 5) for i in range(cls.REVIEWS))
+        SiteRatingSummary.rebuild()
+        cls.cloth = Cloth.objects.filter(manager=cls.manager).first()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+    def url(self, name):
+        kwargs = {k: self.cloth.id if v == 'CLOTH' else v for k, v in self.BUDGETS[name][1].items()}
+        return reverse(name, kwargs=kwargs)
+
+    def full_scans(self, sql):
+        """Store tables that `sql` reads without using an index."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        return {
+            match.group(1) for match in (re.match(r'SCAN (store_\w+)$', d) for d in details) if match
+        }
+
+    def measure(self, name):
+        method, _, budget, allowed_scans = self.BUDGETS[name]
+        if name in self.LOGIN_REQUIRED:
+            self.client.force_login(self.manager)
+        else:
+            self.client.logout()
+        request = getattr(self.client, method)
+        with CaptureQueriesContext(connection) as queries:
+            response = request(self.url(name), self.PARAMS.get(name, {}))
+        self.assertLess(response.status_code, 400, name)
+        scans = set()
+        for query in queries.captured_queries:
+            if query['sql'].startswith('SELECT'):
+                scans |= self.full_scans(query['sql'])
+        return len(queries), scans - allowed_scans
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(set(self.BUDGETS), {pattern.name for pattern in urls.urlpatterns})
+
+    def test_query_budgets_and_plans(self):
+        for name, (_, _, budget, _) in self.BUDGETS.items():
+            with self.subTest(name):
+                count, scans = self.measure(name)
+                self.assertLessEqual(count, budget)
+                self.assertEqual(scans, set())
+
+    def test_hot_filters_use_their_indexes(self):
+        plans = {
+            'store_cloth_status_created': Cloth.objects.filter(status='available').order_by('-created_at'),
+            'store_cloth_manager_status': Cloth.objects.filter(manager=self.manager, status='sold'),
+            'store_review_approved_created': SiteReview.objects.filter(is_approved=True)[:5],
+            'sqlite_autoindex_store_category': Category.objects.filter(slug='category-7'),
+        }
+        for index, queryset in plans.items():
+            with self.subTest(index):
+                self.assertIn(index, queryset.explain())
+
+
+@override_settings(STORE_LIKE_FLUSH_INTERVAL=0)
+class BenchmarkTests(TestCase):
+    """The benchmark harness seeds reproducibly and covers every route."""
+
+    def test_seed_run_and_compare(self):
+        out = StringIO()
+        call_command('seed_catalogue', categories=3, clothes=40, reviews=10, ratings=10, stdout=out)
+        self.assertIn('40 clothes', out.getvalue())
+        self.assertEqual(Cloth.objects.count(), 40)
+        self.assertEqual(SiteRatingSummary.stats()['total_ratings'], 10)
+
+        report = benchmark.run_benchmark(requests=2, warmup=0)
+        results = report['results']['inprocess']
+        self.assertEqual(set(results), {pattern.name for pattern in urls.urlpatterns})
+        for metrics in results.values():
+            self.assertEqual(metrics['requests'], 2)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+            self.assertGreater(metrics['peak_memory'], 0)
+        self.assertEqual(report['meta']['catalogue']['clothes'], 40)
+
+        report = json.loads(json.dumps(report))
+        self.assertTrue(all(change == 0 for *_, change in benchmark.compare(report, report)))
+
+        # Seeding again only tops up; clearing leaves the rows the write routes added
+        counts = Cloth.objects.count(), SiteReview.objects.count(), SiteRating.objects.count()
+        call_command('seed_catalogue', categories=3, clothes=40, reviews=10, ratings=10, stdout=StringIO())
+        self.assertEqual((Cloth.objects.count(), SiteReview.objects.count(), SiteRating.objects.count()), counts)
+        benchmark.clear_seeded()
+        self.assertFalse(Cloth.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(SiteReview.objects.count(), counts[1] - 10)
+        self.assertEqual(SiteRating.objects.count(), counts[2] - 10)
+        self.assertEqual(SiteRatingSummary.stats()['total_ratings'], counts[2] - 10)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([benchmark.percentile(values, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+
+
+@override_settings(STORE_RATE_LIMITS={})
+class AsyncEndpointTests(TestCase):
+    """The anonymous write endpoints are async views that work under ASGI and WSGI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        category = Category.objects.create(name='Dresses')
+        cls.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=category, manager=manager)
+
+    def test_views_are_coroutines(self):
+        for url in (reverse('like_cloth', args=[1]), reverse('submit_rating'), reverse('submit_review'),
+                    reverse('send_message')):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), url)
+
+    @override_settings(STORE_LIKE_FLUSH_INTERVAL=0, EMAIL_HOST_USER='shop@example.com')
+    async def test_asgi_requests(self):
+        response = await self.async_client.post(reverse('like_cloth', args=[self.cloth.pk]))
+        self.assertEqual(json.loads(response.content)['likes'], 1)
+        response = await self.async_client.post(reverse('like_cloth', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.post(reverse('submit_rating'), {'rating': 4})
+        self.assertEqual(json.loads(response.content)['total_ratings'], 1)
+        self.assertEqual((await self.async_client.post(reverse('submit_rating'), {'rating': 9})).status_code, 400)
+
+        response = await self.async_client.post(reverse('submit_review'), {'name': 'Ann', 'review_text': 'Lovely'})
+        self.assertTrue(json.loads(response.content)['success'])
+        self.assertEqual(await SiteReview.objects.filter(name='Ann').acount(), 1)
+
+        response = await self.async_client.post(
+            reverse('send_message'), {'name': 'Ann', 'email': 'ann@example.com', 'message': 'Hello'}
+        )
+        self.assertTrue(json.loads(response.content)['success'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(await sync_to_async(outbox.drain)(), {'sent': 1, 'retry': 0, 'dead': 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].reply_to, ['ann@example.com'])
+
+    def test_buffered_likes_under_asgi(self):
+        with override_settings(STORE_LIKE_FLUSH_THRESHOLD=3):
+            for expected in (1, 2, 3):
+                response = async_to_sync(self.async_client.post)(reverse('like_cloth', args=[self.cloth.pk]))
+                self.assertEqual(json.loads(response.content)['likes'], expected)
+        # The third like reached the threshold and was flushed without blocking the loop
+        self.cloth.refresh_from_db()
+        self.assertEqual(self.cloth.likes, 3)
+        buffer.flush()
+
+
+class BurstBenchmarkTests(TransactionTestCase):
+    """The WSGI/ASGI burst comparison runs every request to completion."""
+
+    databases = {'default', 'reader'}
+
+    def setUp(self):
+        benchmark.seed_catalogue(categories=2, clothes=10, reviews=2, ratings=2)
+
+    def tearDown(self):
+        buffer.flush()
+
+    def test_burst_in_both_modes(self):
+        out = StringIO()
+        call_command('benchmark', burst=20, threads=2, concurrency=8, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + len(benchmark.BURST_MODES) * len(benchmark.BURST_ROUTES))
+        report = benchmark.run_burst(total=10, modes=('asgi',), routes=('submit_rating',), concurrency=4)
+        result = report['results']['asgi']['submit_rating']
+        self.assertEqual((result['requests'], result['errors']), (10, 0))
+        self.assertEqual(SiteRatingSummary.stats()['total_ratings'], 2 + 20 * 2 + 10)
+
+
+@override_settings(STORE_DASHBOARD_PAGE_SIZE=10)
+class ManagerDashboardTests(TestCase):
+    """Single-query stats, paginated/sorted inventory and bulk updates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.other = User.objects.create_user('other', password='secret', is_staff=True)
+        cls.dresses = Category.objects.create(name='Dresses')
+        cls.skirts = Category.objects.create(name='Skirts')
+        Cloth.objects.bulk_create(
+            Cloth(name=f'Item {i:02}', price=1000 + i, category=cls.dresses, manager=cls.manager,
+                  status='sold' if i % 4 == 0 else 'available')
+            for i in range(25)
+        )
+        cls.foreign = Cloth.objects.create(name='Not mine', price=5, category=cls.dresses, manager=cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def test_stats_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/manager/dashboard/')
+        self.assertEqual((response.context['total_items'], response.context['available_items'],
+                          response.context['sold_items']), (25, 18, 7))
+        counts = [q['sql'] for q in queries.captured_queries if 'COUNT' in q['sql'] and 'store_cloth' in q['sql']]
+        # The conditional aggregate plus the paginator's count
+        self.assertEqual(len(counts), 2)
+
+    def test_pagination_and_sorting(self):
+        response = self.client.get('/manager/dashboard/', {'sort': '-price', 'page': 3})
+        self.assertEqual([c.name for c in response.context['clothes']], [f'Item {i:02}' for i in (4, 3, 2, 1, 0)])
+        self.assertEqual(response.context['page'].paginator.num_pages, 3)
+
+        response = self.client.get('/manager/dashboard/', {'sort': 'name', 'status': 'sold'})
+        self.assertEqual([c.name for c in response.context['clothes']], [f'Item {i:02}' for i in range(0, 25, 4)])
+        # Unknown sort keys fall back to the default instead of erroring
+        self.assertEqual(self.client.get('/manager/dashboard/', {'sort': 'password'}).status_code, 200)
+
+    def test_bulk_status_update_is_one_update_and_scoped_to_manager(self):
+        ids = list(Cloth.objects.filter(manager=self.manager, status='available').values_list('id', flat=True)[:3])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/manager/clothes/bulk/', {
+                'action': 'status', 'status': 'sold', 'ids': [*ids, self.foreign.id],
+            })
+        self.assertRedirects(response, '/manager/dashboard/', fetch_redirect_response=False)
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Cloth.objects.filter(pk__in=ids, status='sold').count(), 3)
+        self.assertEqual(Cloth.objects.get(pk=self.foreign.pk).status, 'available')
+
+    def test_bulk_category_move_of_all_matching_refreshes_pages(self):
+        self.client.logout()
+        self.client.get('/category/skirts/')
+        self.client.force_login(self.manager)
+        self.client.post('/manager/clothes/bulk/', {
+            'action': 'category', 'category': self.skirts.id, 'all_matching': '1', 'status_filter': 'sold',
+        })
+        self.assertEqual(self.skirts.clothes.count(), 7)
+        self.client.logout()
+        self.assertContains(self.client.get('/category/skirts/'), 'Item 00')
+
+    def test_bulk_update_refreshes_cloth_pages_without_a_bump_per_row(self):
+        cloth = Cloth.objects.filter(manager=self.manager).first()
+        url = f'/manager/clothes/{cloth.id}/'
+        self.client.logout()
+        self.client.get(url)
+        version = cache.get(f'store:version:cloth:{cloth.pk}')
+        self.client.force_login(self.manager)
+        self.client.post('/manager/clothes/bulk/', {'action': 'price', 'price': '2500', 'all_matching': '1'})
+        self.client.logout()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, '2500.00 RWF')
+        self.assertEqual(cache.get(f'store:version:cloth:{cloth.pk}'), version)
+
+    def test_bulk_price_validation(self):
+        cloth = Cloth.objects.filter(manager=self.manager).first()
+        response = self.client.post('/manager/clothes/bulk/', {'action': 'price', 'ids': [cloth.id]}, follow=True)
+        self.assertContains(response, 'Choose a price')
+        self.client.post('/manager/clothes/bulk/', {'action': 'price', 'price': '-1', 'ids': [cloth.id]})
+        self.client.post('/manager/clothes/bulk/', {'action': 'price', 'price': '2500', 'ids': [cloth.id]})
+        self.assertEqual(Cloth.objects.get(pk=cloth.pk).price, 2500)
+
+
+class StreamingUploadTests(TestCase):
+    """add_cloth streams uploads with size limits, fixes EXIF orientation and records the stored hash."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.category = Category.objects.create(name='Dresses')
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        media = override_settings(MEDIA_ROOT=self.tmp)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client.force_login(self.manager)
+
+    def jpeg(self, size=(300, 200), orientation=1, noise=False):
+        image = Image.new('RGB', size, (200, 30, 30))
+        if noise:
+            image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        content = BytesIO()
+        image.save(content, 'JPEG', exif=exif)
+        return content.getvalue()
+
+    def post(self, content, client=None):
+        return (client or self.client).post(reverse('add_cloth'), {
+            'name': 'Red Dress', 'price': '15000', 'status': 'available', 'category': self.category.pk,
+            'image_front': SimpleUploadedFile('photo.jpg', content, 'image/jpeg'),
+        })
+
+    def test_rotated_photo_is_stored_upright_with_its_hash(self):
+        response = self.post(self.jpeg(orientation=6))
+        cloth = Cloth.objects.get()
+        self.assertRedirects(response, reverse('cloth_detail', args=[cloth.pk]), fetch_redirect_response=False)
+        with cloth.image_front.open('rb') as f:
+            stored = f.read()
+        with Image.open(BytesIO(stored)) as image:
+            self.assertEqual(image.size, (200, 300))
+            self.assertEqual(image.getexif().get(0x0112, 1), 1)
+        record = cloth.image_derivatives['image_front']
+        self.assertEqual(record['sha256'], hashlib.sha256(stored).hexdigest())
+        self.assertEqual((record['width'], record['height']), (200, 300))
+
+    def test_full_size_phone_photo_is_rotated(self):
+        # 4200x3000 is 12.6 MP, above the old cut-off that left such photos sideways
+        self.post(self.jpeg(size=(4200, 3000), orientation=6))
+        cloth = Cloth.objects.get()
+        with Image.open(cloth.image_front.path) as image:
+            self.assertEqual(image.size, (3000, 4200))
+        self.assertEqual((cloth.image_derivatives['image_front']['width'],
+                          cloth.image_derivatives['image_front']['height']), (3000, 4200))
+
+    def test_huge_jpeg_is_rotated_at_reduced_scale(self):
+        path = os.path.join(self.tmp, 'huge.jpg')
+        with open(path, 'wb') as f:
+            f.write(self.jpeg(size=(2000, 1500), orientation=8))
+        with mock.patch.object(uploads, 'MAX_NORMALISE_PIXELS', 1_000_000):
+            self.assertTrue(uploads.normalise_orientation(path))
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (750, 1000))
+            self.assertEqual(image.getexif().get(0x0112, 1), 1)
+
+    def test_upright_photo_keeps_its_bytes(self):
+        content = self.jpeg()
+        self.post(content)
+        cloth = Cloth.objects.get()
+        with cloth.image_front.open('rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(cloth.image_derivatives['image_front']['sha256'], hashlib.sha256(content).hexdigest())
+
+    @override_settings(STORE_UPLOAD_MAX_FILE_SIZE=4 * 1024)
+    def test_file_limit(self):
+        response = self.post(self.jpeg(noise=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response.context['form'], 'image_front', 'Each image must be under 4.0\xa0KB.')
+        self.assertFalse(Cloth.objects.exists())
+
+    @override_settings(STORE_UPLOAD_MAX_REQUEST_SIZE=4 * 1024)
+    def test_request_limit(self):
+        response = self.post(self.jpeg(noise=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Upload is larger than the 4.0\xa0KB allowed per request.',
+                      response.context['form'].errors['image_front'])
+        self.assertFalse(Cloth.objects.exists())
+
+    def test_csrf_is_checked_after_the_handler_is_installed(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.manager)
+        self.assertEqual(self.post(self.jpeg(), client).status_code, 403)
+        self.assertFalse(Cloth.objects.exists())
+
+        # With a token the same request goes through the streaming handler
+        client.get(reverse('add_cloth'))
+        token = client.cookies['csrftoken'].value
+        response = client.post(reverse('add_cloth'), {
+            'name': 'Red Dress', 'price': '15000', 'status': 'available', 'category': self.category.pk,
+            'image_front': SimpleUploadedFile('photo.jpg', self.jpeg(orientation=6), 'image/jpeg'),
+            'csrfmiddlewaretoken': token,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('sha256', Cloth.objects.get().image_derivatives['image_front'])
+
+
+class ImportCatalogueTests(TestCase):
+    """import_catalogue creates items in bulk and is safe to re-run."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('intake', password='secret', is_staff=True)
+        Category.objects.create(name='Tops')
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        media = override_settings(MEDIA_ROOT=os.path.join(self.tmp, 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.archive = os.path.join(self.tmp, 'drop.zip')
+        with zipfile.ZipFile(self.archive, 'w') as archive:
+            for i in range(3):
+                image = BytesIO()
+                Image.new('RGB', (400 + i, 600), (200, 30 * i, 30)).save(image, 'PNG')
+                archive.writestr(f'photos/KEVINE_TOP_{i}.png', image.getvalue())
+
+        self.manifest = os.path.join(self.tmp, 'drop.csv')
+        with open(self.manifest, 'w') as f:
+            f.write('sku,name,price,category,image_front,image_left\n')
+            f.write('K-1,Red Top,8000,Tops,photos/KEVINE_TOP_0.png,photos/KEVINE_TOP_1.png\n')
+            f.write('K-2,Blue Jeans,18000,Jeans,photos/KEVINE_TOP_2.png,\n')
+            f.write('K-3,Old Jeans,"12,000",Jeans,,\n')
+            f.write('K-4,Missing photo,9000,Tops,photos/nope.png,\n')
+            f.write('K-1,Duplicate row,1,Tops,,\n')
+
+    def run_import(self):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalogue', self.manifest, self.archive, manager='intake', workers=1,
+                     batch_size=2, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_then_rerun(self):
+        out, err = self.run_import()
+        self.assertIn('Imported 3 new item(s) and 3 image(s)', out)
+        self.assertIn('photos/nope.png', err)
+        self.assertEqual(Category.objects.filter(name='Jeans').count(), 1)
+
+        top = Cloth.objects.get(sku='K-1')
+        self.assertEqual((top.name, top.category.name, top.manager), ('Red Top', 'Tops', self.manager))
+        self.assertTrue(top.image_front.name.startswith('clothes/front/K-1_'))
+        self.assertIn('320', top.image_derivatives['image_left']['webp'])
+        self.assertEqual(top.image_derivatives['image_left']['width'], 401)
+        self.assertEqual(Cloth.objects.get(sku='K-3').price, 12000)
+        self.assertEqual(search_ids('jeans'), list(Cloth.objects.filter(sku__in=['K-2', 'K-3'])
+                                                   .order_by('id').values_list('id', flat=True)))
+
+        # A re-run creates nothing and finishes only images lost to an interrupted run
+        Cloth.objects.filter(sku='K-2').update(image_front='', image_derivatives={})
+        out, _ = self.run_import()
+        self.assertIn('Imported 0 new item(s) and 1 image(s)', out)
+        self.assertEqual(Cloth.objects.count(), 3)
+        self.assertTrue(Cloth.objects.get(sku='K-2').image_front)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp, 'media', 'clothes', 'front'))), 2)
+
+    def test_unusable_source(self):
+        with self.assertRaises(CommandError):
+            call_command('import_catalogue', self.manifest, os.path.join(self.tmp, 'missing'), manager='intake')
+
+    def test_spawned_workers(self):
+        # Spawned workers import the worker module before Django is set up
+        catalogue = importer.CatalogueImporter(self.manifest, self.archive, default_manager='intake', batch_size=10,
+                                               workers=2, mp_context=multiprocessing.get_context('spawn'))
+        self.patch_in_flight(1)
+        with CaptureQueriesContext(connection) as queries:
+            stats = catalogue.run()
+        self.assertEqual((stats['created'], stats['images']), (3, 3))
+        self.assertEqual(len(Cloth.objects.get(sku='K-1').image_derivatives), 2)
+        self.assertEqual(self.peak_in_flight, 2)
+        # Category slugs for the cache bump come from rows already in memory
+        self.assertFalse([q for q in queries.captured_queries
+                          if q['sql'].startswith('SELECT') and 'FROM "store_category" WHERE "store_category"."id"'
+                          in q['sql']])
+
+    def patch_in_flight(self, per_worker):
+        """Record the most images ever submitted to the pool at once."""
+        self.peak_in_flight = 0
+        original_wait = importer.wait
+
+        def wait(futures, **kwargs):
+            self.peak_in_flight = max(self.peak_in_flight, len(futures))
+            return original_wait(futures, **kwargs)
+
+        patches = [mock.patch.object(importer, 'wait', wait),
+                   mock.patch.object(importer, 'IN_FLIGHT_PER_WORKER', per_worker)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class StaticAssetTests(TestCase):
+    """collectstatic output is hashed, pre-compressed and served with long-lived headers."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        root = override_settings(STATIC_ROOT=cls.static_root)
+        root.enable()
+        cls.addClassCleanup(root.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.style = staticfiles_storage.stored_name('store/style.css')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        self.assertRegex(self.style, r'^store/style\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.static_root, self.style), 'rb') as f:
+            original = f.read()
+        with open(os.path.join(self.static_root, self.style + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+        # Images are hashed but not gzipped
+        logo = staticfiles_storage.stored_name('store/images/Logo.png')
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, logo + '.gz')))
+
+    def test_pages_link_hashed_assets(self):
+        html = self.client.get(reverse('landing_page')).content.decode()
+        self.assertIn(f'/static/{self.style}"', html)
+        self.assertIn(staticfiles_storage.stored_name('store/script.js'), html)
+        self.assertNotIn('?v=', html)
+
+    def test_hashed_asset_is_immutable_and_compressed(self):
+        url = f'/static/{self.style}'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'{', body)
+
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(plain.streaming_content), body)
+
+        revalidate = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(revalidate.status_code, 304)
+
+    def test_unhashed_names_and_bad_paths(self):
+        response = self.client.get('/static/store/style.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.client.get('/static/store/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+        self.assertEqual(self.client.post(f'/static/{self.style}').status_code, 405)
+
+
+class MediaServingTests(TestCase):
+    """Uploads are served with validators, byte ranges and optional offload."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        os.makedirs(os.path.join(self.media_root, 'clothes', 'front'))
+        self.content = bytes(range(256)) * 40
+        with open(os.path.join(self.media_root, 'clothes', 'front', 'red dress.png'), 'wb') as f:
+            f.write(self.content)
+        self.url = '/media/clothes/front/red%20dress.png'
+
+    def test_full_file_and_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-10:])
+        open_ended = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content) - 5}-')
+        self.assertEqual(b''.join(open_ended.streaming_content), self.content[-5:])
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], f'bytes */{len(self.content)}')
+
+        # A stale If-Range gets the whole (new) file instead of a mismatched slice
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        current = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(current.status_code, 206)
+
+    @override_settings(STORE_MEDIA_OFFLOAD='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/clothes/front/red%20dress.png')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response.has_header('ETag'))
+
+    @override_settings(STORE_MEDIA_OFFLOAD='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'clothes', 'front', 'red dress.png'))
+        self.assertEqual(response.content, b'')
+
+    def test_missing_and_unsafe_paths(self):
+        self.assertEqual(self.client.get('/media/clothes/front/nope.png').status_code, 404)
+        self.assertEqual(self.client.get('/media/clothes').status_code, 404)
+        self.assertEqual(self.client.get('/media/%2E%2E/settings.py').status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class SQLiteModeTests(TransactionTestCase):
+    """WAL, busy timeouts and read/write routing keep readers going while writes queue."""
+
+    databases = {'default', 'reader'}
+
+    READERS = 3
+    SECONDS = 1.0
+
+    def setUp(self):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        category = Category.objects.create(name='Dresses')
+        Cloth.objects.bulk_create(
+            Cloth(name=f'Dress {i}', price=1000 + i, category=category, manager=manager) for i in range(200)
+        )
+        self.cloth = Cloth.objects.first()
+
+    def test_connections_are_configured(self):
+        self.assertEqual(db.pragma('journal_mode'), 'wal')
+        self.assertEqual(db.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(db.pragma('busy_timeout'), 20000)
+        self.assertEqual(connections['default'].transaction_mode, 'IMMEDIATE')
+        self.assertEqual(connections['default'].settings_dict['CONN_MAX_AGE'], 600)
+
+    def test_no_persistent_connections_under_asgi(self):
+        script = ("import kush.asgi; from django.db import connections; "
+                  "print([connections[alias].settings_dict['CONN_MAX_AGE'] for alias in connections])")
+        env = {key: value for key, value in os.environ.items() if key != 'KUSH_ASGI'}
+        output = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[0, 0]')
+
+    def test_routing(self):
+        self.assertEqual(Cloth.objects.all().db, 'reader')
+        self.assertEqual(Cloth.objects.select_for_update().db, 'default')
+        with transaction.atomic():
+            # Read-your-writes inside a transaction
+            self.assertEqual(Cloth.objects.all().db, 'default')
+
+    def reads_per_second(self, during=None):
+        stop = threading.Event()
+        counts, errors = [0] * self.READERS, []
+
+        def read(n):
+            try:
+                while not stop.is_set():
+                    list(Cloth.objects.filter(status='available').order_by('-created_at')[:24])
+                    counts[n] += 1
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=read, args=(n,)) for n in range(self.READERS)]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        if during:
+            during()
+        remaining = self.SECONDS - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        self.assertEqual(errors, [])
+        return sum(counts) / elapsed
+
+    def test_reads_hold_up_during_write_burst(self):
+        baseline = self.reads_per_second()
+        written, errors = [], []
+
+        def write_burst():
+            def write(n):
+                try:
+                    for i in range(25):
+                        with transaction.atomic():
+                            Cloth.objects.filter(pk=self.cloth.pk).update(likes=F('likes') + 1)
+                            SiteReview.objects.create(name=f'w{n}-{i}', review_text='Lovely')
+                        written.append(1)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    connections.close_all()
+
+            writers = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+            for writer in writers:
+                writer.start()
+            for writer in writers:
+                writer.join()
+
+        during = self.reads_per_second(write_burst)
+        print(f"\nreads/sec: {baseline:.0f} idle, {during:.0f} during a 100-transaction write burst")
+        # No "database is locked": every writer waited its turn and every read succeeded
+        self.assertEqual(errors, [])
+        self.assertEqual(len(written), 100)
+        self.cloth.refresh_from_db()
+        self.assertEqual(self.cloth.likes, 100)
+        # Readers are never blocked by the writer; what they lose is CPU time shared with it
+        self.assertGreater(during, baseline * 0.25)
+
+    def test_maintenance_command(self):
+        out = StringIO()
+        call_command('sqlite_maintenance', stdout=out)
+        self.assertIn('journal_mode=wal', out.getvalue())
+        self.assertIn('ANALYZE, OPTIMIZE, checkpoint TRUNCATE', out.getvalue())
+        self.assertEqual(db.pragma('wal_checkpoint(PASSIVE)')[1], 0)
+        with self.assertRaises(CommandError):
+            call_command('sqlite_maintenance', database='missing', stdout=StringIO())
+
+
+class RateLimitTests(TestCase):
+    """Anonymous writes are limited per IP in the cache, before touching the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        category = Category.objects.create(name='Dresses')
+        cls.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=category, manager=manager)
+        cls.other = Cloth.objects.create(name='Blue Dress', price=15000, category=category, manager=manager)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('5/h'), (5, 3600))
+        self.assertEqual(ratelimit.parse_rate('10/5m'), (10, 300))
+        with self.assertRaises(ValueError):
+            ratelimit.parse_rate('5 per hour')
+
+    def test_client_ip_ignores_spoofed_forwarding(self):
+        factory = RequestFactory()
+        spoofed = factory.post('/', REMOTE_ADDR='203.0.113.9', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(ratelimit.client_ip(spoofed), '203.0.113.9')
+        # Behind the local proxy: the right-most address the proxy did not add
+        proxied = factory.post('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 198.51.100.7')
+        self.assertEqual(ratelimit.client_ip(proxied), '198.51.100.7')
+
+    def test_sliding_window(self):
+        start = 1_000_000 * 60  # on a window boundary
+        for i in range(3):
+            self.assertEqual(ratelimit.hit('t', 'ip', 3, 60, now=start + i), 0)
+        self.assertEqual(ratelimit.hit('t', 'ip', 3, 60, now=start + 10), 50)
+        # Half-way into the next window half of the previous 4 hits still count
+        self.assertEqual(ratelimit.hit('t', 'ip', 3, 60, now=start + 90), 0)
+        self.assertGreater(ratelimit.hit('t', 'ip', 3, 60, now=start + 91), 0)
+        self.assertEqual(ratelimit.hit('t', 'ip', 3, 60, now=start + 180), 0)
+        self.assertEqual(ratelimit.hit('t', 'other-ip', 3, 60, now=start + 10), 0)
+
+    def test_duplicate_like_is_rejected_without_queries(self):
+        url = reverse('like_cloth', args=[self.cloth.pk])
+        self.assertEqual(self.client.post(url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 3500)
+        self.assertEqual(self.client.post(reverse('like_cloth', args=[self.other.pk])).status_code, 200)
+        # Another visitor can still like it
+        self.assertEqual(self.client.post(url, REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+    def test_one_rating_per_ip(self):
+        url = reverse('submit_rating')
+        # A rejected submission does not use up the IP's rating
+        self.assertEqual(self.client.post(url, {'rating': 9}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'rating': 5}).status_code, 200)
+        response = self.client.post(url, {'rating': 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(json.loads(response.content)['success'])
+        self.assertEqual(SiteRating.objects.count(), 1)
+
+    @override_settings(STORE_RATE_LIMITS={'review': {'rate': '3/m', 'dedupe': 60}})
+    def test_review_rate_and_duplicates(self):
+        url = reverse('submit_review')
+        self.assertEqual(self.client.post(url, {'name': 'Ann', 'review_text': 'Lovely dresses'}).status_code, 200)
+        response = self.client.post(url, {'name': 'Ann', 'review_text': '  lovely   DRESSES '})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.post(url, {'name': 'Ann', 'review_text': 'Fast delivery'}).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'name': 'Ann', 'review_text': 'Great prices'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(SiteReview.objects.count(), 2)
+
+    def test_async_views_keep_cache_calls_off_the_event_loop(self):
+        backend = type(caches['default'])
+        on_loop = []
+
+        def watch(method):
+            original = getattr(backend, method)
+
+            def watched(self, key, *args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass
+                else:
+                    if 'ratelimit' in key:
+                        on_loop.append(method)
+                return original(self, key, *args, **kwargs)
+            return watched
+
+        post = async_to_sync(self.async_client.post)
+        url = reverse('submit_rating')
+        with mock.patch.multiple(backend, **{m: watch(m) for m in ('add', 'get', 'incr', 'set', 'delete')}):
+            # The 400 releases its dedupe claim again
+            statuses = [post(url, {'rating': rating}).status_code for rating in (9, 5, 1)]
+        self.assertEqual(statuses, [400, 200, 429])
+        self.assertEqual(on_loop, [])
+
+    @override_settings(STORE_RATE_LIMITS={})
+    def test_policies_can_be_disabled(self):
+        url = reverse('like_cloth', args=[self.cloth.pk])
+        self.assertEqual([self.client.post(url).status_code for _ in range(3)], [200, 200, 200])
+
+
+class CompressionTests(TestCase):
+    """HTML is minified without touching whitespace-sensitive blocks, then gzipped when negotiated."""
+
+    HTML = (
+        '<html>\n  <head>\n    <!-- build 42 -->\n    <!--[if IE]><p>old</p><![endif]-->\n'
+        '    <style>\n      body {\n        color: red;\n      }\n    </style>\n'
+        '    <script>\n      var a = 1;   // keep\n    </script>\n  </head>\n'
+        '  <body>\n    <p title="two  spaces">Hello   world</p>\n'
+        '    <pre>\n  line one\n    line two\n</pre>\n'
+        '    <textarea>\n  typed\n</textarea>\n  </body>\n</html>\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        manager = User.objects.create_user('manager', is_staff=True)
+        category = Category.objects.create(name='Dresses')
+        Cloth.objects.create(name='Red Dress', price=15000, category=category, manager=manager)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_minify_keeps_whitespace_sensitive_blocks(self):
+        html = compression.minify_html(self.HTML)
+        self.assertNotIn('build 42', html)
+        self.assertIn('<!--[if IE]><p>old</p><![endif]-->', html)
+        self.assertIn('<pre>\n  line one\n    line two\n</pre>', html)
+        self.assertIn('<textarea>\n  typed\n</textarea>', html)
+        self.assertIn('<script>\n      var a = 1;   // keep\n    </script>', html)
+        self.assertIn('<style>\nbody {\ncolor: red;\n}\n</style>', html)
+        self.assertIn('<p title="two  spaces">Hello   world</p>', html)
+        self.assertNotRegex(html, r'\n[ \t]+<(?!/?(pre|textarea|script))')
+        self.assertLess(len(html), len(self.HTML))
+
+    def test_streaming_minify_matches_whole_document(self):
+        expected = compression.minify_html(self.HTML).encode()
+        data = self.HTML.encode()
+        for size in (1, 7, 64):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(b''.join(compression.minify_stream(chunks)), expected, size)
+
+        async def achunks():
+            for i in range(0, len(data), 5):
+                yield data[i:i + 5]
+
+        async def collect():
+            return b''.join([chunk async for chunk in compression.aminify_stream(achunks())])
+
+        self.assertEqual(async_to_sync(collect)(), expected)
+
+    def test_pages_are_minified_and_gzipped_when_accepted(self):
+        url = reverse('landing_page')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertNotRegex(plain.content.decode(), r'\n[ \t]+<(?!/?(pre|textarea|script))')
+
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['X-Cache'], 'HIT')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(int(compressed['Content-Length']), len(compressed.content))
+        self.assertLess(len(compressed.content), len(plain.content) / 3)
+
+        refused = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', refused)
+        self.assertEqual(refused.content, plain.content)
+
+    def test_uncached_responses_are_compressed_on_the_fly(self):
+        response = self.client.get(reverse('api_cloth_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 1)
+
+    @override_settings(STORE_MINIFY_HTML=False)
+    def test_minification_can_be_disabled(self):
+        response = self.client.get(reverse('landing_page'))
+        self.assertRegex(response.content.decode(), r'\n[ \t]+<')
+
+    def test_transfer_benchmark(self):
+        call_command('seed_catalogue', categories=2, clothes=10, reviews=3, ratings=3, stdout=StringIO())
+        results = benchmark.measure_transfer(routes=['landing_page', 'cloth_list', 'manager_login'])
+        results = results['results']['transfer']
+        self.assertEqual(set(results), {'landing_page', 'cloth_list', 'manager_login'})
+        for sizes in results.values():
+            self.assertLessEqual(sizes['minified'], sizes['raw'])
+            self.assertLess(sizes['gzip'], sizes['minified'])
+            self.assertGreater(sizes['saved_pct'], 30)
+
+
+class ImageDerivativeTests(TestCase):
+    """Resized WebP/JPEG copies follow the cloth's images and feed the <picture> markup."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', is_staff=True)
+        cls.category = Category.objects.create(name='Dresses')
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        media = override_settings(MEDIA_ROOT=self.tmp)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, name, size=(1200, 800)):
+        content = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(content, 'PNG')
+        return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+    def save_form(self, instance=None, **files):
+        data = {'name': 'Red Dress', 'price': '15000', 'status': 'available', 'category': self.category.pk}
+        # None ticks the field's "Clear" checkbox
+        data.update({f'{key}-clear': 'on' for key, value in files.items() if value is None})
+        form = ClothForm(data, {key: value for key, value in files.items() if value is not None},
+                         instance=instance or Cloth(manager=self.manager))
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def files(self, record):
+        return [name for ext in images.DERIVATIVE_FORMATS for name in record[ext].values()]
+
+    def test_saving_an_image_renders_every_width_and_format(self):
+        cloth = self.save_form(image_front=self.upload('red.png'))
+        record = Cloth.objects.get(pk=cloth.pk).image_derivatives['image_front']
+        self.assertEqual(record['source'], cloth.image_front.name)
+        for ext, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            self.assertEqual(set(record[ext]), {str(width) for width in images.DERIVATIVE_WIDTHS})
+            for width, name in record[ext].items():
+                with Image.open(os.path.join(self.tmp, name)) as image:
+                    self.assertEqual((image.format, image.width), (image_format, int(width)))
+                    self.assertEqual(image.height, round(int(width) * 2 / 3))
+
+        # A narrow image is never upscaled
+        self.assertEqual(images.target_widths(500), [320, 500])
+
+    def test_replacing_and_clearing_remove_stale_derivatives(self):
+        cloth = self.save_form(image_front=self.upload('red.png'), image_left=self.upload('side.png'))
+        old = self.files(cloth.image_derivatives['image_front'])
+
+        cloth = self.save_form(cloth, image_front=self.upload('blue.png', size=(700, 700)))
+        record = cloth.image_derivatives['image_front']
+        self.assertEqual(record['source'], cloth.image_front.name)
+        self.assertEqual(set(record['webp']), {'320', '640', '700'})
+        self.assertFalse([name for name in old if os.path.exists(os.path.join(self.tmp, name))])
+        self.assertTrue(all(os.path.exists(os.path.join(self.tmp, name)) for name in self.files(record)))
+
+        left = self.files(cloth.image_derivatives['image_left'])
+        cloth = self.save_form(cloth, image_left=None)
+        self.assertFalse(cloth.image_left)
+        self.assertNotIn('image_left', Cloth.objects.get(pk=cloth.pk).image_derivatives)
+        self.assertFalse([name for name in left if os.path.exists(os.path.join(self.tmp, name))])
+
+    def test_picture_markup(self):
+        cloth = self.save_form(image_front=self.upload('red.png'))
+        template = Template(
+            "{% load store_images %}{% cloth_picture cloth 'image_front' sizes='280px' alt='Red' loading='lazy' %}"
+            "|{% cloth_thumbnail_url cloth 'image_front' %}"
+        )
+        picture, thumbnail = template.render(Context({'cloth': cloth})).split('|')
+        webp = ', '.join(f"/media/{cloth.image_derivatives['image_front']['webp'][str(w)]} {w}w"
+                         for w in images.DERIVATIVE_WIDTHS)
+        jpeg = ', '.join(f"/media/{cloth.image_derivatives['image_front']['jpeg'][str(w)]} {w}w"
+                         for w in images.DERIVATIVE_WIDTHS)
+        smallest = f"/media/{cloth.image_derivatives['image_front']['jpeg']['320']}"
+        self.assertTrue(picture.startswith(f'<picture><source type="image/webp" srcset="{webp}" sizes="280px">'))
+        self.assertIn(f'<img src="{smallest}" srcset="{jpeg}" sizes="280px" alt="Red"', picture)
+        self.assertIn('loading="lazy"', picture)
+        self.assertTrue(picture.endswith('</picture>'))
+        self.assertEqual(thumbnail, f"/media/{cloth.image_derivatives['image_front']['webp']['320']}")
+
+        # Without derivatives: the original upload, and nothing for an empty field
+        Cloth.objects.filter(pk=cloth.pk).update(image_derivatives={})
+        cloth.refresh_from_db()
+        picture, thumbnail = template.render(Context({'cloth': cloth})).split('|')
+        self.assertEqual(picture, f'<img src="{cloth.image_front.url}" alt="Red" loading="lazy">')
+        self.assertEqual(thumbnail, cloth.image_front.url)
+        self.assertEqual(Template("{% load store_images %}{% cloth_picture cloth 'image_left' %}")
+                         .render(Context({'cloth': cloth})), '')
+
+    def test_command_backfills_and_is_idempotent(self):
+        cloth = Cloth.objects.create(name='Red Dress', price=15000, category=self.category, manager=self.manager,
+                                     image_front=self.upload('red.png'))
+        self.assertEqual(cloth.image_derivatives, {})
+
+        out = StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('Updated derivatives for 1 item(s)', out.getvalue())
+        record = Cloth.objects.get(pk=cloth.pk).image_derivatives['image_front']
+        self.assertTrue(all(os.path.exists(os.path.join(self.tmp, name)) for name in self.files(record)))
+        mtimes = {name: os.stat(os.path.join(self.tmp, name)).st_mtime_ns for name in self.files(record)}
+
+        out = StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('Updated derivatives for 0 item(s)', out.getvalue())
+        self.assertEqual(Cloth.objects.get(pk=cloth.pk).image_derivatives['image_front'], record)
+        self.assertEqual({name: os.stat(os.path.join(self.tmp, name)).st_mtime_ns for name in mtimes}, mtimes)
+
+
+class ImageMetadataTests(TestCase):
+    """Image size, colour and placeholder are stored once and rendered without opening the file."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', is_staff=True)
+        cls.category = Category.objects.create(name='Dresses')
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        media = override_settings(MEDIA_ROOT=self.tmp)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        # Three quarters red, one quarter blue
+        image = Image.new('RGB', (300, 400), (200, 30, 30))
+        image.paste((20, 40, 220), (0, 300, 300, 400))
+        content = BytesIO()
+        image.save(content, 'PNG')
+        self.cloth = Cloth.objects.create(
+            name='Red Dress', price=15000, category=self.category, manager=self.manager,
+            image_front=SimpleUploadedFile('red.png', content.getvalue()),
+        )
+        images.generate_derivatives(self.cloth)
+        Cloth.objects.filter(pk=self.cloth.pk).update(image_derivatives=self.cloth.image_derivatives)
+
+    def test_metadata_is_recorded_with_the_derivatives(self):
+        meta = images.metadata(self.cloth, 'image_front')
+        self.assertEqual((meta['width'], meta['height'], meta['color']), (300, 400, '#c81e1e'))
+        prefix = 'data:image/webp;base64,'
+        self.assertTrue(meta['placeholder'].startswith(prefix))
+        self.assertLess(len(meta['placeholder']), 600)
+        with Image.open(BytesIO(base64.b64decode(meta['placeholder'][len(prefix):]))) as preview:
+            self.assertEqual(preview.size, (12, 16))
+        self.assertEqual(images.metadata(self.cloth, 'image_left'), {})
+
+    def test_templates_reserve_space_and_paint_the_placeholder(self):
+        html = self.client.get(reverse('category_detail', args=[self.category.slug])).content.decode()
+        self.assertIn('width="300" height="400"', html)
+        self.assertIn('style="background:#c81e1e url(data:image/webp;base64,', html)
+        data = self.client.get(reverse('api_cloth_detail', args=[self.cloth.pk]), {'fields': 'images'}).json()
+        self.assertEqual(data['images']['front']['color'], '#c81e1e')
+
+    def test_backfill_adds_metadata_without_rerendering(self):
+        record = self.cloth.image_derivatives['image_front']
+        legacy = {key: value for key, value in record.items() if key not in images.METADATA_KEYS}
+        Cloth.objects.filter(pk=self.cloth.pk).update(image_derivatives={'image_front': legacy})
+        rendered = os.path.join(self.tmp, record['webp']['300'])
+        mtime = os.stat(rendered).st_mtime_ns
+
+        out = StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('Updated derivatives for 1 item(s)', out.getvalue())
+        self.assertEqual(Cloth.objects.get(pk=self.cloth.pk).image_derivatives['image_front'], record)
+        self.assertEqual(os.stat(rendered).st_mtime_ns, mtime)
+
+        call_command('generate_image_derivatives', stdout=out)
+        self.assertIn('Updated derivatives for 0 item(s)', out.getvalue())
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Just enough of an SMTP server on 127.0.0.1 for the outbox tests.
+
+    Records every connection and delivered message. Addresses in `reject`
+    get a permanent 550 at RCPT; the next `fail_data` messages get a
+    temporary 451 after DATA.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), LocalSMTPHandler)
+        self.port = self.server_address[1]
+        self.connections = 0
+        self.messages = []
+        self.reject = set()
+        self.fail_data = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class LocalSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 localhost ready')
+        sender, recipients = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip().strip('<>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.reject:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                if server.fail_data:
+                    server.fail_data -= 1
+                    self.reply('451 Try again later')
+                else:
+                    server.messages.append((sender, recipients, data))
+                    self.reply('250 Queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:  # RSET, NOOP
+                self.reply('250 OK')
+
+
+class OutboxTests(TestCase):
+    """Contact messages are queued by the view and delivered by send_outbox."""
+
+    def setUp(self):
+        self.smtp = LocalSMTPServer()
+        self.addCleanup(self.smtp.stop)
+        smtp = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.smtp.port, EMAIL_USE_TLS=False, EMAIL_HOST_USER='',
+            STORE_OUTBOX_MAX_ATTEMPTS=3, STORE_OUTBOX_RETRY_DELAY=60,
+        )
+        smtp.enable()
+        self.addCleanup(smtp.disable)
+
+    def enqueue(self, n, to='shop@example.com'):
+        for i in range(n):
+            outbox.enqueue(f'Message {i}', 'Hello', [to], 'site@example.com')
+
+    def make_due(self):
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+
+    def closed_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    @override_settings(EMAIL_HOST_USER='shop@example.com', STORE_RATE_LIMITS={})
+    def test_view_only_queues(self):
+        # Nothing is listening: the request must not notice
+        with override_settings(EMAIL_PORT=self.closed_port()):
+            response = self.client.post(reverse('send_message'),
+                                        {'name': 'Ann', 'email': 'ann@example.com', 'message': 'Hi'})
+        self.assertEqual(response.status_code, 200)
+        message = OutgoingEmail.objects.get()
+        self.assertEqual((message.status, message.to, message.reply_to),
+                         (OutgoingEmail.PENDING, ['shop@example.com'], ['ann@example.com']))
+        self.assertEqual(self.smtp.connections, 0)
+
+        out = StringIO()
+        call_command('send_outbox', stdout=out)
+        self.assertIn('Sent 1 email(s)', out.getvalue())
+        self.assertIn(b'Reply-To: ann@example.com', self.smtp.messages[0][2])
+
+    @override_settings(STORE_RATE_LIMITS={})
+    def test_view_rejects_line_breaks_in_headers(self):
+        for field, value in (('name', 'Ann\r\nBcc: all@example.com'), ('email', 'ann@example.com\nX: y')):
+            data = {'name': 'Ann', 'email': 'ann@example.com', 'message': 'Hi', field: value}
+            response = self.client.post(reverse('send_message'), data)
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_batches_share_one_connection(self):
+        self.enqueue(5)
+        self.assertEqual(outbox.send_batch(batch_size=10), {'sent': 5, 'retry': 0, 'dead': 0})
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.SENT).exists())
+
+        self.enqueue(5)
+        self.assertEqual(outbox.drain(batch_size=2)['sent'], 5)
+        self.assertEqual(self.smtp.connections, 4)
+
+    def test_temporary_failure_is_retried_with_backoff(self):
+        self.enqueue(3)
+        self.smtp.fail_data = 1
+        self.assertEqual(outbox.drain(), {'sent': 2, 'retry': 1, 'dead': 0})
+        failed = OutgoingEmail.objects.get(status=OutgoingEmail.PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('451', failed.last_error)
+        self.assertAlmostEqual((failed.next_attempt_at - failed.created_at).total_seconds(), 60, delta=5)
+
+        # Not due yet
+        self.assertEqual(outbox.drain(), {'sent': 0, 'retry': 0, 'dead': 0})
+        self.make_due()
+        self.assertEqual(outbox.drain()['sent'], 1)
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts, failed.last_error), (OutgoingEmail.SENT, 2, ''))
+        self.assertEqual([outbox.retry_delay(n) for n in (1, 2, 3)], [60, 120, 240])
+
+    def test_unreachable_server_uses_no_attempts(self):
+        self.enqueue(2)
+        with override_settings(EMAIL_PORT=self.closed_port()):
+            # Longer than STORE_OUTBOX_MAX_ATTEMPTS would allow
+            for attempt in range(5):
+                self.make_due()
+                counts = outbox.drain()
+        self.assertEqual(counts, {'sent': 0, 'retry': 2, 'dead': 0})
+        pending = OutgoingEmail.objects.filter(status=OutgoingEmail.PENDING, attempts=0)
+        self.assertEqual(pending.count(), 2)
+        self.assertIn('ConnectionRefusedError', pending[0].last_error)
+        self.assertAlmostEqual((pending[0].next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+
+        self.make_due()
+        self.assertEqual(outbox.drain(), {'sent': 2, 'retry': 0, 'dead': 0})
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.SENT, attempts=1).count(), 2)
+
+    def test_rejected_recipient_is_dead_at_once(self):
+        self.smtp.reject.add('nobody@example.com')
+        self.enqueue(1, to='nobody@example.com')
+        self.enqueue(1)
+        self.assertEqual(outbox.drain(), {'sent': 1, 'retry': 0, 'dead': 1})
+        dead = OutgoingEmail.objects.get(status=OutgoingEmail.DEAD)
+        self.assertEqual(dead.to, ['nobody@example.com'])
+        self.assertIn('550', dead.last_error)
+
+        self.smtp.reject.clear()
+        out = StringIO()
+        call_command('send_outbox', retry_dead=True, stdout=out)
+        self.assertIn('Queued 1 failed email(s) again', out.getvalue())
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.SENT).count(), 2)
+
+
+class LeanMiddlewareTests(TestCase):
+    """Public pages skip sessions, users and messages; /manager/ and /admin/ keep them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True, is_superuser=True)
+        cls.category = Category.objects.create(name='Dresses')
+        cls.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=cls.category, manager=cls.manager)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def session_queries(self, url):
+        # Inside the test transaction every read uses the default connection too
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        tables = ' '.join(q['sql'] for q in queries.captured_queries)
+        return response, [table for table in ('django_session', 'auth_user') if table in tables]
+
+    def test_public_pages_skip_the_session(self):
+        for url in (reverse('landing_page'), reverse('about'), reverse('category_detail', args=[self.category.slug])):
+            response, tables = self.session_queries(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(tables, [], url)
+            self.assertTrue(response.wsgi_request.user.is_anonymous)
+            self.assertNotIn('Cookie', response.get('Vary', ''), url)
+        # The signed-in manager now gets the same cached page as everyone else
+        self.assertEqual(self.client.get(reverse('landing_page'))['X-Cache'], 'HIT')
+
+    def test_manager_and_admin_keep_the_full_stack(self):
+        response, tables = self.session_queries(reverse('manager_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tables, ['django_session', 'auth_user'])
+
+        # Everything under /manager/ does, including the cloth pages with their manager controls
+        response, tables = self.session_queries(reverse('cloth_detail', args=[self.cloth.pk]))
+        self.assertIn('django_session', tables)
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+        self.assertContains(response, reverse('edit_cloth', args=[self.cloth.pk]))
+        response, tables = self.session_queries(reverse('cloth_list'))
+        self.assertIn('django_session', tables)
+        self.assertContains(response, reverse('add_cloth'))
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
+
+        self.client.logout()
+        response = self.client.post(reverse('manager_login'), {'username': 'manager', 'password': 'nope'},
+                                    follow=True)
+        self.assertContains(response, 'Invalid credentials')
+
+    @override_settings(STORE_LEAN_PUBLIC_PAGES=False)
+    def test_lean_path_can_be_disabled(self):
+        response, tables = self.session_queries(reverse('about'))
+        self.assertEqual(tables, ['django_session', 'auth_user'])
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_async_views_on_the_lean_path(self):
+        response = async_to_sync(self.async_client.post)(reverse('like_cloth', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_middleware_benchmark(self):
+        call_command('seed_catalogue', categories=2, clothes=10, reviews=3, ratings=3, stdout=StringIO())
+        report = benchmark.measure_middleware(requests=2, warmup=1, routes=['about'])
+        full, lean = report['results']['full'], report['results']['lean']
+        self.assertEqual(set(full), {'about (anonymous)', 'about (signed-in)'})
+        self.assertGreater(full['about (signed-in)']['queries'], 0)
+        self.assertEqual(lean['about (signed-in)']['queries'], 0)
+
+
+class WarmCacheTests(TransactionTestCase):
+    """warm_cache renders the busiest pages once, in process or over HTTP."""
+
+    databases = {'default', 'reader'}
+
+    def setUp(self):
+        cache.clear()
+        manager = User.objects.create_user('manager', is_staff=True)
+        self.categories = [Category.objects.create(name=name) for name in ('Dresses', 'Skirts')]
+        self.clothes = [
+            Cloth.objects.create(name=f'Dress {i}', price=1000, category=self.categories[i % 2], manager=manager,
+                                 likes=i)
+            for i in range(4)
+        ]
+
+    def assertCached(self, paths):
+        for path in paths:
+            self.assertEqual(self.client.get(path)['X-Cache'], 'HIT', path)
+
+    def test_paths(self):
+        self.assertEqual(warmup.warm_paths(top_clothes=2), [
+            '/', '/about/', '/category/dresses/', '/category/skirts/',
+            f'/manager/clothes/{self.clothes[3].pk}/', f'/manager/clothes/{self.clothes[2].pk}/',
+        ])
+
+    def test_paths_include_the_first_rail_fragments(self):
+        dresses = self.categories[0]
+        for i in range(RAIL_SIZE):
+            Cloth.objects.create(name=f'Extra {i}', price=1000, category=dresses, manager=self.clothes[0].manager)
+        rail_end = dresses.clothes.order_by('id')[RAIL_SIZE - 1]
+        paths = warmup.warm_paths(top_clothes=0)
+        self.assertEqual(paths[4:], [f'/category/dresses/items/?after={rail_end.pk}'])
+
+        warmup.warm(paths)
+        self.assertCached(paths)
+
+    def test_in_process(self):
+        out = StringIO()
+        call_command('warm_cache', parallel=3, top=4, verify=True, stdout=out, stderr=StringIO())
+        self.assertIn('Warmed 8/8 page(s)', out.getvalue())
+        self.assertIn('Verified 8/8 page(s)', out.getvalue())
+        self.assertRegex(out.getvalue(), r'Compiled [1-9]\d* template\(s\)')
+        self.assertCached(warmup.warm_paths(top_clothes=4))
+
+    def test_over_http(self):
+        server = make_server('127.0.0.1', 0, get_wsgi_application(), handler_class=benchmark._QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        paths = warmup.warm_paths(top_clothes=1) + ['/category/missing/']
+        results = warmup.warm(paths, fetch=warmup.http_fetcher(f'http://127.0.0.1:{server.server_port}/'),
+                              parallel=2)
+        self.assertEqual([r['path'] for r in results], paths)
+        self.assertEqual([r['status'] for r in results], [200] * (len(paths) - 1) + [404])
+        self.assertTrue(all(r['ms'] > 0 for r in results))
+        self.assertCached(paths[:-1])
+
+
+@override_settings(STORE_RATE_LIMITS={}, STORE_METRICS_TOKEN='scrape-me')
+class MetricsTests(TestCase):
+    """Server-Timing headers, per-view latency stats and the staff-only metrics view."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.customer = User.objects.create_user('customer', password='secret')
+        category = Category.objects.create(name='Dresses')
+        cls.cloth = Cloth.objects.create(name='Red Dress', price=15000, category=category, manager=cls.manager)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def timings(self, response):
+        return {
+            part.split(';')[0]: float(re.search(r'dur=([\d.]+)', part)[1])
+            for part in response['Server-Timing'].split(', ')
+        }
+
+    @override_settings(DEBUG=True)
+    def test_server_timing(self):
+        response = self.client.get(reverse('category_detail', args=['dresses']))
+        self.assertEqual(set(self.timings(response)), {'db', 'tpl', 'img', 'total'})
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing'])[1])
+        self.assertGreater(queries, 0)
+        self.assertGreater(self.timings(response)['tpl'], 0)
+        self.assertGreaterEqual(self.timings(response)['total'], self.timings(response)['tpl'])
+
+        # Served from the page cache: no queries, no templates
+        response = self.client.get(reverse('category_detail', args=['dresses']))
+        self.assertIn('desc="0 queries"', response['Server-Timing'])
+        self.assertEqual(self.timings(response)['tpl'], 0)
+
+    def test_server_timing_only_for_staff(self):
+        dashboard = reverse('manager_dashboard')
+        self.assertNotIn('Server-Timing', self.client.get(reverse('about')))
+        self.client.force_login(self.customer)
+        self.assertNotIn('Server-Timing', self.client.get(dashboard))
+        self.client.force_login(self.manager)
+        self.assertIn('Server-Timing', self.client.get(dashboard))
+        # Public pages load no user, so not even staff get it there
+        self.assertNotIn('Server-Timing', self.client.get(reverse('about')))
+
+        # Under ASGI the user is loaded off the event loop
+        async_to_sync(self.async_client.aforce_login)(self.manager)
+        self.assertIn('Server-Timing', async_to_sync(self.async_client.get)(dashboard))
+
+    def test_per_view_stats(self):
+        for _ in range(3):
+            self.client.get(reverse('about'))
+        self.client.get('/no-such-page/')
+        views = metrics.registry.snapshot()
+        self.assertEqual(set(views), {'about', metrics.UNMATCHED})
+        about = views['about']
+        self.assertEqual(about['count'], 3)
+        self.assertEqual(about['window'], 3)
+        self.assertEqual(sum(about['buckets']), 3)
+        self.assertLessEqual(about['p50_ms'], about['p95_ms'])
+        self.assertLessEqual(about['p95_ms'], about['p99_ms'])
+
+    def test_window_and_quantiles(self):
+        stats = metrics.ViewStats(window=100)
+        for ms in range(1, 201):
+            stats.add(ms / 1000, metrics.RequestMetrics())
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['count'], snapshot['window']), (200, 100))
+        self.assertEqual((snapshot['p50_ms'], snapshot['p95_ms'], snapshot['p99_ms']), (150, 195, 199))
+        # Everything above 10s would land in +Inf only; all of these fit a bucket
+        self.assertEqual(sum(snapshot['buckets']), 200)
+
+    @override_settings(DEBUG=True)
+    def test_async_views_are_timed(self):
+        response = async_to_sync(self.async_client.post)(reverse('like_cloth', args=[self.cloth.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.snapshot()['like_cloth']['count'], 1)
+
+    @override_settings(STORE_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('about'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.snapshot(), {})
+
+    def test_metrics_view_access(self):
+        url = reverse('manager_metrics')
+        response = self.client.get(url)
+        self.assertRedirects(response, f"{reverse('manager_login')}?next={url}", fetch_redirect_response=False)
+        self.client.force_login(self.customer)
+        self.assertRedirects(self.client.get(url), reverse('manager_login'), fetch_redirect_response=False)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 302)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+        with override_settings(STORE_METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 302)
+
+    def test_metrics_view_formats(self):
+        self.client.get(reverse('about'))
+        self.client.force_login(self.manager)
+        data = self.client.get(reverse('manager_metrics')).json()
+        self.assertEqual(data['buckets'], list(metrics.BUCKETS))
+        self.assertEqual(data['views']['about']['count'], 1)
+
+        response = self.client.get(reverse('manager_metrics'), {'format': 'prometheus'})
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE store_request_duration_seconds histogram', text)
+        self.assertIn('store_request_duration_seconds_bucket{view="about",le="+Inf"} 1', text)
+        self.assertIn('store_request_duration_seconds_count{view="about"} 1', text)
+        self.assertRegex(text, r'store_request_recent_seconds\{view="about",quantile="0.95"\} [\d.]+')
+        self.assertRegex(text, r'store_db_queries_total\{view="about"\} \d+\n')
+        for line in text.splitlines():
+            if not line.startswith('#'):
+                self.assertRegex(line, r'^[a-z_]+\{[^}]*\} [\d.]+$')
+
+
+@override_settings(STORE_RATE_LIMITS={})
+class SlowQueryLogTests(TestCase):
+    """Queries are made 'slow' with a zero threshold, only while the log is captured."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.category = Category.objects.create(name='Dresses')
+        cls.cloth, *_ = Cloth.objects.bulk_create(
+            Cloth(name=f'Dress {i}', price=1000 + i, category=cls.category, manager=cls.manager) for i in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+        slowqueries._plans.clear()
+
+    def logged(self, action):
+        with self.settings(STORE_SLOW_QUERY_MS=0), self.assertLogs('store.slowqueries', 'WARNING') as logs:
+            result = action()
+        return result, [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_normalize(self):
+        self.assertEqual(
+            slowqueries.normalize("SELECT  \"t\".\"id\" FROM t\n WHERE name = 'O''Neil' AND price > 25.5 "
+                                  "AND id IN (%s, %s, %s) LIMIT 21"),
+            'SELECT "t"."id" FROM t WHERE name = ? AND price > ? AND id IN (...) LIMIT ?',
+        )
+        self.assertEqual(slowqueries.normalize('SELECT x1 FROM store_t2 WHERE y = %(y)s'),
+                         'SELECT x1 FROM store_t2 WHERE y = ?')
+
+    def test_full_scans_in_plan(self):
+        plan = ['CO-ROUTINE qualify', 'SEARCH store_cloth USING INDEX store_cloth_category (category_id=?)',
+                'SCAN qualify', 'SCAN TABLE store_siterating', 'SCAN store_cloth AS U0',
+                'SCAN store_category USING COVERING INDEX sqlite_autoindex_store_category_1']
+        self.assertEqual(slowqueries.full_scans(plan), ['store_cloth', 'store_siterating'])
+
+    def test_request_queries_are_logged_with_view_and_plan(self):
+        response, entries = self.logged(lambda: self.client.get(reverse('category_detail', args=['dresses'])))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(entry['view'] == 'category_detail' for entry in entries))
+        category = next(entry for entry in entries if '"store_category"' in entry['sql'])
+        self.assertRegex(category['location'], r'^store/[\w/]+\.py:\d+ in \w+$')
+        self.assertEqual(category['params'], ['str'])
+        self.assertTrue(category['plan'])
+        self.assertNotIn('dresses', json.dumps(entries))
+
+    def test_full_scans_and_results_intact(self):
+        clothes, entries = self.logged(lambda: list(Cloth.objects.filter(description__contains='secret')))
+        self.assertEqual(clothes, [])
+        self.assertEqual(entries[0]['full_scans'], ['store_cloth'])
+        self.assertEqual(entries[0]['params'], ['str'])
+        self.assertNotIn('secret', json.dumps(entries))
+
+        clothes, entries = self.logged(lambda: list(Cloth.objects.filter(pk__in=[1, 2, 3]).order_by('pk')))
+        self.assertEqual(len(clothes), 3)
+        self.assertEqual(entries[0]['full_scans'], [])
+        self.assertIn('IN (...)', entries[0]['sql'])
+        self.assertEqual(entries[0]['view'], '')
+
+    def test_async_orm_has_no_location(self):
+        _, entries = self.logged(lambda: async_to_sync(Cloth.objects.filter(pk=self.cloth.pk).aupdate)(likes=1))
+        self.assertEqual([(entry['sql'][:6], entry['location']) for entry in entries], [('UPDATE', '')])
+
+    def test_threshold(self):
+        self.assertEqual(slowqueries.threshold(), 0.05)
+        with self.settings(STORE_SLOW_QUERY_MS=None), self.assertNoLogs('store.slowqueries'):
+            self.client.get(reverse('category_detail', args=['dresses']))
+
+    def test_command(self):
+        _, entries = self.logged(lambda: [
+            list(Cloth.objects.filter(description__contains=word)) for word in ('silk', 'wool', 'lace')
+        ] + [Cloth.objects.get(pk=self.cloth.pk)])
+        log = os.path.join(tempfile.mkdtemp(), 'slow.log')
+        self.addCleanup(shutil.rmtree, os.path.dirname(log))
+        with open(log, 'w') as f:
+            f.write('not json\n')
+            f.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+        out = StringIO()
+        call_command('slow_queries', file=log, sort='count', top=1, stdout=out)
+        self.assertIn(f'{len(entries)} slow queries logged', out.getvalue())
+        self.assertRegex(out.getvalue(), r'1\. [0-9a-f]{16}  3x  total')
+        self.assertIn('Full scan of store_cloth', out.getvalue())
+        self.assertIn('plan:  SCAN store_cloth', out.getvalue())
+        self.assertIn('views: - (3)', out.getvalue())
+        self.assertNotIn('2. ', out.getvalue())
+
+        out = StringIO()
+        call_command('slow_queries', file=log, full_scans=True, view='landing_page', stdout=out)
+        self.assertIn('No matching slow queries.', out.getvalue())
+        out = StringIO()
+        call_command('slow_queries', file=log + '.missing', stdout=out)
+        self.assertIn('No slow queries logged yet', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('slow_queries', file=log, top=0)
@@ -0,0 +1,144 @@
+"""
+Streaming upload handling for the manager cloth forms.
+
+Django's default handlers keep small uploads in memory and only check sizes
+once the whole body has been read. ``StreamingImageUploadHandler`` instead
+writes every chunk straight to a temporary file, enforces per-file and
+per-request limits while the bytes arrive, hashes the content as it goes and
+fixes EXIF orientation once the file is on disk. The hash (``sha256`` on the
+uploaded file) is always that of the bytes that end up stored: a rotated
+image is hashed again after it was rewritten.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, StopUpload, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+
+DEFAULT_MAX_FILE_SIZE = 15 * 1024 * 1024
+DEFAULT_MAX_REQUEST_SIZE = 40 * 1024 * 1024
+
+# Largest image decoded at full size to fix its orientation (~72 MB as RGB).
+# Larger JPEGs are decoded at 1/2, 1/4 or 1/8 scale instead (see normalise_orientation).
+MAX_NORMALISE_PIXELS = 24_000_000
+
+ORIENTATION_TAG = 0x0112
+
+
+class StreamingImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads to temporary files with size limits and a running SHA-256.
+
+    Problems are recorded in ``request.upload_errors`` (field name -> message)
+    so the form can report them; see ``ClothForm``.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+        if request is not None:
+            request.upload_errors = self.errors
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.max_file_size = getattr(settings, 'STORE_UPLOAD_MAX_FILE_SIZE', DEFAULT_MAX_FILE_SIZE)
+        self.max_request_size = getattr(settings, 'STORE_UPLOAD_MAX_REQUEST_SIZE', DEFAULT_MAX_REQUEST_SIZE)
+        self.request_too_large = content_length > self.max_request_size
+        self.request_bytes = 0
+
+    def new_file(self, field_name, *args, **kwargs):
+        if self.request_too_large:
+            self.errors[field_name] = self.request_limit_message()
+            # Drop the connection rather than reading the rest of the body
+            raise StopUpload(connection_reset=True)
+        super().new_file(field_name, *args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.request_bytes += len(raw_data)
+        if start + len(raw_data) > self.max_file_size:
+            self.errors[self.field_name] = f"Each image must be under {filesizeformat(self.max_file_size)}."
+            self.upload_interrupted()
+            raise SkipFile()
+        if self.request_bytes > self.max_request_size:
+            self.errors[self.field_name] = self.request_limit_message()
+            self.upload_interrupted()
+            raise StopUpload(connection_reset=True)
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def request_limit_message(self):
+        return f"Upload is larger than the {filesizeformat(self.max_request_size)} allowed per request."
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        try:
+            rewritten = normalise_orientation(uploaded.temporary_file_path())
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Not an image Pillow can rewrite; ImageField validation reports it
+            rewritten = False
+        if rewritten:
+            self.hasher = hash_file(uploaded.file, self.chunk_size)
+        uploaded.sha256 = self.hasher.hexdigest()
+        uploaded.size = uploaded.file.seek(0, 2)
+        uploaded.file.seek(0)
+        return uploaded
+
+
+def hash_file(f, chunk_size):
+    """SHA-256 of the whole of file object `f`, read in chunks."""
+    hasher = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        hasher.update(chunk)
+    return hasher
+
+
+def normalise_orientation(path):
+    """
+    Rotate the image at `path` in place so its pixels match its EXIF orientation.
+
+    Only the header is read for the common already-upright case. A rotated
+    JPEG above MAX_NORMALISE_PIXELS is decoded by libjpeg at the largest
+    1/2, 1/4 or 1/8 scale that fits (``Image.draft``), so it is still stored
+    upright, at a reduced size, with bounded memory. Other formats are
+    decoded whole, within Pillow's decompression-bomb limit. Returns True if
+    the file changed.
+    """
+    with Image.open(path) as image:
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+        if orientation == 1:
+            return False
+        image_format = image.format
+        if image_format == 'JPEG':
+            scale = 1
+            while image.width * image.height > MAX_NORMALISE_PIXELS * scale * scale and scale < 8:
+                scale *= 2
+            if scale > 1:
+                image.draft(image.mode, (-(-image.width // scale), -(-image.height // scale)))
+        rotated = ImageOps.exif_transpose(image)
+    save_kwargs = {'quality': 90} if image_format == 'JPEG' else {}
+    rotated.save(path, format=image_format, **save_kwargs)
+    return True
+
+
+def streaming_uploads(view):
+    """
+    Install ``StreamingImageUploadHandler`` for a view.
+
+    The handler must be in place before anything reads ``request.POST``, which
+    CsrfViewMiddleware would otherwise do first, so CSRF is checked inside the
+    wrapper instead (the pattern from Django's upload handler docs).
+    """
+    protected = csrf_protect(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
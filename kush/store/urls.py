@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from .views import send_message
 
 urlpatterns = [
@@ -8,6 +8,11 @@ urlpatterns = [
     path('send-contact/', views.send_message, name='send_message'),
     # Category detail page
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
+    # Next page of a landing-page category rail (HTML fragment)
+    path('category/<slug:slug>/items/', views.category_items, name='category_items'),
+
+    # Product search
+    path('search/', views.search, name='search'),
 
     # Public cloth views
     path('manager/clothes/', views.cloth_list, name='cloth_list'),
@@ -16,6 +21,7 @@ urlpatterns = [
     # Manager actions (staff only)
     path('manager/clothes/add/', views.add_cloth, name='add_cloth'),
     path('manager/clothes/<int:cloth_id>/edit/', views.edit_cloth, name='edit_cloth'),
+    path('manager/clothes/bulk/', views.bulk_update_clothes, name='bulk_update_clothes'),
 
     # Like endpoint
     path('clothes/<int:cloth_id>/like/', views.like_cloth, name='like_cloth'),
@@ -28,4 +34,11 @@ urlpatterns = [
     path('manager/login/', views.manager_login, name='manager_login'),
     path('manager/dashboard/', views.manager_dashboard, name='manager_dashboard'),
     path('manager/logout/', views.manager_logout, name='manager_logout'),
+    path('manager/metrics/', views.metrics_view, name='manager_metrics'),
+
+    # Read-only JSON catalogue API
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('api/clothes/', api.cloth_list, name='api_cloth_list'),
+    path('api/clothes/<int:cloth_id>/', api.cloth_detail, name='api_cloth_detail'),
+    path('api/search/', api.search, name='api_search'),
 ]
@@ -1,21 +1,47 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_protect
-from django.http import JsonResponse
-from .models import Cloth, SiteRating, SiteReview
-from .forms import ClothForm, SiteRatingForm, SiteReviewForm
+from django.http import HttpResponse, JsonResponse
+from .models import Cloth, SiteRating, SiteRatingSummary, SiteReview
+from .forms import BulkUpdateForm, ClothForm, SiteRatingForm, SiteReviewForm
+from .cache import cache_public_page, cache_timeout, cached, is_anonymous_visitor, version_token
+from .conditional import (
+    about_last_modified, catalogue_last_modified, category_last_modified,
+    cloth_last_modified, cloth_list_last_modified, conditional_page,
+)
+from .likes import aadd_like
+from . import metrics
+from .outbox import aenqueue
+from .ratelimit import client_ip, rate_limit
+from .search import search_clothes
+from .uploads import streaming_uploads
 from .models import Category
-from django.db.models import Avg
-from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from django.core.paginator import Paginator
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from django.http import JsonResponse
 import json
 
 
+# Number of clothes rendered per category rail before lazy loading kicks in
+RAIL_SIZE = getattr(settings, 'STORE_RAIL_SIZE', 8)
+
+# Results per page on the public search page
+SEARCH_PAGE_SIZE = 24
+
+
 # ----- Manager Login -----
 def manager_login(request):
     if request.method == 'POST':
@@ -33,25 +59,110 @@ def manager_login(request):
 
 
 # ----- Manager Dashboard -----
+
+# ?sort= value -> order_by field; prefix with '-' for descending
+DASHBOARD_SORTS = {
+    'name': 'name',
+    'category': 'category__name',
+    'price': 'price',
+    'status': 'status',
+    'likes': 'likes',
+    'created': 'created_at',
+}
+DASHBOARD_COLUMNS = [
+    ('Name', 'name'), ('Category', 'category'), ('Price', 'price'), ('Status', 'status'), ('Likes', 'likes'),
+]
+DASHBOARD_DEFAULT_SORT = '-created'
+DASHBOARD_PAGE_SIZE = 50
+
+
+def dashboard_queryset(user, params):
+    """A manager's clothes filtered by the dashboard's ?q= and ?status= parameters."""
+    clothes = Cloth.objects.filter(manager=user)
+    if params.get('q'):
+        clothes = clothes.filter(name__icontains=params['q'])
+    if params.get('status') in dict(Cloth.STATUS_CHOICES):
+        clothes = clothes.filter(status=params['status'])
+    return clothes
+
+
 @login_required(login_url='manager_login')
 def manager_dashboard(request):
     if not request.user.is_staff:
         return redirect('manager_login')  # Extra security
-    clothes = Cloth.objects.filter(manager=request.user)
-    
-    # Calculate statistics
-    total_items = clothes.count()
-    available_items = clothes.filter(status='available').count()
-    sold_items = clothes.filter(status='sold').count()
-    
+
+    # All three figures in one pass over the manager's rows
+    stats = Cloth.objects.filter(manager=request.user).aggregate(
+        total_items=Count('id'),
+        available_items=Count('id', filter=Q(status='available')),
+        sold_items=Count('id', filter=Q(status='sold')),
+    )
+
+    sort = request.GET.get('sort', DASHBOARD_DEFAULT_SORT)
+    if sort.lstrip('-') not in DASHBOARD_SORTS:
+        sort = DASHBOARD_DEFAULT_SORT
+    descending = sort.startswith('-')
+    field = ('-' if descending else '') + DASHBOARD_SORTS[sort.lstrip('-')]
+    clothes = (
+        dashboard_queryset(request.user, request.GET)
+        .select_related('category')
+        .order_by(field, '-id' if descending else 'id')  # id keeps pages stable on ties
+    )
+    page_size = getattr(settings, 'STORE_DASHBOARD_PAGE_SIZE', DASHBOARD_PAGE_SIZE)
+    page = Paginator(clothes, page_size).get_page(request.GET.get('page'))
+
+    columns = [
+        {
+            'label': label,
+            # Clicking the active column flips its direction
+            'sort': f'-{key}' if sort == key else key,
+            'direction': 'asc' if sort == key else 'desc' if sort == f'-{key}' else None,
+        }
+        for label, key in DASHBOARD_COLUMNS
+    ]
+
     return render(request, 'store/manager_dashboard.html', {
-        'clothes': clothes,
-        'total_items': total_items,
-        'available_items': available_items,
-        'sold_items': sold_items
+        'clothes': page.object_list,
+        'page': page,
+        'columns': columns,
+        'query': request.GET.get('q', ''),
+        'status_filter': request.GET.get('status', ''),
+        'status_choices': Cloth.STATUS_CHOICES,
+        'categories': Category.objects.order_by('name').only('id', 'name'),
+        'bulk_form': BulkUpdateForm(),
+        **stats,
     })
 
 
+@login_required(login_url='manager_login')
+@require_POST
+def bulk_update_clothes(request):
+    """Set status, category or price on many of the manager's clothes with one UPDATE."""
+    if not request.user.is_staff:
+        return redirect('manager_login')
+
+    form = BulkUpdateForm(request.POST)
+    if form.is_valid():
+        # The dashboard's filters come back as q/status_filter; `status` is the new value
+        clothes = dashboard_queryset(request.user, {
+            'q': request.POST.get('q'),
+            'status': request.POST.get('status_filter'),
+        })
+        if not form.cleaned_data['all_matching']:
+            clothes = clothes.filter(pk__in=form.cleaned_data['ids'])
+        updated = form.apply(clothes)
+        messages.success(request, f"Updated {updated} item{'s' if updated != 1 else ''}.")
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+
+    next_url = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('manager_dashboard')
+    return redirect(next_url)
+
+
 # ----- Logout -----
 @login_required(login_url='manager_login')
 def manager_logout(request):
@@ -59,93 +170,155 @@ def manager_logout(request):
     return redirect('manager_login')
 
 
+# ----- Metrics -----
+def metrics_view(request):
+    """Per-view latency figures for this process (store/metrics.py); staff or a scraper token only."""
+    token = getattr(settings, 'STORE_METRICS_TOKEN', '')
+    if not (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), 'manager_login')
+        if not request.user.is_staff:
+            return redirect('manager_login')
+
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(metrics.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    return JsonResponse({'buckets': metrics.BUCKETS, 'views': metrics.registry.snapshot()})
+
+
 from django.http import JsonResponse
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-# Simple like view - no login required, CSRF exempt for anonymous likes
+# Simple like view - no login required, CSRF exempt for anonymous likes.
+# The anonymous write endpoints are async: under ASGI a burst of clicks waits
+# on the event loop instead of holding one worker thread per request.
 @csrf_exempt
 @require_http_methods(["POST"])
-def like_cloth(request, cloth_id):
+@rate_limit('like', dedupe=lambda request, cloth_id: f'like:{cloth_id}')
+async def like_cloth(request, cloth_id):
     """Add one like to the cloth - anonymous users can like"""
     try:
-        cloth = Cloth.objects.get(id=cloth_id)
-        cloth.likes = (cloth.likes or 0) + 1
-        cloth.save()
-        return JsonResponse({'likes': cloth.likes, 'success': True})
-    except Cloth.DoesNotExist:
-        return JsonResponse({'error': 'Cloth not found'}, status=404)
+        likes = await aadd_like(cloth_id)
+        if likes is None:
+            return JsonResponse({'error': 'Cloth not found'}, status=404)
+        return JsonResponse({'likes': likes, 'success': True})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
 # ----- Public / Manager-facing Cloth views -----
+@conditional_page('catalogue', last_modified=cloth_list_last_modified)
 def cloth_list(request):
     """List available clothes. Use query params to show all (admin) or filter by category."""
     clothes = Cloth.objects.filter(status='available')
-    return render(request, 'store/cloth_list.html', {'clothes': clothes})
+    return render(request, 'store/cloth_list.html', {
+        'clothes': clothes,
+        # Checked without touching the session so anonymous responses stay cacheable
+        'is_manager': not is_anonymous_visitor(request) and request.user.is_staff,
+    })
+
 
+def public_page_context():
+    """Rating stats, recent reviews and fragment-cache settings shared by the public pages."""
+    return {
+        **cached('rating_stats', ['ratings'], SiteRatingSummary.stats),
+        'recent_reviews': SiteReview.objects.filter(is_approved=True)[:5],  # Last 5 approved reviews
+        'reviews_version': version_token('reviews'),
+        'fragment_timeout': cache_timeout(),
+    }
 
+
+@conditional_page('catalogue', 'reviews', 'ratings', last_modified=catalogue_last_modified)
+@cache_public_page('catalogue', 'reviews', 'ratings')
 def landing_page(request):
     """Render the main landing page using the Sample Kush template and categories from DB."""
-    # load categories and attach available clothes to each for the template
-    categories = list(Category.objects.all())
-    for cat in categories:
-        # show all clothes in each category
-        cat.items = cat.clothes.all()
-
-    # Get rating statistics
-    avg_rating = SiteRating.objects.aggregate(Avg('rating'))['rating__avg']
-    total_ratings = SiteRating.objects.count()
-    recent_reviews = SiteReview.objects.filter(is_approved=True)[:5]  # Last 5 approved reviews
+    # First RAIL_SIZE clothes of every category in one prefetch query (Django
+    # slices prefetches with a ROW_NUMBER() window); the rest of each rail is
+    # loaded on scroll from category_items.
+    categories = Category.objects.annotate(item_count=Count('clothes')).prefetch_related(
+        Prefetch('clothes', queryset=Cloth.objects.order_by('id')[:RAIL_SIZE], to_attr='items')
+    )
 
     return render(request, 'store/Sample Kush.html', {
         'categories': categories,
-        'average_rating': round(avg_rating, 1) if avg_rating else 0,
-        'total_ratings': total_ratings,
-        'recent_reviews': recent_reviews,
+        'catalogue_version': version_token('catalogue'),
+        **public_page_context(),
+    })
+
+
+@cache_public_page('category:{slug}')
+def category_items(request, slug):
+    """HTML fragment with the next page of a landing-page category rail (keyset on id)."""
+    category = get_object_or_404(Category, slug=slug)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+    clothes = list(category.clothes.filter(id__gt=after).order_by('id')[:RAIL_SIZE + 1])
+    next_after = clothes[RAIL_SIZE - 1].id if len(clothes) > RAIL_SIZE else None
+
+    return render(request, 'store/partials/cloth_rail_page.html', {
+        'category': category,
+        'clothes': clothes[:RAIL_SIZE],
+        'next_after': next_after,
     })
 
 
+@conditional_page('category:{slug}', 'reviews', 'ratings', last_modified=category_last_modified)
+@cache_public_page('category:{slug}', 'reviews', 'ratings')
 def category_detail(request, slug):
     """Display all clothes in a specific category."""
     category = get_object_or_404(Category, slug=slug)
     clothes = category.clothes.all()  # Get all clothes in this category
     
-    # Get rating statistics
-    avg_rating = SiteRating.objects.aggregate(Avg('rating'))['rating__avg']
-    total_ratings = SiteRating.objects.count()
-    recent_reviews = SiteReview.objects.filter(is_approved=True)[:5]
-    
     return render(request, 'store/category_detail.html', {
         'category': category,
         'clothes': clothes,
-        'average_rating': round(avg_rating, 1) if avg_rating else 0,
-        'total_ratings': total_ratings,
-        'recent_reviews': recent_reviews,
+        'category_version': version_token(f'category:{slug}'),
+        **public_page_context(),
     })
 
 
+@conditional_page('catalogue', 'reviews', 'ratings', last_modified=catalogue_last_modified)
+@cache_public_page('catalogue', 'reviews', 'ratings')
+def search(request):
+    """Ranked product search (``?q=``) over cloth names, descriptions and categories."""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    # One extra row tells us whether there is a next page
+    results = search_clothes(query, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE) if query else []
+
+    return render(request, 'store/search.html', {
+        'query': query,
+        'results': results[:SEARCH_PAGE_SIZE],
+        'page': page,
+        'has_next': len(results) > SEARCH_PAGE_SIZE,
+        **public_page_context(),
+    })
+
+
+@conditional_page('reviews', 'ratings', last_modified=about_last_modified)
+@cache_public_page('reviews', 'ratings')
 def about(request):
     """Render the about page."""
-    # Get rating statistics
-    avg_rating = SiteRating.objects.aggregate(Avg('rating'))['rating__avg']
-    total_ratings = SiteRating.objects.count()
-    recent_reviews = SiteReview.objects.filter(is_approved=True)[:5]
-    
-    return render(request, 'store/about.html', {
-        'average_rating': round(avg_rating, 1) if avg_rating else 0,
-        'total_ratings': total_ratings,
-        'recent_reviews': recent_reviews,
-    })
+    return render(request, 'store/about.html', public_page_context())
 
 
+@conditional_page('clothes', 'cloth:{cloth_id}', last_modified=cloth_last_modified)
+@cache_public_page('clothes', 'cloth:{cloth_id}')
 def cloth_detail(request, cloth_id):
     cloth = get_object_or_404(Cloth, id=cloth_id)
-    return render(request, 'store/cloth_detail.html', {'cloth': cloth})
+    return render(request, 'store/cloth_detail.html', {
+        'cloth': cloth,
+        'can_edit': not is_anonymous_visitor(request) and request.user == cloth.manager,
+    })
 
 
 @login_required(login_url='manager_login')
+@streaming_uploads
 def add_cloth(request):
     """Create a new Cloth. Only staff users may add and they become the assigned manager."""
     if not request.user.is_staff:
@@ -153,11 +326,12 @@ def add_cloth(request):
         return redirect('manager_login')
 
     if request.method == 'POST':
-        form = ClothForm(request.POST, request.FILES)
+        form = ClothForm(request.POST, request.FILES, upload_errors=request.upload_errors)
         if form.is_valid():
             cloth = form.save(commit=False)
             cloth.manager = request.user
             cloth.save()
+            form.save_m2m()
             messages.success(request, 'Cloth created')
             return redirect('cloth_detail', cloth_id=cloth.id)
     else:
@@ -167,6 +341,7 @@ def add_cloth(request):
 
 
 @login_required(login_url='manager_login')
+@streaming_uploads
 def edit_cloth(request, cloth_id):
     cloth = get_object_or_404(Cloth, id=cloth_id)
     # Only the assigned manager (staff) can edit
@@ -175,7 +350,7 @@ def edit_cloth(request, cloth_id):
         return redirect('cloth_detail', cloth_id=cloth.id)
 
     if request.method == 'POST':
-        form = ClothForm(request.POST, request.FILES, instance=cloth)
+        form = ClothForm(request.POST, request.FILES, instance=cloth, upload_errors=request.upload_errors)
         if form.is_valid():
             form.save()
             messages.success(request, 'Cloth updated')
@@ -190,17 +365,22 @@ def edit_cloth(request, cloth_id):
 
 def get_client_ip(request):
     """Helper function to get client's IP address"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    # X-Forwarded-For is only trusted from STORE_TRUSTED_PROXIES (see store/ratelimit.py)
+    return client_ip(request)
+
+
+def record_rating(rating_value, ip_address):
+    """Store one rating and return the updated stats."""
+    # The post_save signal updates SiteRatingSummary in the same transaction
+    with transaction.atomic():
+        SiteRating.objects.create(rating=rating_value, ip_address=ip_address)
+        return SiteRatingSummary.stats()
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def submit_rating(request):
+@rate_limit('rating', dedupe=lambda request: 'rating')  # one rating per IP per dedupe window
+async def submit_rating(request):
     """Handle site-wide rating submission (1-5 stars)"""
     try:
         rating_value = int(request.POST.get('rating', 0))
@@ -208,21 +388,14 @@ def submit_rating(request):
         if rating_value < 1 or rating_value > 5:
             return JsonResponse({'success': False, 'error': 'Rating must be between 1 and 5'}, status=400)
         
-        # Create rating
-        rating = SiteRating.objects.create(
-            rating=rating_value,
-            ip_address=get_client_ip(request)
-        )
-        
-        # Calculate new average
-        avg_rating = SiteRating.objects.aggregate(Avg('rating'))['rating__avg']
-        total_ratings = SiteRating.objects.count()
+        # transaction.atomic() is sync-only, so the insert and summary update
+        # run together in the ORM thread
+        stats = await sync_to_async(record_rating)(rating_value, get_client_ip(request))
         
         return JsonResponse({
             'success': True,
             'message': 'Thank you for rating our website!',
-            'average_rating': round(avg_rating, 1) if avg_rating else 0,
-            'total_ratings': total_ratings
+            **stats,
         })
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
@@ -230,7 +403,8 @@ def submit_rating(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def submit_review(request):
+@rate_limit('review', dedupe=lambda request: 'review:' + ' '.join(request.POST.get('review_text', '').lower().split()))
+async def submit_review(request):
     """Handle written review submission"""
     try:
         form = SiteReviewForm(request.POST)
@@ -238,7 +412,7 @@ def submit_review(request):
         if form.is_valid():
             review = form.save(commit=False)
             review.ip_address = get_client_ip(request)
-            review.save()
+            await review.asave()
             
             return JsonResponse({
                 'success': True,
@@ -258,7 +432,8 @@ def submit_review(request):
 
 @csrf_exempt  # for testing; later, remove and use proper CSRF handling
 @require_POST
-def send_message(request):
+@rate_limit('message', dedupe=lambda request: 'message:' + ' '.join(request.POST.get('message', '').lower().split()))
+async def send_message(request):
     """Handle contact form submission and send email"""
     if request.method == 'POST':
         try:
@@ -274,6 +449,14 @@ def send_message(request):
                     'success': False,
                     'error': 'Name, email, and message are required.'
                 }, status=400)
+
+            # Both end up in headers (Subject, Reply-To); a line break there
+            # would only fail later, in send_outbox
+            if any(c in value for value in (name, email) for c in '\r\n'):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Name and email must be on a single line.'
+                }, status=400)
             
             # Compose email
             subject = f'Contact Form Message from {name}'
@@ -291,13 +474,21 @@ Message:
 Sent from Kush Women's Fashion Store website
             """
             
-            # Send email
-            send_mail(
+            # Replies go straight to the customer, if the address is usable
+            try:
+                validate_email(email)
+                reply_to = [email]
+            except ValidationError:
+                reply_to = []
+
+            # Queued for manage.py send_outbox, so the mail server's speed
+            # (or outage) never shows up in this request
+            await aenqueue(
                 subject=subject,
-                message=email_message,
+                body=email_message,
+                to=[settings.EMAIL_HOST_USER],  # Send to yourself
                 from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[settings.EMAIL_HOST_USER],  # Send to yourself
-                fail_silently=False,
+                reply_to=reply_to,
             )
             
             return JsonResponse({
@@ -0,0 +1,164 @@
+"""
+Cache warming after a deploy or restart.
+
+``manage.py warm_cache`` requests the pages first visitors are most likely
+to hit: the landing page, the about page, every category page, the first
+rail fragment each landing-page category loads on scroll, and the most
+liked cloth pages. Rendering each one once compiles its templates into the
+cached template loader, fills the page and fragment caches, and pulls the
+rows it reads into SQLite's page cache and the OS file cache. It also opens
+the database connections those requests will reuse (``CONN_MAX_AGE``).
+Image derivatives need no warming: they are files written when the image
+is uploaded or imported (store/images.py), and the pages only link to them.
+
+All of that lives in the process that served the request. With ``--url``
+the pages are fetched over HTTP from the running site, so the server's own
+workers do the warming. That is the mode to run from a deploy script. In
+the default in-process mode the page and fragment caches still reach the
+site, because the configured cache is shared (file-based by default); the
+compiled templates and open connections do not. ``LocMemCache`` is private
+to the process, so with it only ``--url`` does anything useful.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.test import Client
+from django.urls import reverse
+
+from .models import Category, Cloth
+from .views import RAIL_SIZE
+
+DEFAULT_PARALLEL = 4
+DEFAULT_TOP_CLOTHES = 20
+DEFAULT_TIMEOUT = 30
+
+# Must be in ALLOWED_HOSTS
+WARM_HOST = 'localhost'
+
+
+def warm_paths(top_clothes=DEFAULT_TOP_CLOTHES):
+    """URL paths to request, the most visited first."""
+    paths = [reverse('landing_page'), reverse('about')]
+    paths += [
+        reverse('category_detail', args=[slug])
+        for slug in Category.objects.order_by('name').values_list('slug', flat=True)
+    ]
+    # The landing page's rails end at their RAIL_SIZE-th cloth; scrolling one
+    # asks for the items after it (category_items)
+    rail_ends = (
+        Cloth.objects.annotate(position=Window(RowNumber(), partition_by='category', order_by='id'))
+        .filter(position=RAIL_SIZE, category__isnull=False)
+        .order_by('category__name')
+        .values_list('category__slug', 'id')
+    )
+    paths += [f"{reverse('category_items', args=[slug])}?after={pk}" for slug, pk in rail_ends]
+    paths += [
+        reverse('cloth_detail', args=[pk])
+        for pk in Cloth.objects.order_by('-likes', '-id').values_list('id', flat=True)[:top_clothes]
+    ]
+    return paths
+
+
+def open_databases():
+    """Connect every database alias and read its schema; returns {alias: seconds}."""
+    timings = {}
+    for alias in connections:
+        start = time.perf_counter()
+        connection = connections[alias]
+        connection.ensure_connection()
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT count(*) FROM sqlite_master')
+        timings[alias] = time.perf_counter() - start
+    return timings
+
+
+def compile_templates(app_labels=('store',)):
+    """
+    Load every template of `app_labels` and the project's DIRS through the
+    configured engines, so the cached loader holds them compiled. Returns
+    (templates loaded, seconds).
+    """
+    start = time.perf_counter()
+    directories = [os.path.join(apps.get_app_config(label).path, 'templates') for label in app_labels]
+    loaded = 0
+    for engine in engines.all():
+        for directory in [*engine.dirs, *directories]:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith(('.html', '.txt', '.xml')):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        engine.get_template(name)
+                    except (TemplateDoesNotExist, TemplateSyntaxError):
+                        continue
+                    loaded += 1
+    return loaded, time.perf_counter() - start
+
+
+def fetch_in_process(path, timeout=DEFAULT_TIMEOUT):
+    """GET `path` through the Django test client, as an anonymous visitor; returns (status, bytes)."""
+    response = Client(HTTP_HOST=WARM_HOST).get(path)
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return response.status_code, len(body)
+
+
+def http_fetcher(base_url):
+    """A fetch function that GETs paths from the running site at `base_url`."""
+    base_url = base_url.rstrip('/')
+
+    def fetch(path, timeout=DEFAULT_TIMEOUT):
+        request = Request(base_url + path, headers={'Accept-Encoding': 'gzip', 'User-Agent': 'kush-warm-cache'})
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                return response.status, len(response.read())
+        except HTTPError as e:
+            return e.code, 0
+    return fetch
+
+
+def warm(paths, fetch=fetch_in_process, parallel=DEFAULT_PARALLEL, timeout=DEFAULT_TIMEOUT, progress=None):
+    """
+    Fetch `paths` with up to `parallel` requests in flight.
+
+    Returns one ``{'path', 'status', 'ms', 'bytes', 'error'}`` dict per path,
+    in the order of `paths`.
+    """
+    main_thread = threading.current_thread()
+
+    def visit(path):
+        start = time.perf_counter()
+        result = {'path': path, 'status': None, 'bytes': 0, 'error': ''}
+        try:
+            result['status'], result['bytes'] = fetch(path, timeout=timeout)
+        except Exception as e:  # one broken page should not stop the rest
+            result['error'] = f'{type(e).__name__}: {e}'
+        result['ms'] = round((time.perf_counter() - start) * 1000, 3)
+        if threading.current_thread() is not main_thread:
+            # Worker threads do not outlive the pool; neither should their connections
+            connections.close_all()
+        if progress:
+            progress(result)
+        return result
+
+    if parallel <= 1:
+        return [visit(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        return list(pool.map(visit, paths))
+
+
+def cache_is_shared(alias='default'):
+    """Whether the cache outlives this process (not the local-memory or dummy backend)."""
+    backend = type(caches[alias]).__module__
+    return not backend.endswith(('locmem', 'dummy'))